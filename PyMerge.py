@@ -26,22 +26,18 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 This is the entry point for the PyMerge program. Command line arguments will be passed
 to this file and the functions in this file will invoke the GUI. There will be no merge/compare/GUI
 algorithms in this file. It will only call the main GUI and application functions.
+Scripts that only need the diff engine should use pymerge_core, which never imports PyQt5.
 
 """
 
 import sys
-import dependency_chk
 
-dependency_chk.check()
-
-import main_window
 import utilities
 
 
 class PyMergeCLI(object):
     def __init__(self, *args):
         self.options: list = self.sanitize(args[0][1:])
-        self.file_size_lim: int = 20000  # 2KB limit until interface for C implementation of LCS is done
         self.cli()
 
     def cli(self):
@@ -56,6 +52,14 @@ class PyMergeCLI(object):
         if opt_length == 0:
             self.invoke_application(left_file, right_file)
             return
+        elif self.options[0] == "--batch":
+            sys.exit(self.batch_func(self.options[1:]))
+        elif self.options[0] in ("--unified", "--json"):
+            sys.exit(self.diff_output_func(self.options))
+        elif self.options[0] in ("--brief", "--quiet"):
+            sys.exit(self.quick_compare_func(self.options))
+        elif self.options[0] == "--patch":
+            sys.exit(self.patch_func(self.options[1:]))
         elif opt_length == 1:
             if self.options[0] == "--help":
                 self.help_func()
@@ -92,10 +96,195 @@ PyMerge
 ------------------------------------------------------------
     --file: File to compare.\n\tUsage: '[--file] <left_file> <right_file>'
     --help: Show command line options.\n\tUsage: '[--help]'
+    --unified: Print a unified diff of two files, with <lines> of context (default 3).
+        \n\tUsage: '[--unified] [--context <lines>] <left_file> <right_file>'
+    --json: Print the hunks of the diff of two files as JSON.\n\tUsage: '[--json] <left_file> <right_file>'
+    --brief: Only report whether two files differ, without diffing them. --quiet prints nothing, see the exit code.
+        \n\tUsage: '[--brief|--quiet] [--ignore-eol] <left_file> <right_file>'
+    --patch: Apply a unified diff, or one on stdin, to a file. Nothing is written unless every hunk applies.
+        \n\tUsage: '[--patch] <file> [<patch_file>] [--output <file>] [--window <lines>] [--dry-run]'
+    --batch: Diff the pairs of files in a manifest, or on stdin, without a display. One JSON line is printed per
+        pair.\n\tUsage: '[--batch] [<manifest>] [--workers <count>] [--engine <auto|myers|cython>]'
     --about: Link to the PyMerge project README. \n\n
             """
         )
 
+    @staticmethod
+    def batch_func(options: list) -> int:
+        """
+        Headless batch diff, see batch_diff.
+        :param options: options after --batch
+        :return: batch_diff exit code
+        """
+        # Only the Qt free core is imported, so this works without a display
+        import batch_diff
+        import longest_common_subseq
+
+        manifest: str = "-"
+        workers = None
+        engine: str = "auto"
+        n = 0
+        while n < len(options):
+            if options[n] in ("--workers", "--engine") and n + 1 < len(options):
+                if options[n] == "--workers":
+                    workers = PyMergeCLI.parse_count(options[n], options[n + 1], 1)
+                    if workers is None:
+                        return batch_diff.EXIT_ERROR
+                else:
+                    engine = options[n + 1]
+                n += 2
+            else:
+                manifest = options[n]
+                n += 1
+
+        try:
+            longest_common_subseq.check_engine(engine)
+            if manifest == "-":
+                pairs = batch_diff.read_manifest(sys.stdin)
+            else:
+                with open(manifest, "r") as manifest_file:
+                    pairs = batch_diff.read_manifest(manifest_file)
+        except (OSError, ValueError) as ex:
+            print(f"Error: {ex}", file=sys.stderr)
+            return batch_diff.EXIT_ERROR
+        return batch_diff.run_batch(pairs, sys.stdout, workers, engine)
+
+    @staticmethod
+    def parse_count(option: str, value: str, minimum: int):
+        """
+        Parses the number given to a numeric option, printing an error if it isn't one.
+        :param option: name of the option, for the error message
+        :param value: text given for the option
+        :param minimum: smallest number allowed
+        :return: the number, or None if value isn't a whole number of at least minimum
+        """
+        try:
+            count = int(value)
+        except ValueError:
+            count = None
+        if count is None or count < minimum:
+            print(f"Error: {option} needs a whole number of at least {minimum}, not '{value}'", file=sys.stderr)
+            return None
+        return count
+
+    @staticmethod
+    def diff_output_func(options: list) -> int:
+        """
+        Prints the diff of two files as a unified diff or JSON, see diff_writer.
+        :param options: options starting with --unified or --json
+        :return: 0 if the files are identical, 1 if they differ, 2 if they couldn't be diffed
+        """
+        # Only the Qt free core is imported, so this works without a display
+        import diff_writer
+        import pymerge_core
+        import pymerge_enums
+
+        context: int = diff_writer.DEFAULT_CONTEXT
+        files: list = []
+        n = 1
+        while n < len(options):
+            if options[n] == "--context" and n + 1 < len(options):
+                context = PyMergeCLI.parse_count(options[n], options[n + 1], 0)
+                if context is None:
+                    return 2
+                n += 2
+            else:
+                files.append(options[n])
+                n += 1
+        if len(files) != 2:
+            print("Error: 2 files required for comparison.", file=sys.stderr)
+            return 2
+
+        diff_result = pymerge_core.diff(files[0], files[1], check_types=False)
+        if diff_result.result != pymerge_enums.RESULT.GOOD:
+            print(f"Error: {diff_result.error or diff_result.result.name}", file=sys.stderr)
+            return 2
+
+        if options[0] == "--unified":
+            diff_writer.write_chunks(diff_writer.unified_diff(diff_result, context), sys.stdout)
+        else:
+            diff_writer.write_chunks(diff_writer.json_hunks(diff_result), sys.stdout)
+        return 0 if diff_result.identical else 1
+
+    @staticmethod
+    def quick_compare_func(options: list) -> int:
+        """
+        Checks whether two files are identical, see quick_compare.
+        :param options: options starting with --brief or --quiet
+        :return: 0 if the files are identical, 1 if they differ, 2 if they couldn't be read
+        """
+        import quick_compare
+
+        files: list = [option for option in options[1:] if option != "--ignore-eol"]
+        if len(files) != 2:
+            print("Error: 2 files required for comparison.", file=sys.stderr)
+            return quick_compare.Status.ERROR.value
+
+        status = quick_compare.compare(files[0], files[1], "--ignore-eol" in options)
+        if status == quick_compare.Status.ERROR:
+            print(f"Error: {files[0]} or {files[1]} can't be read", file=sys.stderr)
+        elif status == quick_compare.Status.DIFFERENT and options[0] == "--brief":
+            print(f"Files {files[0]} and {files[1]} differ")
+        return status.value
+
+    @staticmethod
+    def patch_func(options: list) -> int:
+        """
+        Applies a patch to a file, see patch_apply.
+        :param options: options after --patch
+        :return: 0 if the patch was applied, 1 if any hunk failed, 2 if it couldn't be applied
+        """
+        # Only the Qt free core is imported, so this works without a display
+        import patch_apply
+
+        files: list = []
+        output = None
+        window: int = patch_apply.WINDOW
+        dry_run: bool = False
+        n = 0
+        while n < len(options):
+            if options[n] in ("--output", "--window") and n + 1 < len(options):
+                if options[n] == "--output":
+                    output = options[n + 1]
+                else:
+                    window = PyMergeCLI.parse_count(options[n], options[n + 1], 0)
+                    if window is None:
+                        return 2
+                n += 2
+            else:
+                if options[n] == "--dry-run":
+                    dry_run = True
+                else:
+                    files.append(options[n])
+                n += 1
+        if len(files) not in (1, 2):
+            print("Error: a file and a patch are required.", file=sys.stderr)
+            return 2
+
+        try:
+            if len(files) == 1 or files[1] == "-":
+                result = patch_apply.apply_patch(files[0], sys.stdin.buffer, output, window, dry_run)
+            else:
+                with open(files[1], "rb") as patch_file:
+                    result = patch_apply.apply_patch(files[0], patch_file, output, window, dry_run)
+        except OSError as ex:
+            print(f"Error: {ex}", file=sys.stderr)
+            return 2
+
+        for n, offset in enumerate(result.offsets):
+            if offset is None:
+                print(f"Hunk #{n + 1} FAILED")
+            elif offset != 0:
+                print(f"Hunk #{n + 1} succeeded at offset {offset} lines")
+        if result.status == patch_apply.Status.APPLIED:
+            return 0
+        elif result.status == patch_apply.Status.HUNK_FAILED:
+            print(f"Error: {len(result.failed)} of {result.hunks} hunks failed, {files[0]} was not changed",
+                  file=sys.stderr)
+            return 1
+        print(f"Error: {result.error or result.status.name}", file=sys.stderr)
+        return 2
+
     @staticmethod
     def about_func():
         print(
@@ -136,6 +325,12 @@ PyMerge
     def invoke_application(self, file1: str, file2: str):
         """Invoke the main application here"""
 
+        # The dependency check and the GUI are only loaded once there is a window to show, so command line
+        # options that don't need them start quickly
+        import dependency_chk
+        dependency_chk.check()
+        import main_window
+
         if file1 != "" or file2 != "":
             if self.validate_files(file1, file2, path_check=False):
                 main_window.start_main(file1, file2)
@@ -144,12 +339,11 @@ PyMerge
         print(file1, file2)
 
     def validate_files(self, file1, file2, path_check=False):
-        size_valid = utilities.validate_file_size(file2, self.file_size_lim) and \
-                     utilities.validate_file_size(file2, self.file_size_lim)
+        # There is no size limit, large files are loaded progressively like files opened from the GUI
         ext_valid = utilities.valid_file_ext(file1) and utilities.valid_file_ext(file2)
         paths_valid = utilities.check_paths(file1, file2) if path_check else True
 
-        if size_valid and ext_valid and paths_valid:
+        if ext_valid and paths_valid:
             return True
 
 
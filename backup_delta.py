@@ -0,0 +1,121 @@
+"""
+###########################################################################
+File: backup_delta.py
+Author:
+Description: Line based deltas between two versions of a file, for storing backups.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+A delta rebuilds one version of a file, the target, from another, the base. It is a list of operations:
+    [start, count]  copy count lines of the base, starting at line start
+    "text"          insert lines that aren't in the base
+The lines are matched with the same LCS used for the diff, longest_common_subseq.longest_common_subsequence2,
+after the lines shared at the start and end of both versions are taken off. Lines keep their line endings
+and are compared as bytes, so the target is rebuilt byte for byte. Inserted text is stored as latin-1, which
+maps every byte to a character, so a delta can be saved as JSON.
+
+The LCS takes time in proportion to the number of differing lines, so it gives up after max_edits of
+them and the caller keeps a full copy instead.
+"""
+
+import longest_common_subseq
+
+
+def split_lines(data: bytes) -> list:
+    return data.splitlines(keepends=True)
+
+
+def match_lines(target_lines: list, base_lines: list, max_edits=None) -> list or None:
+    """
+    Gets the lines of the target that are also in the base.
+    :param target_lines: lines of the version the delta rebuilds
+    :param base_lines: lines of the version the delta is applied to
+    :param max_edits: most lines that may differ between the versions, None for no limit
+    :return: list of (target line, base line) pairs in order, or None if too many lines differ
+    """
+    limit = min(len(target_lines), len(base_lines))
+    prefix = 0
+    while prefix < limit and target_lines[prefix] == base_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and target_lines[-1 - suffix] == base_lines[-1 - suffix]:
+        suffix += 1
+
+    matches = [(n, n) for n in range(prefix)]
+    target_mid = target_lines[prefix:len(target_lines) - suffix]
+    base_mid = base_lines[prefix:len(base_lines) - suffix]
+    if len(target_mid) > 0 and len(base_mid) > 0:
+        raw_matches = longest_common_subseq.longest_common_subsequence2(target_mid, base_mid, max_edits)
+        if raw_matches is None:
+            return None
+        matches.extend((target_idx + prefix, base_idx + prefix) for target_idx, base_idx in zip(*raw_matches))
+    matches.extend(
+        (len(target_lines) - suffix + n, len(base_lines) - suffix + n) for n in range(suffix)
+    )
+    return matches
+
+
+def make_delta(target: bytes, base: bytes, max_edits=None) -> list or None:
+    """
+    Gets the operations that rebuild the target from the base.
+    :param target: contents of the version the delta rebuilds
+    :param base: contents of the version the delta is applied to
+    :param max_edits: most lines that may differ between the versions, None for no limit
+    :return: list of operations, or None if too many lines differ
+    """
+    target_lines = split_lines(target)
+    matches = match_lines(target_lines, split_lines(base), max_edits)
+    if matches is None:
+        return None
+
+    ops: list = []
+    target_pos = 0
+    for target_idx, base_idx in matches:
+        if target_idx > target_pos:
+            ops.append(b"".join(target_lines[target_pos:target_idx]).decode("latin-1"))
+
+        # Extend the last copy if this line follows straight on from it
+        if target_idx == target_pos and len(ops) > 0 and isinstance(ops[-1], list) \
+                and ops[-1][0] + ops[-1][1] == base_idx:
+            ops[-1][1] += 1
+        else:
+            ops.append([base_idx, 1])
+        target_pos = target_idx + 1
+
+    if target_pos < len(target_lines):
+        ops.append(b"".join(target_lines[target_pos:]).decode("latin-1"))
+    return ops
+
+
+def apply_delta(ops: list, base: bytes) -> bytes:
+    """
+    Rebuild the target of a delta.
+    :param ops: operations returned by make_delta
+    :param base: contents of the version the delta was made against
+    :return: contents of the target
+    """
+    base_lines = split_lines(base)
+    parts: list = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op.encode("latin-1"))
+        else:
+            parts.extend(base_lines[op[0]:op[0] + op[1]])
+    return b"".join(parts)
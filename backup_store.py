@@ -0,0 +1,542 @@
+"""
+###########################################################################
+File: backup_store.py
+Author:
+Description: Content addressed store for file backups.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+Every backed up version of a file is stored once, compressed, under the digest of its contents:
+    <root>/objects/<first two digest characters>/<digest>.gz
+An index file of JSON lines records each backup as the absolute path of the file, the time of the
+backup, the digest of the contents and the codec it was compressed with, so any number of files and
+versions share the same objects.
+
+A file whose size and modification time match its last backup isn't read at all. Otherwise it is
+hashed and compressed in a single pass into a temporary object, which is thrown away if an object
+with the same digest already exists, and no index entry is added if the digest matches the last backup.
+Entries also record the size of the object on disk, so prune can apply retention policies from the
+index alone.
+
+With delta set, the newest version of a file is kept whole and the version before it is rewritten as a
+reverse delta against it, see backup_delta:
+    <root>/objects/<first two digest characters>/<digest>.delta.gz
+holding the digest of the base object and the operations that rebuild this object from it. The index
+gets a record of the delta and its base as well, so prune knows which objects others depend on. An object
+is read by following bases until a whole object is found and applying the deltas on the way back, so
+every keyframe_interval'th version of a file is left whole to keep those chains short. Bases are always
+objects that were new when the delta was made, so chains can't loop. An old version is left whole if
+more than max_edits lines changed or if the delta doesn't come out smaller.
+
+Objects are written with any of file_backup.CODECS at the given level, and "auto" picks between "stored"
+and "deflate" with file_backup.Backup.choose_codec. "stored" and "deflate" objects are gzip files (level 0
+for stored), "bzip2" objects are .bz2 files and "lzma" objects are .xz files, so an object is read by its
+extension and objects written with different codecs can sit in the same store. An object that is already
+in the store is kept as it is, whatever codec the new backup asked for. Deltas are always gzip.
+"""
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import backup_delta
+import file_backup
+
+OBJECTS_DIR = "objects"
+INDEX_FILE = "index.jsonl"
+OBJECT_EXT = ".gz"
+DELTA_EXT = ".delta.gz"
+CODEC_EXTS = {"stored": ".gz", "deflate": ".gz", "bzip2": ".bz2", "lzma": ".xz"}  # Object file of each codec
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+CODECS = tuple(CODEC_EXTS) + (file_backup.AUTO_CODEC,)
+
+
+class BackupStore(object):
+    INDEX_LOCK = threading.Lock()  # Backups of both files of a merge can run at the same time
+    DELTA_LOCK = threading.Lock()  # Only one backup rewrites objects as deltas at a time
+
+    def __init__(self, root: str, hash_type="BLAKE2B", block_size=65535, delta=False, keyframe_interval=10,
+                 max_edits=1000, codec="auto", level=6):
+        """
+        Initialize the BackupStore class
+        :param root: directory holding the objects and the index
+        :param hash_type: type of hash function used to address objects, see file_backup.Backup.get_hash_func
+        :param block_size: size of block to read from files at a time
+        :param delta: store older versions of a file as deltas against the version after them
+        :param keyframe_interval: every this many versions of a file are left whole
+        :param max_edits: most changed lines a delta is worked out for
+        :param codec: one of CODECS
+        :param level: compression level, 1-9, used as the preset for lzma
+        :raises ValueError: if the codec or level isn't known
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Backup codec must be one of {', '.join(CODECS)}, not {codec}")
+        if not 1 <= level <= 9:
+            raise ValueError(f"Backup compression level must be 1-9, not {level}")
+        self.root: str = root
+        self.hash_type: str = hash_type
+        self.hash_func = file_backup.Backup.get_hash_func(hash_type)
+        self.block_size: int = block_size
+        self.delta: bool = delta
+        self.keyframe_interval: int = keyframe_interval
+        self.max_edits: int = max_edits
+        self.codec: str = codec
+        self.level: int = level
+
+    def compressor(self, fileobj, codec: str):
+        """
+        Opens a compressed stream to write an object with.
+        :param fileobj: binary file object to write the compressed data to
+        :param codec: codec in CODEC_EXTS
+        :return: binary file object
+        """
+        if codec == "bzip2":
+            return bz2.BZ2File(fileobj, "wb", compresslevel=self.level)
+        if codec == "lzma":
+            return lzma.LZMAFile(fileobj, "wb", preset=self.level)
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=0 if codec == "stored" else self.level)
+
+    @staticmethod
+    def open_object(path: str):
+        # Whole objects are read by their extension, see CODEC_EXTS
+        return OPENERS[os.path.splitext(path)[1]](path, "rb")
+
+    def index_path(self) -> str:
+        return os.path.join(self.root, INDEX_FILE)
+
+    def object_path(self, digest: str, ext: str = None) -> str:
+        """
+        Gets the file of a whole object.
+        :param digest: digest of the object
+        :param ext: extension of the object file, by default the extension the object is stored with
+        :return: path of the object file, with OBJECT_EXT if no extension was given and there is no such object
+        """
+        path = os.path.join(self.root, OBJECTS_DIR, digest[:2], digest)
+        if ext is None:
+            for ext in OPENERS:
+                if os.path.exists(path + ext):
+                    return path + ext
+            ext = OBJECT_EXT
+        return path + ext
+
+    def delta_path(self, digest: str) -> str:
+        return os.path.join(self.root, OBJECTS_DIR, digest[:2], digest + DELTA_EXT)
+
+    def has_object(self, digest: str) -> bool:
+        return os.path.exists(self.object_path(digest)) or os.path.exists(self.delta_path(digest))
+
+    def read_index(self) -> list:
+        """
+        Gets every record in the index, oldest first: backup entries and delta records.
+        :return: list of record dictionaries
+        """
+        if not os.path.exists(self.index_path()):
+            return []
+
+        records: list = []
+        with open(self.index_path(), "r") as index:
+            for line in index:
+                if line.strip() != "":
+                    records.append(json.loads(line))
+        return records
+
+    def append_index(self, record: dict):
+        with self.INDEX_LOCK:
+            with open(self.index_path(), "a") as index:
+                index.write(json.dumps(record) + "\n")
+
+    def write_index(self, records: list):
+        """
+        Replaces the index with a temporary file, so it is never left half written. The caller holds INDEX_LOCK.
+        :param records: every record of the new index, oldest first
+        :return: No return value
+        """
+        fd, temp_name = tempfile.mkstemp(suffix=".tmp", dir=self.root)
+        try:
+            with open(fd, "w") as index:
+                index.writelines(json.dumps(record) + "\n" for record in records)
+            os.replace(temp_name, self.index_path())
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+    def update_stat(self, path: str, digest: str, file_stat: os.stat_result):
+        """
+        Records the size and modification time of a file whose contents match its last backup, so the next
+        backup can skip reading it.
+        :param path: absolute path of the file
+        :param digest: digest of the file contents
+        :param file_stat: os.stat of the file
+        :return: No return value
+        """
+        with self.INDEX_LOCK:
+            records = self.read_index()
+            for record in reversed(records):
+                if record.get("path") == path:
+                    if record["digest"] == digest:
+                        record["size"] = file_stat.st_size
+                        record["mtime_ns"] = file_stat.st_mtime_ns
+                        self.write_index(records)
+                    return
+
+    def entries(self, path: str = None) -> list:
+        """
+        Gets the backups recorded in the index, oldest first.
+        :param path: only get the backups of this file
+        :return: list of index entry dictionaries
+        """
+        abs_path = None if path is None else os.path.abspath(path)
+        return [
+            record for record in self.read_index()
+            if "path" in record and (abs_path is None or record["path"] == abs_path)
+        ]
+
+    def delta_bases(self) -> dict:
+        """
+        Gets the base of every object the index records as stored as a delta.
+        :return: dictionary of digest to base digest
+        """
+        return {record["delta"]: record["base"] for record in self.read_index() if "delta" in record}
+
+    def latest(self, path: str) -> dict or None:
+        """
+        Gets the last backup of a file.
+        :param path: file to look up
+        :return: index entry dictionary or None if the file has never been backed up
+        """
+        entries = self.entries(path)
+        if len(entries) == 0:
+            return None
+        return entries[-1]
+
+    def backup(self, file: str) -> str:
+        """
+        Back up a file, unless its last backup already has the same contents.
+        :param file: file to back up
+        :return: digest of the file contents
+        """
+        abs_path = os.path.abspath(file)
+        file_stat = os.stat(file)
+        entries = self.entries(abs_path)
+        last = entries[-1] if len(entries) > 0 else None
+
+        # Nothing has touched the file since its last backup
+        if last is not None and last["size"] == file_stat.st_size and last["mtime_ns"] == file_stat.st_mtime_ns \
+                and self.has_object(last["digest"]):
+            return last["digest"]
+
+        digest, is_new, codec = self.store_object(file)
+        if last is not None and last["digest"] == digest:
+            # Rewritten with the same contents, such as a save that changed nothing
+            if last["size"] != file_stat.st_size or last["mtime_ns"] != file_stat.st_mtime_ns:
+                self.update_stat(abs_path, digest, file_stat)
+            return digest
+
+        if not is_new:
+            # The object kept is the one an earlier backup stored
+            codec = next((entry.get("codec", codec) for entry in reversed(self.entries()) if entry["digest"] == digest),
+                         codec)
+
+        # The last version becomes a delta against this one, unless it is a keyframe
+        if self.delta and is_new and last is not None and (len(entries) - 1) % self.keyframe_interval != 0:
+            self.store_delta(last["digest"], digest)
+
+        entry = {
+            "path": abs_path,
+            "time": time.time(),
+            "digest": digest,
+            "hash_type": self.hash_type,
+            "codec": codec,
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "stored_size": self.stored_size(digest),
+        }
+        self.append_index(entry)
+        return digest
+
+    def store_object(self, file: str) -> (str, bool, str):
+        """
+        Hash and compress a file in a single pass, and keep the result if no object has the same digest.
+        :param file: file to store
+        :return: digest of the file contents, whether the object is new and the codec it was compressed with
+        """
+        objects_dir = os.path.join(self.root, OBJECTS_DIR)
+        os.makedirs(objects_dir, exist_ok=True)
+        codec = file_backup.Backup.choose_codec(file, self.codec)
+        fd, temp_name = tempfile.mkstemp(suffix=CODEC_EXTS[codec], dir=objects_dir)
+        hash_obj = self.hash_func()
+        try:
+            with open(file, "rb") as src, open(fd, "wb") as temp, self.compressor(temp, codec) as dst:
+                file_buf = src.read(self.block_size)
+                while len(file_buf) > 0:
+                    hash_obj.update(file_buf)
+                    dst.write(file_buf)
+                    file_buf = src.read(self.block_size)
+
+            digest = hash_obj.hexdigest()
+            is_new = not self.has_object(digest)
+            if is_new:
+                object_path = self.object_path(digest, CODEC_EXTS[codec])
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                os.replace(temp_name, object_path)
+            else:
+                os.remove(temp_name)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+        return digest, is_new, codec
+
+    def store_delta(self, digest: str, base_digest: str) -> bool:
+        """
+        Replace a whole object with a delta against another object, if the delta is smaller.
+        :param digest: digest of the object to replace
+        :param base_digest: digest of the object the delta is applied to
+        :return: True if the object was replaced
+        """
+        with self.DELTA_LOCK:
+            object_path = self.object_path(digest)
+            if not os.path.exists(object_path):
+                return False
+
+            with self.open_object(object_path) as src:
+                target = src.read()
+            ops = backup_delta.make_delta(target, self.read_object(base_digest), self.max_edits)
+            if ops is None:
+                return False
+
+            fd, temp_name = tempfile.mkstemp(suffix=DELTA_EXT, dir=os.path.dirname(object_path))
+            try:
+                with open(fd, "wb") as temp, gzip.GzipFile(fileobj=temp, mode="wb", compresslevel=self.level) as dst:
+                    dst.write(json.dumps({"base": base_digest, "ops": ops}).encode("utf-8"))
+                if os.path.getsize(temp_name) >= os.path.getsize(object_path):
+                    os.remove(temp_name)
+                    return False
+
+                # The delta is in place before the whole object goes, so readers always find one of them
+                os.replace(temp_name, self.delta_path(digest))
+            except BaseException:
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+                raise
+            os.remove(object_path)
+            self.append_index({"delta": digest, "base": base_digest, "stored_size": self.stored_size(digest)})
+        return True
+
+    def stored_size(self, digest: str) -> int:
+        """
+        Gets the size of an object on disk, whole or as a delta.
+        :param digest: digest of the object
+        :return: size in bytes, 0 if there is no such object
+        """
+        for path in (self.delta_path(digest), self.object_path(digest)):
+            try:
+                return os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return 0
+
+    def prune(self, keep_last: int = None, max_age_days: float = None, max_size: int = None, now: float = None) -> list:
+        """
+        Removes backups by the retention policies given, working from the index alone. Objects no remaining
+        backup needs, directly or as the base of a delta, are deleted. Mustn't run while backups are being
+        made to the same store.
+        :param keep_last: keep this many of the newest backups of each file
+        :param max_age_days: keep backups made within this many days
+        :param max_size: keep the newest backups whose objects, bases included, fit in this many bytes
+        :param now: time to measure ages from, defaults to the current time
+        :return: list of removed index entries
+        """
+        with self.DELTA_LOCK, self.INDEX_LOCK:
+            records = self.read_index()
+            entries = [record for record in records if "path" in record]
+            bases: dict = {}
+            sizes: dict = {}
+            for record in records:
+                if "delta" in record:
+                    bases[record["delta"]] = record["base"]
+                    sizes[record["delta"]] = record.get("stored_size")
+                else:
+                    sizes.setdefault(record["digest"], record.get("stored_size"))
+
+            def needs(digest: str):
+                # An object and the chain of bases it is rebuilt from
+                while digest is not None:
+                    yield digest
+                    digest = bases.get(digest)
+
+            keep = [True] * len(entries)
+            if keep_last is not None:
+                counts: dict = {}
+                for idx in range(len(entries) - 1, -1, -1):
+                    counts[entries[idx]["path"]] = counts.get(entries[idx]["path"], 0) + 1
+                    keep[idx] = counts[entries[idx]["path"]] <= keep_last
+            if max_age_days is not None:
+                cutoff = (time.time() if now is None else now) - max_age_days * 24 * 60 * 60
+                for idx, entry in enumerate(entries):
+                    keep[idx] = keep[idx] and entry["time"] >= cutoff
+            if max_size is not None:
+                # Objects shared between backups are only counted once
+                total = 0
+                counted: set = set()
+                for idx in range(len(entries) - 1, -1, -1):
+                    if not keep[idx]:
+                        continue
+                    chain = [digest for digest in needs(entries[idx]["digest"]) if digest not in counted]
+                    chain_size = 0
+                    for digest in chain:
+                        if sizes.get(digest) is None:
+                            sizes[digest] = self.stored_size(digest)
+                        chain_size += sizes[digest]
+                    if total + chain_size > max_size:
+                        keep[:idx + 1] = [False] * (idx + 1)
+                        break
+                    total += chain_size
+                    counted.update(chain)
+
+            needed: set = set()
+            for idx, entry in enumerate(entries):
+                if keep[idx]:
+                    needed.update(needs(entry["digest"]))
+            unneeded: set = set()
+            for entry in entries:
+                unneeded.update(digest for digest in needs(entry["digest"]) if digest not in needed)
+
+            # The index is rewritten before any objects go, so it never points at a missing object
+            kept_records: list = []
+            entry_idx = 0
+            for record in records:
+                if "path" in record:
+                    if keep[entry_idx]:
+                        kept_records.append(record)
+                    entry_idx += 1
+                elif record["delta"] in needed:
+                    kept_records.append(record)
+            self.write_index(kept_records)
+
+            for digest in unneeded:
+                for path in (self.object_path(digest), self.delta_path(digest)):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return [entry for idx, entry in enumerate(entries) if not keep[idx]]
+
+    def read_object(self, digest: str) -> bytes:
+        """
+        Gets the contents of an object, rebuilding it from deltas if it isn't stored whole.
+        :param digest: digest of the object
+        :return: contents of the object
+        """
+        deltas: list = []
+        while True:
+            try:
+                with self.open_object(self.object_path(digest)) as src:
+                    contents = src.read()
+                break
+            except FileNotFoundError:
+                with gzip.open(self.delta_path(digest), "rb") as src:
+                    delta = json.loads(src.read().decode("utf-8"))
+                deltas.append(delta["ops"])
+                digest = delta["base"]
+
+        for ops in reversed(deltas):
+            contents = backup_delta.apply_delta(ops, contents)
+        return contents
+
+    def restore(self, digest: str, dest: str) -> bool:
+        """
+        Write the contents of an object to a file, checking the digest as it is decompressed. The contents go
+        to a temporary file next to the destination, which replaces the destination only if the digest matches.
+        :param digest: digest of the object to restore
+        :param dest: file to write
+        :return: True if the contents matched the digest, the destination is left untouched if they didn't
+        """
+        parent_dir = os.path.dirname(os.path.abspath(dest))
+        os.makedirs(parent_dir, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(suffix=".tmp", dir=parent_dir)
+        try:
+            with open(fd, "wb") as dst:
+                matched = self.stream_object(digest, dst)
+            if matched:
+                if os.path.exists(dest):
+                    shutil.copymode(dest, temp_name)
+                os.replace(temp_name, dest)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+        return matched
+
+    def verify(self, digest: str) -> bool:
+        """
+        Checks an object against its digest without writing anything to disk.
+        :param digest: digest of the object to check
+        :return: True if the object exists and its contents match the digest
+        """
+        try:
+            return self.stream_object(digest)
+        except (OSError, EOFError, ValueError, KeyError, zlib.error, lzma.LZMAError):
+            return False
+
+    def verify_all(self, workers=4) -> list:
+        """
+        Checks every object in the index. Hashing and decompression release the GIL, so objects are
+        checked on a thread pool.
+        :param workers: number of objects to check at a time
+        :return: list of digests that are missing or don't match their contents
+        """
+        digests = list(dict.fromkeys(entry["digest"] for entry in self.entries()))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(self.verify, digests))
+        return [digest for digest, matched in zip(digests, results) if not matched]
+
+    def stream_object(self, digest: str, dst=None) -> bool:
+        """
+        Reads the contents of an object through the hash function.
+        :param digest: digest of the object
+        :param dst: binary file object to copy the contents to, or None to only check them
+        :return: True if the contents matched the digest
+        """
+        hash_obj = self.hash_func()
+        try:
+            src = self.open_object(self.object_path(digest))
+        except FileNotFoundError:
+            # Objects stored as deltas are rebuilt in memory
+            contents = self.read_object(digest)
+            hash_obj.update(contents)
+            if dst is not None:
+                dst.write(contents)
+            return hash_obj.hexdigest() == digest
+
+        with src:
+            file_buf = src.read(self.block_size)
+            while len(file_buf) > 0:
+                hash_obj.update(file_buf)
+                if dst is not None:
+                    dst.write(file_buf)
+                file_buf = src.read(self.block_size)
+        return hash_obj.hexdigest() == digest
@@ -0,0 +1,130 @@
+"""
+###########################################################################
+File: batch_diff.py
+Author:
+Description: Diffs many pairs of files on a process pool without a display.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+A manifest has one pair of files per line, separated by a tab, or by spaces if neither path has any.
+Blank lines and lines starting with '#' are skipped.
+
+The pairs are handed to a pool of worker processes, which live for the whole batch. Pool.imap returns
+the results in manifest order while later pairs are still being diffed, so each result is written as a
+JSON line as soon as it and every pair before it are done:
+    {"left": ..., "right": ..., "status": "GOOD", "identical": false, "hunks": 2, "changed_rows": 3,
+     "rows": 40, "seconds": 0.001}
+status is the name of the pymerge_enums.RESULT value, or "ERROR" if the diff raised, and an "error"
+message is added when there is one. Anything the diff engine prints goes to stderr instead, so stdout
+only holds results. Only pymerge_core is used, so PyQt5 is never imported.
+"""
+
+import contextlib
+import json
+import multiprocessing
+import sys
+import time
+
+import longest_common_subseq
+import pymerge_core
+import pymerge_enums
+
+EXIT_IDENTICAL = 0
+EXIT_DIFFERENT = 1
+EXIT_ERROR = 2
+
+
+def read_manifest(lines) -> list:
+    """
+    Gets the pairs of files in a manifest.
+    :param lines: iterable of manifest lines
+    :return: list of (left file, right file) tuples
+    """
+    pairs: list = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.strip() == "" or line.lstrip().startswith("#"):
+            continue
+        paths = line.split("\t") if "\t" in line else line.split()
+        if len(paths) != 2:
+            raise ValueError(f"Manifest line doesn't hold two files: {line}")
+        pairs.append((paths[0], paths[1]))
+    return pairs
+
+
+def diff_pair(pair: tuple, engine: str = "auto") -> dict:
+    """
+    Diffs one pair of files. Runs in a worker process.
+    :param pair: (left file, right file) tuple
+    :param engine: LCS implementation, see pymerge_core.ENGINES
+    :return: result dictionary
+    """
+    left, right = pair
+    start = time.perf_counter()
+    try:
+        # Anything the diff prints would end up in the middle of the results
+        with contextlib.redirect_stdout(sys.stderr):
+            diff_result = pymerge_core.diff(left, right, engine)
+    except Exception as ex:
+        return {"left": left, "right": right, "status": "ERROR", "error": str(ex),
+                "seconds": time.perf_counter() - start}
+
+    result = {
+        "left": left,
+        "right": right,
+        "status": diff_result.result.name,
+        "identical": diff_result.identical,
+        "hunks": len(diff_result.file_hunks),
+        "changed_rows": sum(end - start_row for start_row, end in diff_result.hunks),
+        "rows": diff_result.row_count,
+        "seconds": time.perf_counter() - start,
+    }
+    if diff_result.error != "":
+        result["error"] = diff_result.error
+    return result
+
+
+def diff_pair_task(task: tuple) -> dict:
+    return diff_pair(*task)
+
+
+def run_batch(pairs: list, out, workers: int = None, engine: str = "auto", chunk_size: int = 4) -> int:
+    """
+    Diffs every pair and writes the results as JSON lines, in the same order as the pairs.
+    :param pairs: list of (left file, right file) tuples
+    :param out: text file object to write the results to, flushed after each one
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param engine: LCS implementation, see pymerge_core.ENGINES
+    :param chunk_size: pairs sent to a worker at a time
+    :return: EXIT_ERROR if any pair couldn't be diffed, EXIT_DIFFERENT if any differ, otherwise EXIT_IDENTICAL
+    :raises ValueError: if the engine is unknown or hasn't been built, see longest_common_subseq.check_engine
+    """
+    # Checked here, so a bad engine isn't reported once per pair
+    longest_common_subseq.check_engine(engine)
+    exit_code = EXIT_IDENTICAL
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap(diff_pair_task, ((pair, engine) for pair in pairs), chunk_size):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            if result["status"] != pymerge_enums.RESULT.GOOD.name:
+                exit_code = EXIT_ERROR
+            elif not result["identical"] and exit_code == EXIT_IDENTICAL:
+                exit_code = EXIT_DIFFERENT
+    return exit_code
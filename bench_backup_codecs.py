@@ -0,0 +1,95 @@
+"""
+###########################################################################
+File: bench_backup_codecs.py
+Author:
+Description: Measures backup throughput and size for each compression codec and level.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+Usage: python bench_backup_codecs.py FILE [FILE ...]
+
+Each file is saved to a fresh backup_store.BackupStore once per codec and level, the way
+merge_finalizer.MergeFinalizer backs up a file before writing it, and the time taken, throughput and object
+size are printed. The "auto" rows show which codec auto chose.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import backup_store
+import file_backup
+
+BENCH_SETTINGS = [
+    ("stored", 1),
+    ("deflate", 1),
+    ("deflate", 6),
+    ("deflate", 9),
+    ("bzip2", 1),
+    ("bzip2", 9),
+    ("lzma", 1),
+    ("lzma", 6),
+    ("auto", 1),
+    ("auto", 6),
+]
+
+
+def bench_file(file: str, work_dir: str):
+    """
+    Back up a file with every codec setting and print the results.
+    :param file: file to back up
+    :param work_dir: directory to create the backup stores in
+    :return: No return value
+    """
+    file_size = os.path.getsize(file)
+    print(f"{file} ({file_size / 2 ** 20:.1f} MiB, sample ratio {file_backup.Backup.sample_ratio(file):.2f})")
+    print(f"  {'codec':<14}{'level':>6}{'seconds':>10}{'MiB/s':>10}{'size':>14}{'ratio':>8}")
+
+    for n, (codec, level) in enumerate(BENCH_SETTINGS):
+        store = backup_store.BackupStore(os.path.join(work_dir, f"store_{n}"), codec=codec, level=level)
+        start = time.perf_counter()
+        digest = store.backup(file)
+        seconds = time.perf_counter() - start
+
+        object_size = store.stored_size(digest)
+        shutil.rmtree(store.root)
+        if codec == file_backup.AUTO_CODEC:
+            codec = f"auto:{file_backup.Backup.choose_codec(file, codec)}"
+        print(
+            f"  {codec:<14}{level:>6}{seconds:>10.3f}"
+            f"{file_size / 2 ** 20 / max(seconds, 1e-9):>10.1f}{object_size:>14}"
+            f"{object_size / max(file_size, 1):>8.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare backup compression codecs")
+    parser.add_argument("files", nargs="+", help="files to back up")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for file in args.files:
+            bench_file(file, work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -34,6 +34,8 @@ class ChangeSet(object):
 	def __init__(self):
 		self.change_list: list = []
 		self.change_set_ready: bool = False
+		# Runs of unchanged rows and where they are in the file, as [first row, first file line, length] lists
+		self.line_runs: list = []
 
 	def get_change(self, line_num, change_type, data):
 		change = self.change_list[line_num]
@@ -43,3 +45,27 @@ class ChangeSet(object):
 
 	def add_change(self, line_num, change_type, data):
 		self.change_list.append((line_num, change_type, data))
+
+	def add_changes(self, changes: list):
+		# changes is a list of (line_num, change_type, data) tuples
+		self.change_list.extend(changes)
+
+	def add_file_line(self, line_num, file_line):
+		# Records the line number in the file of an unchanged row. Rows must be added in order
+		if len(self.line_runs) > 0:
+			last = self.line_runs[-1]
+			if last[0] + last[2] == line_num and last[1] + last[2] == file_line:
+				last[2] += 1
+				return
+		self.line_runs.append([line_num, file_line, 1])
+
+	def clear(self):
+		del self.change_list[:]
+		del self.line_runs[:]
+
+	def copy(self):
+		change_set = ChangeSet()
+		change_set.change_list = self.change_list[:]
+		change_set.line_runs = [run[:] for run in self.line_runs]
+		change_set.change_set_ready = self.change_set_ready
+		return change_set
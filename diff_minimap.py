@@ -0,0 +1,181 @@
+"""
+###########################################################################
+File: diff_minimap.py
+Author:
+Description: Overview strip showing where the differences are in the whole file.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+The minimap is drawn from the block boundary lists of the main table (diff_indices and
+diff_index_block_end), never from the table items, so drawing it only costs one rectangle per
+block of differences. The drawing is cached in a pixmap. Merging a block only redraws that
+block's rectangle, and scrolling only redraws the visible region marker.
+"""
+
+import bisect
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPainter, QPixmap
+from PyQt5.QtWidgets import QWidget
+
+import gui_config as gui_cfg
+import pymerge_enums
+
+
+class DiffMinimap(QWidget):
+    WIDTH = 18
+    MIN_BLOCK_HEIGHT = 2  # Keep one line blocks visible in very long files
+
+    def __init__(self, table_obj):
+        """
+        Initialize the DiffMinimap class
+        :param table_obj: MainTable instance to show the overview for
+        """
+        super().__init__()
+        self.table_obj = table_obj
+        self.pixmap = None
+        self.setFixedWidth(self.WIDTH)
+        self.setToolTip("Overview of all differences. Click to jump to a difference.")
+        self.table_obj.table.verticalScrollBar().valueChanged.connect(lambda value: self.update())
+
+    def line_count(self) -> int:
+        return max(len(self.table_obj.rows), 1)
+
+    def line_to_y(self, line_num: int) -> int:
+        return int(line_num * self.height() / self.line_count())
+
+    def y_to_line(self, y: int) -> int:
+        return min(max(int(y * self.line_count() / max(self.height(), 1)), 0), self.line_count() - 1)
+
+    def block_color(self, block_idx: int):
+        """
+        Gets the color to draw a block of differences with.
+        :param block_idx: index into the table's block lists
+        :return: QColor
+        """
+        if self.table_obj.diff_block_merged[block_idx]:
+            return gui_cfg.COLORS["ROW_MERGED"]
+        if self.table_obj.diff_block_types[block_idx] == pymerge_enums.CHANGEDENUM.CHANGED:
+            return gui_cfg.COLORS["ROW_DIFF"]
+        return gui_cfg.COLORS["ROW_PAD_SPACE"]
+
+    def draw_blocks(self, painter: QPainter, first: int, last: int):
+        """
+        Draw the blocks of differences in the range [first, last).
+        :param painter: painter for the cached pixmap
+        :param first: first block index
+        :param last: block index to stop at
+        :return: No return value
+        """
+        for block_idx in range(first, last):
+            top = self.line_to_y(self.table_obj.diff_indices[block_idx])
+            bottom = self.line_to_y(self.table_obj.diff_index_block_end[block_idx])
+            painter.fillRect(
+                0, top, self.width(), max(bottom - top, self.MIN_BLOCK_HEIGHT), self.block_color(block_idx)
+            )
+
+    def redraw(self):
+        """
+        Draw every block into a new cached pixmap.
+        :return: No return value
+        """
+        self.pixmap = QPixmap(self.size())
+        self.pixmap.fill(gui_cfg.COLORS["ROW_DEFAULT"])
+        painter = QPainter(self.pixmap)
+        self.draw_blocks(painter, 0, len(self.table_obj.diff_index_block_end))
+        painter.end()
+        self.update()
+
+    def refresh(self):
+        """
+        Throw away the cached pixmap after the blocks or the line count changed. It is drawn again
+        the next time the minimap is painted.
+        :return: No return value
+        """
+        self.pixmap = None
+        self.update()
+
+    def update_block(self, block_idx: int):
+        """
+        Redraw a single block in the cached pixmap, for example after it has been merged. Blocks that
+        share pixels with it are drawn again too.
+        :param block_idx: index into the table's block lists
+        :return: No return value
+        """
+        if self.pixmap is None or self.pixmap.size() != self.size():
+            self.redraw()
+            return
+
+        top = self.line_to_y(self.table_obj.diff_indices[block_idx])
+        bottom = max(
+            self.line_to_y(self.table_obj.diff_index_block_end[block_idx]), top + self.MIN_BLOCK_HEIGHT
+        )
+
+        # Find every block drawn over the same pixel rows
+        first = bisect.bisect_left(self.table_obj.diff_index_block_end, self.y_to_line(top))
+        last = bisect.bisect_right(self.table_obj.diff_indices, self.y_to_line(bottom) + 1)
+        first = max(min(first, block_idx) - 1, 0)
+        last = min(max(last, block_idx + 1) + 1, len(self.table_obj.diff_index_block_end))
+
+        painter = QPainter(self.pixmap)
+        painter.fillRect(0, top, self.width(), bottom - top, gui_cfg.COLORS["ROW_DEFAULT"])
+        self.draw_blocks(painter, first, last)
+        painter.end()
+        self.update()
+
+    def paintEvent(self, event):
+        if self.pixmap is None or self.pixmap.size() != self.size():
+            self.redraw()
+
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.pixmap)
+
+        # Outline the lines currently visible in the table
+        table = self.table_obj.table
+        first_row = table.rowAt(0)
+        if first_row != -1:
+            last_row = table.rowAt(table.viewport().height() - 1)
+            if last_row == -1:
+                last_row = table.rowCount() - 1
+            top = self.line_to_y(self.table_obj.line_of_row(first_row))
+            bottom = self.line_to_y(self.table_obj.line_of_row(last_row) + 1)
+            painter.setPen(gui_cfg.COLORS["ROW_ACTV_BG"])
+            painter.drawRect(0, top, self.width() - 1, max(bottom - top, self.MIN_BLOCK_HEIGHT))
+        painter.end()
+
+    def mousePressEvent(self, event):
+        """
+        Jump to the block of differences closest to where the minimap was clicked.
+        :param event: mouse event
+        :return: No return value
+        """
+        diff_indices = self.table_obj.diff_indices
+        block_count = len(self.table_obj.diff_index_block_end)
+        if event.button() != Qt.LeftButton or block_count == 0:
+            return
+
+        line_num = self.y_to_line(event.y())
+        block_idx = bisect.bisect_right(diff_indices, line_num, 0, block_count) - 1
+        if block_idx < 0:
+            block_idx = 0
+        elif block_idx + 1 < block_count and \
+                diff_indices[block_idx + 1] - line_num < line_num - self.table_obj.diff_index_block_end[block_idx]:
+            block_idx += 1
+        self.table_obj.goto_diff(block_idx)
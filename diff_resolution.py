@@ -23,10 +23,15 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 ###########################################################################
 """
 
+import bisect
+import itertools
+
 import changeset
 import longest_common_subseq
 import pymerge_enums
 
+MIN_BLOCK_LINES = 1000  # Each LCS has a fixed cost, so the files are only split at anchors this far apart
+
 
 def get_next_idx_match(match_list: list or set, curr_idx: int) -> list:
     """
@@ -43,45 +48,147 @@ def get_next_idx_match(match_list: list or set, curr_idx: int) -> list:
             return [-1, -1]
 
 
-def diff_set(
-    file_a,
-    file_b,
-    file_a_path,
-    file_b_path,
-    change_set_a: changeset.ChangeSet,
-    change_set_b: changeset.ChangeSet,
-):
+def common_prefix_len(file_a_lines: list, file_b_lines: list) -> int:
     """
-    This function gets the diff between two files and adds each line to a change set.
-    Flags are set for each lines depending on if the lines were changes, added, or are the same.
-    :param file_a: left hand file to compare
-    :param file_b: right hand file to compare
-    :param change_set_a: change set object for the left file
-    :param change_set_b: change set object for the right file
-    :return: pmEnums.CHANGED value indicating if operation was successful
+    Counts the lines shared at the top of both files.
+    :param file_a_lines: left hand file lines
+    :param file_b_lines: right hand file lines
+    :return: number of leading lines that are identical in both files
     """
+    limit = min(len(file_a_lines), len(file_b_lines))
+    n = 0
+    while n < limit and file_a_lines[n] == file_b_lines[n]:
+        n += 1
+    return n
 
-    file_a_lines: list = file_a.read().splitlines()
-    file_b_lines: list = file_b.read().splitlines()
-    last_vals: list = [0, 0]  # Last found match indices
-
-    # Get the raw, padded LCS output
-    file_a_lines.append(
-        "$"
-    )  # Append a token on the end to make sure last 'lines' always match
-    file_b_lines.append("$")
-    raw_diff: list = longest_common_subseq.padded_lcs(
-        file_a_lines, file_b_lines, max(len(file_a_lines), len(file_b_lines))
-    )
-
-    for n in range(len(raw_diff[0])):
+
+def unique_anchors(file_a_lines: list, file_b_lines: list, start: int) -> list:
+    """
+    Finds lines that appear exactly once in each file, and keeps the longest run of them that is in the
+    same order in both files, as patience diff does.
+    :param file_a_lines: left hand file lines
+    :param file_b_lines: right hand file lines
+    :param start: first line of both files to look at
+    :return: list of (line a, line b) pairs, in order
+    """
+    counts: dict = {}
+    for line in itertools.islice(file_a_lines, start, None):
+        counts[line] = counts.get(line, 0) + 1
+    lines_b: dict = {}
+    for n in range(start, len(file_b_lines)):
+        line = file_b_lines[n]
+        if counts.get(line) == 1:
+            lines_b[line] = -1 if line in lines_b else n
+    matches = [(n, lines_b[file_a_lines[n]]) for n in range(start, len(file_a_lines))
+               if lines_b.get(file_a_lines[n], -1) != -1 and counts[file_a_lines[n]] == 1]
+
+    # Longest increasing run of the right hand lines, by patience sorting
+    tails: list = []      # Right hand line ending the best run of each length
+    tail_idx: list = []   # Index in matches of that line
+    previous: list = []   # Index in matches of the match before each match in its best run
+    for idx, (_, line_b) in enumerate(matches):
+        length = bisect.bisect_left(tails, line_b)
+        if length == len(tails):
+            tails.append(line_b)
+            tail_idx.append(idx)
+        else:
+            tails[length] = line_b
+            tail_idx[length] = idx
+        previous.append(tail_idx[length - 1] if length > 0 else -1)
+
+    anchors: list = []
+    idx = tail_idx[-1] if len(tail_idx) > 0 else -1
+    while idx != -1:
+        anchors.append(matches[idx])
+        idx = previous[idx]
+    anchors.reverse()
+    return anchors
+
+
+def iter_diff(file_a_lines: list, file_b_lines: list, engine=None):
+    """
+    Generator version of diff_set. Yields one tuple per table row, top of the file first:
+    (row number, change type a, line a, change type b, line b, file line a, file line b).
+    The file line numbers are the index of the line in each file for unchanged rows, and -1 for all other rows.
+    The files are split into blocks of at least MIN_BLOCK_LINES at lines that appear once in each file, see
+    unique_anchors, and each block is diffed and yielded on its own, so a caller can start displaying the top of the file before the
+    rest has been diffed. The generator returns a pymerge_enums.RESULT value.
+    :param file_a_lines: left hand file lines
+    :param file_b_lines: right hand file lines
+    :param engine: LCS implementation to use, see longest_common_subseq.padded_lcs
+    :return: pymerge_enums.RESULT value indicating if the operation was successful
+    """
+    anchors: list = []
+    for anchor in unique_anchors(file_a_lines, file_b_lines, common_prefix_len(file_a_lines, file_b_lines)):
+        last_a, last_b = anchors[-1] if len(anchors) > 0 else (0, 0)
+        if anchor[0] - last_a >= MIN_BLOCK_LINES or anchor[1] - last_b >= MIN_BLOCK_LINES:
+            anchors.append(anchor)
+    # Every block after the first starts with its anchor, so its lines are diffed after a matching line
+    # the same way they would be in the whole file
+    starts = [(0, 0)] + anchors
+    ends = anchors + [(len(file_a_lines), len(file_b_lines))]
+
+    # Append a token on the end to make sure last 'lines' always match
+    file_a_lines = file_a_lines + ["$"]
+    file_b_lines = file_b_lines + ["$"]
+
+    row = 0
+    for (start_a, start_b), (end_a, end_b) in zip(starts, ends):
+        rows = diff_block(file_a_lines, file_b_lines, start_a, end_a, start_b, end_b, engine)
+        block_rows = 0
+        while True:
+            try:
+                n, change_a, line_a, change_b, line_b, file_line_a, file_line_b = next(rows)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            yield row + n, change_a, line_a, change_b, line_b, file_line_a, file_line_b
+            block_rows = n + 1
+        if result != pymerge_enums.RESULT.GOOD:
+            return result
+        row += block_rows
+
+    return pymerge_enums.RESULT.GOOD
+
+
+def diff_block(file_a_lines: list, file_b_lines: list, start_a: int, end_a: int, start_b: int, end_b: int,
+               engine=None):
+    """
+    Diffs one block of the files with a single LCS, see iter_diff. Rows are numbered from the start of the
+    block, file lines from the start of the file. The LCS indices are moved to file line numbers before the
+    rows are classified, so a block gives the same rows it would as part of an LCS of the whole file.
+    :param file_a_lines: left hand file lines, ending with the match token
+    :param file_b_lines: right hand file lines, ending with the match token
+    :param start_a: first left hand line of the block
+    :param end_a: left hand line after the block, the line the block's match token stands for
+    :param start_b: first right hand line of the block
+    :param end_b: right hand line after the block
+    :param engine: LCS implementation to use, see longest_common_subseq.padded_lcs
+    :return: pymerge_enums.RESULT value indicating if the operation was successful
+    """
+    limit = min(end_a - start_a, end_b - start_b)
+    prefix_len = 0
+    while prefix_len < limit and file_a_lines[start_a + prefix_len] == file_b_lines[start_b + prefix_len]:
+        prefix_len += 1
+
+    for n in range(prefix_len):
+        yield n, pymerge_enums.CHANGEDENUM.SAME, file_a_lines[start_a + n], \
+            pymerge_enums.CHANGEDENUM.SAME, file_b_lines[start_b + n], start_a + n, start_b + n
+
+    # Get the raw, padded LCS output, with a token on the end to make sure last 'lines' always match.
+    # The common prefix is always matched line for line.
+    block_a = file_a_lines[start_a:end_a] + ["$"]
+    block_b = file_b_lines[start_b:end_b] + ["$"]
+    raw_diff: list = longest_common_subseq.padded_lcs(block_a, block_b, max(len(block_a), len(block_b)), engine)
+    raw_diff = [[-1 if idx == -1 else idx + start for idx in raw] for raw, start in zip(raw_diff, (start_a, start_b))]
+    # Last found match indices
+    last_vals: list = [start_a + prefix_len - 1, start_b + prefix_len - 1] if prefix_len > 0 else [0, 0]
+
+    # The token row is not yielded, it only exists to terminate the last block of changes
+    for n in range(prefix_len, len(raw_diff[0]) - 1):
         if raw_diff[0][n] != -1 and raw_diff[1][n] != -1:
-            change_set_a.add_change(
-                n, pymerge_enums.CHANGEDENUM.SAME, file_a_lines[raw_diff[0][n]]
-            )
-            change_set_b.add_change(
-                n, pymerge_enums.CHANGEDENUM.SAME, file_b_lines[raw_diff[1][n]]
-            )
+            yield n, pymerge_enums.CHANGEDENUM.SAME, file_a_lines[raw_diff[0][n]], \
+                pymerge_enums.CHANGEDENUM.SAME, file_b_lines[raw_diff[1][n]], raw_diff[0][n], raw_diff[1][n]
             last_vals = [raw_diff[0][n], raw_diff[1][n]]
 
         else:
@@ -91,12 +198,8 @@ def diff_set(
                 and ((raw_diff[0][n - 1] + 2) == raw_diff[0][n + 1])
                 or ((raw_diff[1][n - 1] + 2) == raw_diff[1][n + 1])
             ):
-                change_set_a.add_change(
-                    n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[raw_diff[0][n - 1] + 1]
-                )
-                change_set_b.add_change(
-                    n, pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[raw_diff[1][n - 1] + 1]
-                )
+                yield n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[raw_diff[0][n - 1] + 1], \
+                    pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[raw_diff[1][n - 1] + 1], -1, -1
             else:
                 # Get the next matching indices
                 next_vals = get_next_idx_match(raw_diff, n)
@@ -109,56 +212,99 @@ def diff_set(
                 # If the match index deltas are equal the line flags can default to CHANGED
                 if idx_delta[0] == idx_delta[1]:
                     last_vals = [x + 1 for x in last_vals]
-                    change_set_a.add_change(
-                        n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]]
-                    )
-                    change_set_b.add_change(
-                        n, pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]]
-                    )
+                    yield n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]], \
+                        pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]], -1, -1
 
                 # If the delta is greater on the left side, that means lines were inserted in the left file
                 elif idx_delta[0] > idx_delta[1]:
                     # Check if the last index matches are getting close to to the next index matches
                     if last_vals[1] < (next_vals[1] - 1):
                         last_vals = [x + 1 for x in last_vals]
-                        change_set_a.add_change(
-                            n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]]
-                        )
-                        change_set_b.add_change(
-                            n, pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]]
-                        )
+                        yield n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]], \
+                            pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]], -1, -1
                     else:
                         last_vals = [x + 1 for x in last_vals]
-                        change_set_a.add_change(
-                            n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]]
-                        )
-                        change_set_b.add_change(n, pymerge_enums.CHANGEDENUM.ADDED, "")
+                        yield n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]], \
+                            pymerge_enums.CHANGEDENUM.ADDED, "", -1, -1
 
                 # if the delta is greater on the right side, that means lines were inserted in the right file
                 elif idx_delta[0] < idx_delta[1]:
                     if last_vals[0] < (next_vals[0] - 1):
                         last_vals = [x + 1 for x in last_vals]
-                        change_set_a.add_change(
-                            n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]]
-                        )
-                        change_set_b.add_change(
-                            n, pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]]
-                        )
+                        yield n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[last_vals[0]], \
+                            pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]], -1, -1
 
                     else:
                         last_vals = [x + 1 for x in last_vals]
-                        change_set_a.add_change(n, pymerge_enums.CHANGEDENUM.ADDED, "")
-                        change_set_b.add_change(
-                            n, pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]]
-                        )
+                        yield n, pymerge_enums.CHANGEDENUM.ADDED, "", \
+                            pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[last_vals[1]], -1, -1
 
                 else:
                     # The default flag is CHANGED
-                    change_set_a.add_change(
-                        n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[raw_diff[0][n]]
-                    )
-                    change_set_b.add_change(
-                        n, pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[raw_diff[1][n]]
-                    )
+                    yield n, pymerge_enums.CHANGEDENUM.CHANGED, file_a_lines[raw_diff[0][n]], \
+                        pymerge_enums.CHANGEDENUM.CHANGED, file_b_lines[raw_diff[1][n]], -1, -1
 
     return pymerge_enums.RESULT.GOOD
+
+
+def diff_set(
+    file_a,
+    file_b,
+    file_a_path,
+    file_b_path,
+    change_set_a: changeset.ChangeSet,
+    change_set_b: changeset.ChangeSet,
+):
+    """
+    This function gets the diff between two files and adds each line to a change set.
+    Flags are set for each lines depending on if the lines were changes, added, or are the same.
+    :param file_a: left hand file to compare
+    :param file_b: right hand file to compare
+    :param change_set_a: change set object for the left file
+    :param change_set_b: change set object for the right file
+    :return: pmEnums.CHANGED value indicating if operation was successful
+    """
+
+    file_a_lines: list = file_a.read().splitlines()
+    file_b_lines: list = file_b.read().splitlines()
+    return diff_lines(file_a_lines, file_b_lines, change_set_a, change_set_b)
+
+
+def diff_lines(
+    file_a_lines: list,
+    file_b_lines: list,
+    change_set_a: changeset.ChangeSet,
+    change_set_b: changeset.ChangeSet,
+    engine=None,
+):
+    """
+    Gets the diff between two lists of lines and adds each line to a change set, see diff_set.
+    :param file_a_lines: left hand file lines, without line endings
+    :param file_b_lines: right hand file lines, without line endings
+    :param change_set_a: change set object for the left file
+    :param change_set_b: change set object for the right file
+    :param engine: LCS implementation to use, see longest_common_subseq.padded_lcs
+    :return: pymerge_enums.RESULT value indicating if the operation was successful
+    """
+    rows = iter_diff(file_a_lines, file_b_lines, engine)
+    n = 0
+
+    while True:
+        try:
+            n, change_a, line_a, change_b, line_b, file_line_a, file_line_b = next(rows)
+        except StopIteration as stop:
+            result = stop.value
+            break
+        change_set_a.add_change(n, change_a, line_a)
+        change_set_b.add_change(n, change_b, line_b)
+        if file_line_a != -1:
+            change_set_a.add_file_line(n, file_line_a)
+            change_set_b.add_file_line(n, file_line_b)
+
+    if result == pymerge_enums.RESULT.GOOD:
+        # Keep the match token as the last entry so change sets always end on a SAME line
+        n = len(change_set_a.change_list)
+        change_set_a.add_change(n, pymerge_enums.CHANGEDENUM.SAME, "$")
+        change_set_b.add_change(n, pymerge_enums.CHANGEDENUM.SAME, "$")
+
+    return result
@@ -0,0 +1,428 @@
+"""
+###########################################################################
+File: diff_search.py
+Author:
+Description: Find bar and background search over both sides of a diff.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+The search runs on a worker thread over copies of the line lists of both sides, never over the
+table items. Lines are joined into chunks and scanned with a single compiled pattern per chunk,
+which keeps the per line work inside the re module. A pattern for whitespace or one like [^x] can
+match the newline between two lines, so the chunk only says which line to look at next: a line is
+reported only if the pattern matches the line on its own. Each match is stored as a key (line * 2 + side)
+in a sorted list, so the next and previous match can be found with bisect. Results are sent to the
+GUI after every chunk, so the first matches are highlighted while the rest of the file is still
+being searched.
+
+The lines of both sides are copied from the table once per file load. Only lines inside blocks of
+differences can be merged, so each search takes their current text and the worker puts it over its
+own copy of the lines. A search starts once typing has paused for SEARCH_DELAY_MS.
+"""
+
+import bisect
+import re
+
+from PyQt5.QtCore import QThread, QTimer, Qt, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QCheckBox,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QPushButton,
+    QWidget,
+)
+
+import gui_config as gui_cfg
+
+SIDE_COLS = (gui_cfg.LEFT_TXT_COL_IDX, gui_cfg.RIGHT_TXT_COL_IDX)  # Table column showing each side
+SEARCH_DELAY_MS = 150  # Time after the last key press before the search starts
+
+
+def compile_pattern(text: str, regex: bool, match_case: bool):
+    """
+    Compile the search text.
+    :param text: text or regular expression to search for
+    :param regex: boolean indicating if the text is a regular expression
+    :param match_case: boolean indicating if the search is case sensitive
+    :return: compiled pattern, or None if the text is empty or not a valid regular expression
+    """
+    if text == "":
+        return None
+    flags = re.MULTILINE
+    if not match_case:
+        flags |= re.IGNORECASE
+    try:
+        return re.compile(text if regex else re.escape(text), flags)
+    except re.error:
+        return None
+
+
+def find_lines(pattern, lines: list, start: int, end: int) -> list:
+    """
+    Find the lines in the range [start, end) that contain a match. Each line is only reported once.
+    :param pattern: compiled pattern
+    :param lines: list of line strings
+    :param start: first line to search
+    :param end: line to stop at
+    :return: sorted list of line numbers
+    """
+    text = "\n".join(lines[start:end])
+    found: list = []
+    line_num = start
+    pos = 0
+
+    match = pattern.search(text)
+    while match is not None:
+        line_num += text.count("\n", pos, match.start())
+        # The match may run into the next line, the line only counts if it matches by itself
+        if pattern.search(lines[line_num]) is not None:
+            found.append(line_num)
+
+        # Carry on from the start of the next line
+        pos = text.find("\n", match.start())
+        if pos == -1:
+            break
+        pos += 1
+        line_num += 1
+        match = pattern.search(text, pos)
+    return found
+
+
+class SearchWorker(QThread):
+    matches_found = pyqtSignal(list)  # Sorted list of match keys (line * 2 + side)
+    search_finished = pyqtSignal()
+
+    CHUNK_LINES = 2000
+
+    def __init__(self, pattern, lines_a: list, lines_b: list, hunk_lines: list, ranges: list, parent=None):
+        """
+        Initialize the SearchWorker class
+        :param pattern: compiled pattern
+        :param lines_a: lines of the left hand side, not changed by the worker
+        :param lines_b: lines of the right hand side, not changed by the worker
+        :param hunk_lines: current text of the blocks of differences, see MainTable.get_hunk_lines
+        :param ranges: sorted list of (start, end) line ranges to search
+        :param parent: parent QObject
+        """
+        super().__init__(parent)
+        self.pattern = pattern
+        self.lines_a: list = lines_a
+        self.lines_b: list = lines_b
+        self.hunk_lines: list = hunk_lines
+        self.ranges: list = ranges
+
+    def merged_lines(self) -> tuple:
+        """
+        Gets copies of the lines of both sides with the current text of the blocks of differences.
+        :return: tuple of (left hand lines, right hand lines)
+        """
+        lines_a = list(self.lines_a)
+        lines_b = list(self.lines_b)
+        for start, hunk_a, hunk_b in self.hunk_lines:
+            lines_a[start:start + len(hunk_a)] = hunk_a
+            lines_b[start:start + len(hunk_b)] = hunk_b
+        return lines_a, lines_b
+
+    def run(self):
+        """
+        Search the ranges a chunk at a time and emit the matches of each chunk.
+        :return: No return value
+        """
+        lines_a, lines_b = self.merged_lines()
+        for start, end in self.ranges:
+            for chunk_start in range(start, end, self.CHUNK_LINES):
+                if self.isInterruptionRequested():
+                    return
+
+                chunk_end = min(chunk_start + self.CHUNK_LINES, end)
+                keys = [n * 2 for n in find_lines(self.pattern, lines_a, chunk_start, chunk_end)]
+                keys.extend(n * 2 + 1 for n in find_lines(self.pattern, lines_b, chunk_start, chunk_end))
+                if len(keys) > 0:
+                    keys.sort()
+                    self.matches_found.emit(keys)
+        self.search_finished.emit()
+
+
+class SearchBar(QWidget):
+    def __init__(self, table_obj):
+        """
+        Initialize the SearchBar class
+        :param table_obj: MainTable instance to search
+        """
+        super().__init__()
+        self.table_obj = table_obj
+        self.worker = None
+        self.matches: list = []        # Sorted match keys (line * 2 + side)
+        self.curr_match: int = -1      # Index into self.matches
+        self.highlighted: set = set()  # Keys of the table items that have been highlighted
+        self.searching: bool = False
+        self.side_lines = None         # Lines of both sides when the files were loaded, see get_side_lines()
+        self.side_lines_key = None     # Store generation and line count the lines were copied at
+
+        # Typing restarts the timer, so there is one search per pause rather than one per key press
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.start_search)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.search_text = QLineEdit()
+        self.search_text.setPlaceholderText("Find")
+        self.search_text.textChanged.connect(self.search_timer.start)
+        self.search_text.returnPressed.connect(self.find_next)
+        layout.addWidget(self.search_text)
+
+        self.regex_box = QCheckBox("Regex")
+        self.regex_box.toggled.connect(self.start_search)
+        layout.addWidget(self.regex_box)
+
+        self.match_case_box = QCheckBox("Match case")
+        self.match_case_box.toggled.connect(self.start_search)
+        layout.addWidget(self.match_case_box)
+
+        self.hunks_only_box = QCheckBox("Differences only")
+        self.hunks_only_box.setToolTip("only search lines inside blocks of differences")
+        self.hunks_only_box.toggled.connect(self.start_search)
+        layout.addWidget(self.hunks_only_box)
+
+        prev_button = QPushButton("Previous")
+        prev_button.clicked.connect(self.find_prev)
+        layout.addWidget(prev_button)
+
+        next_button = QPushButton("Next")
+        next_button.clicked.connect(self.find_next)
+        layout.addWidget(next_button)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+    def show_bar(self):
+        self.show()
+        self.search_text.setFocus()
+        self.search_text.selectAll()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.stop_search()
+            self.clear_highlights()
+            self.hide()
+        else:
+            super().keyPressEvent(event)
+
+    @pyqtSlot()
+    def start_search(self):
+        """
+        Start a new search with the current options. A search that is still running is abandoned.
+        :return: No return value
+        """
+        self.search_timer.stop()
+        self.stop_search()
+        self.clear_highlights()
+        self.matches = []
+        self.curr_match = -1
+
+        pattern = compile_pattern(
+            self.search_text.text(), self.regex_box.isChecked(), self.match_case_box.isChecked()
+        )
+        if pattern is None:
+            self.status_label.setText("" if self.search_text.text() == "" else "Invalid expression")
+            return
+
+        lines_a, lines_b = self.get_side_lines()
+        if self.hunks_only_box.isChecked():
+            ranges = self.table_obj.get_hunk_ranges()
+        else:
+            ranges = [(0, len(lines_a))]
+
+        self.searching = True
+        self.status_label.setText("Searching...")
+        self.worker = SearchWorker(pattern, lines_a, lines_b, self.table_obj.get_hunk_lines(), ranges, self)
+        self.worker.matches_found.connect(self.add_matches)
+        self.worker.search_finished.connect(self.finish_search)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.worker.start()
+
+    def get_side_lines(self) -> tuple:
+        """
+        Gets the lines of both sides as they were loaded. They are copied from the table again once new
+        files or more lines have been loaded.
+        :return: tuple of (left hand lines, right hand lines)
+        """
+        key = (self.table_obj.store.generation, len(self.table_obj.rows))
+        if self.side_lines is None or self.side_lines_key != key:
+            self.side_lines = self.table_obj.get_side_lines()
+            self.side_lines_key = key
+        return self.side_lines
+
+    def reset(self):
+        """
+        Forget the matches and lines before the table is cleared for new files.
+        :return: No return value
+        """
+        self.search_timer.stop()
+        self.stop_search()
+        self.side_lines = None
+        self.matches = []
+        self.curr_match = -1
+        self.highlighted.clear()
+        self.status_label.setText("")
+
+    def stop_search(self):
+        """
+        Stop a search that is still running. Results that are still queued are ignored.
+        :return: No return value
+        """
+        if self.worker is None:
+            return
+        self.worker.matches_found.disconnect(self.add_matches)
+        self.worker.search_finished.disconnect(self.finish_search)
+        self.worker.requestInterruption()
+        self.worker = None
+        self.searching = False
+
+    @pyqtSlot(list)
+    def add_matches(self, keys: list):
+        """
+        Add a chunk of matches from the worker. Chunks arrive in order, so the list stays sorted.
+        :param keys: sorted list of match keys
+        :return: No return value
+        """
+        self.matches.extend(keys)
+        for key in keys:
+            self.highlight(key)
+
+        # Jump to the first match as soon as there is one, like an incremental search in an editor
+        if self.curr_match == -1:
+            self.curr_match = 0
+            self.show_match()
+        self.update_status()
+
+    @pyqtSlot()
+    def finish_search(self):
+        self.worker = None
+        self.searching = False
+        self.update_status()
+
+    def update_status(self):
+        if len(self.matches) == 0:
+            text = "No matches"
+        else:
+            text = f"{self.curr_match + 1} of {len(self.matches)}"
+        if self.searching:
+            text += "..."
+        self.status_label.setText(text)
+
+    @pyqtSlot()
+    def find_next(self):
+        """
+        Go to the first match after the current table cell, wrapping around to the first match.
+        :return: No return value
+        """
+        # Enter pressed before the search started, the first match is shown when it is found
+        if self.search_timer.isActive():
+            self.start_search()
+            return
+        if len(self.matches) == 0:
+            return
+        self.curr_match = bisect.bisect_right(self.matches, self.current_key())
+        if self.curr_match == len(self.matches):
+            self.curr_match = 0
+        self.show_match()
+        self.update_status()
+
+    @pyqtSlot()
+    def find_prev(self):
+        """
+        Go to the last match before the current table cell, wrapping around to the last match.
+        :return: No return value
+        """
+        if len(self.matches) == 0:
+            return
+        self.curr_match = bisect.bisect_left(self.matches, self.current_key()) - 1
+        if self.curr_match < 0:
+            self.curr_match = len(self.matches) - 1
+        self.show_match()
+        self.update_status()
+
+    def current_key(self) -> int:
+        """
+        Gets the match key of the current table cell, or of the current match if the table cell
+        doesn't show a single line.
+        :return: match key
+        """
+        tbl_row = self.table_obj.table.currentRow()
+        if tbl_row == -1 or self.table_obj.line_at(tbl_row) == -1:
+            if self.curr_match == -1:
+                return -1
+            return self.matches[self.curr_match]
+        side = 1 if self.table_obj.table.currentColumn() == SIDE_COLS[1] else 0
+        return self.table_obj.line_at(tbl_row) * 2 + side
+
+    def show_match(self):
+        """
+        Scroll to the current match and make it the current table cell. Folded matches are expanded first.
+        :return: No return value
+        """
+        key = self.matches[self.curr_match]
+        line_num = key // 2
+        if self.table_obj.rows[line_num] is None:
+            self.table_obj.expand_folds(
+                [bisect.bisect_right(self.table_obj.fold_starts, line_num) - 1]
+            )
+            for match_key in self.matches:
+                self.highlight(match_key)
+
+        tbl_row = self.table_obj.rows[line_num].row_num
+        table = self.table_obj.table
+        table.setCurrentCell(tbl_row, SIDE_COLS[key % 2])
+        table.scrollToItem(table.item(tbl_row, SIDE_COLS[key % 2]), QAbstractItemView.PositionAtCenter)
+
+    def highlight(self, key: int):
+        """
+        Highlight the text of a match. Matches inside folds are highlighted when they are shown.
+        :param key: match key
+        :return: No return value
+        """
+        row = self.table_obj.rows[key // 2]
+        if row is None:
+            return
+        item = self.table_obj.table.item(row.row_num, SIDE_COLS[key % 2])
+        font = item.font()
+        font.setBold(True)
+        item.setFont(font)
+        item.setForeground(gui_cfg.COLORS["SEARCH_MATCH_FG"])
+        self.highlighted.add(key)
+
+    def clear_highlights(self):
+        for key in self.highlighted:
+            # Lines can have been folded again or the table cleared since they were highlighted
+            if key // 2 >= len(self.table_obj.rows) or self.table_obj.rows[key // 2] is None:
+                continue
+            item = self.table_obj.table.item(self.table_obj.rows[key // 2].row_num, SIDE_COLS[key % 2])
+            font = item.font()
+            font.setBold(False)
+            item.setFont(font)
+            item.setForeground(gui_cfg.COLORS["ROW_INACTV_TXT"])
+        self.highlighted.clear()
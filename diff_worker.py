@@ -0,0 +1,94 @@
+"""
+###########################################################################
+File: diff_worker.py
+Author:
+Description: Background thread that diffs two files and streams the results to the GUI.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+The diff for large files is run on a worker thread so the window stays responsive. Rows are sent
+to the main table in batches as diff_resolution.iter_diff produces them, top of the file first.
+iter_diff diffs the files a block at a time, so rows arrive as each block is resolved rather than
+after an LCS of the whole file. The first batch is kept small so the first screenful is shown as
+soon as possible.
+"""
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import diff_resolution
+import pymerge_enums
+
+
+class DiffWorker(QThread):
+    rows_ready = pyqtSignal(list)       # List of row tuples, as yielded by diff_resolution.iter_diff
+    diff_finished = pyqtSignal(object)  # pymerge_enums.RESULT value
+
+    FIRST_BATCH_SIZE = 64
+    BATCH_SIZE = 500
+
+    def __init__(self, file_a: str, file_b: str, parent=None):
+        """
+        Initialize the DiffWorker class
+        :param file_a: left hand file to compare
+        :param file_b: right hand file to compare
+        :param parent: parent QObject
+        """
+        super().__init__(parent)
+        self.file_a: str = file_a
+        self.file_b: str = file_b
+
+    def run(self):
+        """
+        Reads both files and emits the classified rows in batches.
+        :return: No return value
+        """
+        try:
+            with open(self.file_a, "r") as file:
+                file_a_lines = file.read().splitlines()
+            with open(self.file_b, "r") as file:
+                file_b_lines = file.read().splitlines()
+        except (OSError, UnicodeDecodeError) as err:
+            print(f"Error: could not read files for comparison: {err}")
+            self.diff_finished.emit(pymerge_enums.RESULT.ERROR)
+            return
+
+        rows = diff_resolution.iter_diff(file_a_lines, file_b_lines)
+        batch: list = []
+        batch_size = self.FIRST_BATCH_SIZE
+        result = pymerge_enums.RESULT.GOOD
+
+        while not self.isInterruptionRequested():
+            try:
+                batch.append(next(rows))
+            except StopIteration as stop:
+                result = stop.value
+                break
+
+            if len(batch) >= batch_size:
+                self.rows_ready.emit(batch)
+                batch = []
+                batch_size = self.BATCH_SIZE
+
+        if self.isInterruptionRequested():
+            return
+
+        if len(batch) > 0:
+            self.rows_ready.emit(batch)
+        self.diff_finished.emit(result)
@@ -0,0 +1,153 @@
+"""
+###########################################################################
+File: diff_writer.py
+Author:
+Description: Writes a diff as a unified diff or as a JSON list of hunks.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+Both formats are built from pymerge_core.DiffResult.file_hunks, the line ranges of each file between
+matched lines, and the lines of both files. The text of the table rows isn't used, as changed rows can hold
+padding instead of a line. Each writer is a generator of text chunks, one line or one hunk at a time, so
+the output is never held in memory as a whole and write_chunks can stream it to stdout.
+
+Unified hunks are grouped as GNU diff does: hunks whose context would overlap share a header. A last line
+without a line ending is followed by NO_NEWLINE, so patch can recreate the file exactly.
+
+The JSON output is a single object:
+    {"left": path, "right": path, "identical": false, "hunks": [
+    {"left": {"start": 3, "end": 4, "lines": [...]}, "right": {"start": 3, "end": 5, "lines": [...]}},
+    ...]}
+with [start, end) ranges of 0 based line numbers.
+"""
+
+import json
+
+DEFAULT_CONTEXT = 3
+NO_NEWLINE = "\\ No newline at end of file\n"
+
+
+def format_range(start: int, length: int) -> str:
+    """
+    Formats a line range for a unified hunk header.
+    :param start: 0 based first line
+    :param length: number of lines
+    :return: range string, 1 based, with an empty range given as the line before it
+    """
+    if length == 1:
+        return f"{start + 1}"
+    if length == 0:
+        return f"{start},0"
+    return f"{start + 1},{length}"
+
+
+def hunk_groups(file_hunks: list, len_a: int, len_b: int, context: int):
+    """
+    Groups hunks whose context lines touch or overlap.
+    :param file_hunks: DiffResult.file_hunks
+    :param len_a: number of lines in the left hand file
+    :param len_b: number of lines in the right hand file
+    :param context: number of unchanged lines to show around each hunk
+    :return: yields (first line a, end line a, first line b, end line b, hunks) for each group
+    """
+    group: list = []
+    for hunk in file_hunks:
+        if len(group) > 0 and hunk[0] - group[-1][1] > 2 * context:
+            yield group_range(group, len_a, len_b, context)
+            group = []
+        group.append(hunk)
+    if len(group) > 0:
+        yield group_range(group, len_a, len_b, context)
+
+
+def group_range(group: list, len_a: int, len_b: int, context: int) -> tuple:
+    # Lines outside the hunks are the same in both files, so the context is the same length on both sides
+    before = min(context, group[0][0], group[0][2])
+    after = min(context, len_a - group[-1][1], len_b - group[-1][3])
+    return group[0][0] - before, group[-1][1] + after, group[0][2] - before, group[-1][3] + after, group
+
+
+def unified_diff(diff_result, context: int = DEFAULT_CONTEXT, left_label: str = None, right_label: str = None):
+    """
+    Yields the lines of a unified diff, with line endings. Nothing is yielded for identical files.
+    :param diff_result: pymerge_core.DiffResult
+    :param context: number of unchanged lines to show around each hunk
+    :param left_label: name to show for the left hand file, defaults to its path
+    :param right_label: name to show for the right hand file, defaults to its path
+    """
+    lines_a = diff_result.lines_a
+    lines_b = diff_result.lines_b
+    if len(diff_result.file_hunks) == 0:
+        return
+    # Lines followed by NO_NEWLINE, -1 if every line has a line ending
+    last_a = -1 if diff_result.newline_a else len(lines_a) - 1
+    last_b = -1 if diff_result.newline_b else len(lines_b) - 1
+
+    yield f"--- {diff_result.left_path if left_label is None else left_label}\n"
+    yield f"+++ {diff_result.right_path if right_label is None else right_label}\n"
+    for start_a, end_a, start_b, end_b, group in hunk_groups(diff_result.file_hunks, len(lines_a), len(lines_b),
+                                                               context):
+        yield f"@@ -{format_range(start_a, end_a - start_a)} +{format_range(start_b, end_b - start_b)} @@\n"
+        line_a = start_a
+        for hunk in group:
+            for n in range(line_a, hunk[0]):
+                yield " " + lines_a[n] + "\n"
+            for n in range(hunk[0], hunk[1]):
+                yield "-" + lines_a[n] + "\n"
+                if n == last_a:
+                    yield NO_NEWLINE
+            for n in range(hunk[2], hunk[3]):
+                yield "+" + lines_b[n] + "\n"
+                if n == last_b:
+                    yield NO_NEWLINE
+            line_a = hunk[1]
+        # Context lines are the same in both files, so the last one only lacks a line ending if both last lines do
+        for n in range(line_a, end_a):
+            yield " " + lines_a[n] + "\n"
+            if n == last_a:
+                yield NO_NEWLINE
+
+
+def json_hunks(diff_result):
+    """
+    Yields the JSON hunk list in chunks, one hunk per line.
+    :param diff_result: pymerge_core.DiffResult
+    """
+    yield "{" + f'"left": {json.dumps(diff_result.left_path)}, "right": {json.dumps(diff_result.right_path)}, ' \
+                f'"identical": {json.dumps(diff_result.identical)}, "hunks": ['
+    for idx, (start_a, end_a, start_b, end_b) in enumerate(diff_result.file_hunks):
+        hunk = {
+            "left": {"start": start_a, "end": end_a, "lines": diff_result.lines_a[start_a:end_a]},
+            "right": {"start": start_b, "end": end_b, "lines": diff_result.lines_b[start_b:end_b]},
+        }
+        yield ("\n" if idx == 0 else ",\n") + json.dumps(hunk)
+    yield "]}\n"
+
+
+def write_chunks(chunks, out):
+    """
+    Writes the output of a writer as it is produced.
+    :param chunks: generator returned by unified_diff or json_hunks
+    :param out: text file object
+    :return: No return value
+    """
+    for chunk in chunks:
+        out.write(chunk)
+    out.flush()
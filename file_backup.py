@@ -26,22 +26,65 @@ import hashlib
 import os
 import pickle
 import pathlib
+import shutil
+import tempfile
 import zipfile
+import zlib
+
+"""
+A backup is a zip archive holding the file, a text file named after the hash type holding the hash of
+the file, and a pickled meta data file. The file is read once while the archive is written: every block
+goes to both the hash and the compressed archive member, and the hash and meta data are added to the
+archive after it from memory, so nothing else is written to disk.
+Restoring a backup hashes the file as it is streamed out of the archive into a temporary file next to the
+destination, which replaces the destination only if the hash matches. Verifying a backup streams the
+file through the hash the same way without writing it anywhere.
+
+BLAKE2b is much faster than SHA-256 in software, so files of at least LARGE_FILE_SIZE bytes are hashed
+with large_file_hash_type. The hash file name records which hash was used.
+
+The file is compressed with one of CODECS at the given level. The "auto" codec compresses a few
+SAMPLE_SIZE blocks spread over the file with fast deflate first, and only deflates the whole file if
+the samples shrink below DENSE_RATIO of their size. Otherwise the data is already dense (compressed,
+encrypted or binary) and it is stored as it is. The codec is recorded in the archive, so retrieving a
+backup doesn't need to know it.
+"""
+
+HASH_TYPES = ["SHA224", "SHA256", "SHA512", "MD5", "BLAKE2B"]
+LARGE_FILE_SIZE = 64 * 1024 * 1024
+
+CODECS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+AUTO_CODEC = "auto"
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_COUNT = 4
+DENSE_RATIO = 0.9
 
 
 class Backup(object):
-    __slots__ = ["BLOCK_SIZE", "hash_type", "hash_func"]
+    __slots__ = ["BLOCK_SIZE", "hash_type", "hash_func", "large_file_hash_type", "codec", "level"]
 
-    def __init__(self, hash_type="SHA256", block_size=65535):
+    def __init__(self, hash_type="SHA256", block_size=65535, large_file_hash_type="BLAKE2B", codec="deflate",
+                 level=None):
         """
         Initialize the Backup class
         :param hash_type: Type of hash function to use. Defaults to SHA256
         :param block_size: Size of block to be read from file when calculating hash
+        :param large_file_hash_type: Type of hash function to use for large files. Defaults to BLAKE2B
+        :param codec: Name of compression codec in CODECS, or "auto". Defaults to deflate
+        :param level: Compression level, 0-9 for deflate and 1-9 for bzip2. None uses the codec's default
         """
         self.BLOCK_SIZE: int = block_size
         self.hash_type: str = hash_type
         self.hash_func = hashlib.sha256  # Default to SHA256
         self.hash_func = self.get_hash_func(hash_type)
+        self.large_file_hash_type: str = large_file_hash_type
+        self.codec: str = codec
+        self.level: int = level
 
     @staticmethod
     def get_hash_func(hash_type):
@@ -54,9 +97,58 @@ class Backup(object):
             return hashlib.sha512
         if hash_type == "MD5":
             return hashlib.md5
+        if hash_type == "BLAKE2B":
+            return hashlib.blake2b
         else:
             return hashlib.sha256
 
+    def get_file_hash_type(self, file: str) -> str:
+        """
+        Gets the type of hash function to use for a file, based on its size.
+        :param file: file to be hashed
+        :return: hash type
+        """
+        if os.stat(file).st_size >= LARGE_FILE_SIZE:
+            return self.large_file_hash_type
+        return self.hash_type
+
+    @staticmethod
+    def sample_ratio(file: str) -> float:
+        """
+        Estimates how well a file compresses by deflating a few blocks from across it at the fastest level.
+        :param file: file to sample
+        :return: compressed size over original size of the samples, 1.0 for an empty file
+        """
+        file_size = os.stat(file).st_size
+        sample_total = 0
+        compressed_total = 0
+        with open(file, "rb") as in_file:
+            for sample_num in range(SAMPLE_COUNT):
+                in_file.seek(max(file_size - SAMPLE_SIZE, 0) * sample_num // max(SAMPLE_COUNT - 1, 1))
+                sample = in_file.read(SAMPLE_SIZE)
+                sample_total += len(sample)
+                compressed_total += len(zlib.compress(sample, 1))
+                if file_size <= SAMPLE_SIZE:
+                    break
+
+        if sample_total == 0:
+            return 1.0
+        return compressed_total / sample_total
+
+    @staticmethod
+    def choose_codec(file: str, codec: str) -> str:
+        """
+        Gets the codec to compress a file with.
+        :param file: file to be compressed
+        :param codec: configured codec name
+        :return: name of a codec in CODECS, deflate if the configured name isn't known
+        """
+        if codec == AUTO_CODEC:
+            return "stored" if Backup.sample_ratio(file) >= DENSE_RATIO else "deflate"
+        if codec in CODECS:
+            return codec
+        return "deflate"
+
     @staticmethod
     def format_datetime(date_time) -> str:
         """
@@ -89,25 +181,22 @@ class Backup(object):
         """
         return f".meta.{pathlib.Path(file_name).name}.dat"
 
-    def create_meta_file(self, file: str) -> str:
+    def get_meta_data(self, file: str, hash_type: str = None) -> bytes:
         """
-        Create a metadata file for use as comparison against unarchived file data
+        Create the metadata member for use as comparison against unarchived file data
         :param file: file to be archived
-        :return: string containing absolute path to metadata file
+        :param hash_type: type of hash function used for the file, defaults to hash_type
+        :return: pickled metadata
         """
         file_name = file.replace("\\", "/").split("/")[-1]
-        meta_file_name = self.get_meta_file_name(file)
+        file_stat = os.stat(file)
         meta_info: dict = {
             "NAME": file_name,
-            "SIZE": int(os.stat(file).st_size),
-            "MODIFIED": os.stat(file).st_mtime,
-            "HASH_TYPE": self.hash_type,
+            "SIZE": int(file_stat.st_size),
+            "MODIFIED": file_stat.st_mtime,
+            "HASH_TYPE": self.hash_type if hash_type is None else hash_type,
         }
-
-        with open(meta_file_name, "wb") as meta_file:
-            pickle.dump({"META": meta_info}, meta_file)
-
-        return os.path.abspath(meta_file_name)
+        return pickle.dumps({"META": meta_info})
 
     def get_hash(self, file: str) -> hex:
         """
@@ -115,13 +204,13 @@ class Backup(object):
         :param file: file to get hash for
         :return: hex digest version of hash
         """
+        hash_obj = self.hash_func()
         with open(file, "rb") as in_file:
             file_buf = in_file.read(self.BLOCK_SIZE)
-            # hash_obj = self.hash_func().update(file_buf)
             while len(file_buf) > 0:
-                self.hash_func().update(file_buf)
+                hash_obj.update(file_buf)
                 file_buf = in_file.read(self.BLOCK_SIZE)
-        return self.hash_func().hexdigest()
+        return hash_obj.hexdigest()
 
     def check_hash(self, file, hash_value: str) -> bool:
         """
@@ -147,68 +236,145 @@ class Backup(object):
         :param backup_dir:
         :return: absolute path to backup
         """
-        # Create hash file to use for integrity checks during backup retrieval
-        hash_file = self.get_hash_file_name(self.hash_type)
-
-        # Create meta data file to use as comparison when backup is retrieved
-        meta_file = self.create_meta_file(file)
-
-        with open(hash_file, "w+") as temp:
-            temp.write(str(self.get_hash(file)))
-
-        # Zip the files together
-        with zipfile.ZipFile(
-            f"{backup_dir}/{pathlib.Path(file).name}.bak", "w", zipfile.ZIP_DEFLATED
-        ) as backup:
-            backup.write(file)
-            backup.write(hash_file)
-            backup.write(meta_file)
-
+        hash_type = self.get_file_hash_type(file)
+        codec = self.choose_codec(file, self.codec)
+        meta_data = self.get_meta_data(file, hash_type)
+
+        # The archive is written under a temporary name and renamed, so a backup of another file with the
+        # same name never sees it half written
+        backup_file = f"{backup_dir}/{pathlib.Path(file).name}.bak"
+        fd, temp_name = tempfile.mkstemp(suffix=".tmp", dir=backup_dir)
         try:
-            # Remove the created hash and meta data files after they are archived
-            os.remove(hash_file)
-            os.remove(meta_file)
-        except FileNotFoundError:
-            pass
+            # The hash is calculated while the file is compressed into the archive, then the hash and meta
+            # data members are written straight into it
+            with open(fd, "wb") as temp, \
+                    zipfile.ZipFile(temp, "w", CODECS[codec], compresslevel=self.level) as backup:
+                hash_value = self.write_member(backup, file, hash_type)
+                backup.writestr(self.get_hash_file_name(hash_type), hash_value)
+                backup.writestr(self.get_meta_file_name(file), meta_data)
+            os.replace(temp_name, backup_file)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
         return os.path.abspath(f"{file}.bak")
 
-    def retrieve_backup(self, backup_file, file_name):
+    def retrieve_backup(self, backup_file, file_name) -> bool:
         """
         Function to retrieve the backup file from the zip archive. Checks the hash value for integrity
         :param backup_file: backup file to extract
-        :param file_name: file to be backed up
-        :return: No return value
+        :param file_name: file to be backed up, also the member to extract if the archive has one by that name
+        :return: True if the file matched its hash and was restored, False if it was left untouched
         """
+        parent_dir = os.path.dirname(file_name)
+        if parent_dir != "":
+            os.makedirs(parent_dir, exist_ok=True)
 
-        # Extract the archive contents
-        with zipfile.ZipFile(backup_file) as myzip:
-            myzip.extract(file_name)
-            myzip.extract(f"{self.hash_type}.txt")
-            myzip.extract(f".meta.{file_name}.dat")
-
-        # Read the hash file contents
-        with open(f"{self.hash_type}.txt", "r") as hash_file:
-            hash_string = hash_file.read().strip("\n")
-
-        # Check the integrity of the file against the included hash
-        if not self.check_hash(backup_file.strip(".bak"), hash_string):
-            os.remove(file_name)
+        # Extract to a temporary file next to the destination, which only replaces it once the hash matches
+        fd, temp_name = tempfile.mkstemp(suffix=".tmp", dir=parent_dir if parent_dir != "" else ".")
+        try:
+            with zipfile.ZipFile(backup_file) as myzip, open(fd, "wb") as dst:
+                member = file_name if file_name in myzip.namelist() else self.get_data_member(myzip)
+                matched = self.stream_member(myzip, member, dst)
+            if matched:
+                if os.path.exists(file_name):
+                    shutil.copymode(file_name, temp_name)
+                os.replace(temp_name, file_name)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+        return matched
+
+    def verify_backup(self, backup_file: str) -> bool:
+        """
+        Checks the archived file against the included hash without writing anything to disk.
+        :param backup_file: backup file to check
+        :return: True if the file matched its hash
+        """
+        try:
+            with zipfile.ZipFile(backup_file) as myzip:
+                return self.stream_member(myzip, self.get_data_member(myzip))
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return False
 
-        # Remove unecessary archive files
-        os.remove(f"{self.hash_type}.txt")
-        os.remove(f".meta.{file_name}.dat")
+    def stream_member(self, archive: zipfile.ZipFile, member: str, dst=None) -> bool:
+        """
+        Reads an archived file through the hash function named by the archive's hash file.
+        :param archive: open backup archive
+        :param member: name of the archived file
+        :param dst: binary file object to copy the file to, or None to only check it
+        :return: True if the file matched the included hash
+        """
+        hash_member = self.get_hash_member(archive)
+        hash_string = archive.read(hash_member).decode().strip("\n")
+        hash_obj = self.get_hash_func(hash_member[:-len(".txt")])()
+        with archive.open(member) as src:
+            file_buf = src.read(self.BLOCK_SIZE)
+            while len(file_buf) > 0:
+                hash_obj.update(file_buf)
+                if dst is not None:
+                    dst.write(file_buf)
+                file_buf = src.read(self.BLOCK_SIZE)
+        return hash_obj.hexdigest() == hash_string
 
     def get_hash_from_backup(self, backup_file: str) -> str:
         """
         Gets the hash value from the text file stored in the backup archive.
         """
-        # Extract the archive contents
         with zipfile.ZipFile(backup_file) as myzip:
-            myzip.extract(f"{self.hash_type}.txt")
+            hash_string = myzip.read(self.get_hash_member(myzip)).decode().strip("\n")
+        return hash_string
+
+    def get_meta_from_backup(self, backup_file: str) -> dict:
+        """
+        Gets the metadata stored in the backup archive.
+        """
+        with zipfile.ZipFile(backup_file) as myzip:
+            for name in myzip.namelist():
+                if pathlib.PurePosixPath(name).name.startswith(".meta."):
+                    return pickle.loads(myzip.read(name))["META"]
+        raise KeyError("No meta data file in backup archive")
 
-        # Read the hash file contents
-        with open(f"{self.hash_type}.txt", "r") as hash_file:
-            hash_string = hash_file.read().strip("\n")
+    def get_data_member(self, archive: zipfile.ZipFile) -> str:
+        """
+        Gets the name of the backed up file in a backup archive, the member that isn't the hash or meta data.
+        :param archive: open backup archive
+        :return: member name
+        """
+        hash_member = self.get_hash_member(archive)
+        for name in archive.namelist():
+            if name != hash_member and not pathlib.PurePosixPath(name).name.startswith(".meta."):
+                return name
+        raise KeyError("No backed up file in backup archive")
 
-        os.remove(f"{self.hash_type}.txt")
-        return hash_string
+    def get_hash_member(self, archive: zipfile.ZipFile) -> str:
+        """
+        Gets the name of the hash file in a backup archive, which is named after the type of hash used.
+        :param archive: open backup archive
+        :return: member name
+        """
+        names = archive.namelist()
+        for hash_type in [self.hash_type] + HASH_TYPES:
+            if self.get_hash_file_name(hash_type) in names:
+                return self.get_hash_file_name(hash_type)
+        raise KeyError("No hash file in backup archive")
+
+    def write_member(self, archive: zipfile.ZipFile, file: str, hash_type: str) -> str:
+        """
+        Compress a file into an archive, reading it once and hashing each block on the way.
+        :param archive: archive open for writing, its compression and level are used for the file
+        :param file: file to add, stored under the same name as ZipFile.write would use
+        :param hash_type: type of hash function to use
+        :return: hex digest of the file
+        """
+        # Opening the member by name gives it the compression and level the archive was created with. The
+        # modification time is kept in the meta data member instead of the member's own header
+        member = zipfile.ZipInfo.from_file(file).filename
+        hash_obj = self.get_hash_func(hash_type)()
+        with open(file, "rb") as src, archive.open(member, "w") as dst:
+            file_buf = src.read(self.BLOCK_SIZE)
+            while len(file_buf) > 0:
+                hash_obj.update(file_buf)
+                dst.write(file_buf)
+                file_buf = src.read(self.BLOCK_SIZE)
+        return hash_obj.hexdigest()
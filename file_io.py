@@ -37,15 +37,24 @@ import utilities
 
 import os
 import os.path
-from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QMessageBox
 
 
 class FileIO(object):
+    # Files larger than this (combined, in bytes) are diffed on a worker thread and streamed into the table
+    PROGRESSIVE_LOAD_BYTES = 256000
+
     def __init__(self):
         self.changes_b = changeset.ChangeSet()
         self.changes_a = changeset.ChangeSet()
 
-    def diff_files(self, file_a, file_b):
+    @staticmethod
+    def check_files(file_a, file_b):
+        """
+        Checks that both files have been selected and have acceptable file types.
+        :param file_a: left hand file
+        :param file_b: right hand file
+        :return: pymerge_enums.RESULT value
+        """
         if file_a == "" or file_b == "":
             return pymerge_enums.RESULT.EMPTYFILE
 
@@ -60,6 +69,55 @@ class FileIO(object):
             print("\n[-] Unacceptable file type:", file_b_base_name, "\n")
             return pymerge_enums.RESULT.BADFILE
 
+        return pymerge_enums.RESULT.GOOD
+
+    @staticmethod
+    def check_writable(file_a, file_b):
+        """
+        Checks the write permissions of both files.
+        :param file_a: left hand file
+        :param file_b: right hand file
+        :return: pymerge_enums.RESULT value
+        """
+        if not utilities.file_writable(file_a):
+            return pymerge_enums.RESULT.READONLYA
+
+        if not utilities.file_writable(file_b):
+            return pymerge_enums.RESULT.READONLYB
+
+        return pymerge_enums.RESULT.GOOD
+
+    def progressive_load(self, file_a, file_b) -> bool:
+        """
+        Checks if two files are large enough that they should be diffed in the background and loaded
+        into the table as the results are produced.
+        :param file_a: left hand file
+        :param file_b: right hand file
+        :return: boolean indicating if the files should be loaded progressively
+        """
+        try:
+            return os.path.getsize(file_a) + os.path.getsize(file_b) >= self.PROGRESSIVE_LOAD_BYTES
+        except OSError:
+            return False
+
+    def check_progressive_load(self, file_a, file_b):
+        """
+        Runs the same checks as diff_files, without the diff. Used for files that will be diffed by
+        diff_worker.DiffWorker instead.
+        :param file_a: left hand file
+        :param file_b: right hand file
+        :return: pymerge_enums.RESULT value
+        """
+        result = self.check_files(file_a, file_b)
+        if result == pymerge_enums.RESULT.GOOD:
+            return self.check_writable(file_a, file_b)
+        return result
+
+    def diff_files(self, file_a, file_b):
+        result = self.check_files(file_a, file_b)
+        if result != pymerge_enums.RESULT.GOOD:
+            return result
+
         file_a_open = open(file_a, "r")
         file_b_open = open(file_b, "r")
 
@@ -71,13 +129,7 @@ class FileIO(object):
         file_b_open.close()
 
         if result == pymerge_enums.RESULT.GOOD:
-            if not utilities.file_writable(file_a):            
-                return pymerge_enums.RESULT.READONLYA
-
-            if not utilities.file_writable(file_b):
-                return pymerge_enums.RESULT.READONLYB
-
-            return pymerge_enums.RESULT.GOOD
+            return self.check_writable(file_a, file_b)
 
     def get_change_sets(self, file_a, file_b):
         file_a = self.changes_a
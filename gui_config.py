@@ -76,16 +76,19 @@ FG = Foreground color
 """
 COLORS = {
     "ROW_DIFF": QColor(255, 150, 150),
+    "ROW_DIFF_INTRALINE": QColor(235, 90, 90),
     "ROW_MERGED": QColor(219, 235, 255),
     "ROW_PAD_SPACE": QColor(82, 82, 82),
     "ROW_DEFAULT": QColor(237, 255, 240),
+    "ROW_FOLD": QColor(225, 225, 225),
     "ROW_ACTV_BG": QColor(31, 98, 255),
     "ROW_ACTV_TXT": QColor(0, 0, 0),
     "ROW_INACTV_BG": QColor(237, 255, 240),
     "ROW_INACTV_TXT": QColor(0, 0, 0),
     "TBL_HDR_DEFAULT_BG": QColor(179, 179, 179),
     "TBL_HDR_DEFAULT_FG": QColor(0, 0, 0),
-    "TBL_LINE_COL_DEFAULT_BG": QColor(242, 242, 242)
+    "TBL_LINE_COL_DEFAULT_BG": QColor(242, 242, 242),
+    "SEARCH_MATCH_FG": QColor(0, 70, 200),
 }
 
 """
@@ -0,0 +1,130 @@
+"""
+###########################################################################
+File: hunks.py
+Author:
+Description: Helpers for working with blocks of changed lines (hunks) in a diff.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+A hunk is a block of consecutive rows that are not the same on both sides. Hunks are stored as two
+parallel lists of row indices: the first row of each hunk and the row after its last row.
+Unchanged rows outside of the context around each hunk can be folded into a single placeholder row.
+"""
+
+MIN_FOLD_SIZE = 2  # Folding a single row into a placeholder row doesn't save anything
+
+
+def fold_ranges(hunk_starts: list, hunk_ends: list, row_count: int, context: int) -> list:
+    """
+    Calculates the runs of unchanged rows that can be folded, keeping context rows around each hunk.
+    :param hunk_starts: first row of each hunk
+    :param hunk_ends: row after the last row of each hunk
+    :param row_count: number of rows in the diff
+    :param context: number of unchanged rows to keep before and after each hunk
+    :return: list of [start, end) row ranges to fold
+    """
+    folds: list = []
+    if context < 0:
+        return folds
+
+    prev_end = -1
+    for start, end in zip(hunk_starts, hunk_ends):
+        fold_start = 0 if prev_end == -1 else min(prev_end + context, start)
+        fold_end = max(start - context, fold_start)
+        if fold_end - fold_start >= MIN_FOLD_SIZE:
+            folds.append([fold_start, fold_end])
+        prev_end = end
+
+    fold_start = 0 if prev_end == -1 else min(prev_end + context, row_count)
+    if row_count - fold_start >= MIN_FOLD_SIZE:
+        folds.append([fold_start, row_count])
+    return folds
+
+
+class FoldBuilder(object):
+    def __init__(self, context: int):
+        """
+        Splits a stream of rows into the ranges that should be shown and the runs of unchanged rows
+        that should be folded. Rows must be pushed in order. The result is the same as fold_ranges.
+        :param context: number of unchanged rows to keep before and after each hunk. -1 disables folding
+        """
+        self.context: int = context
+        self.shown_to: int = 0          # Rows before this have already been shown or folded
+        self.in_hunk: bool = False
+        self.context_end: int = 0       # Rows before this are context after the last hunk
+        self.seen_hunk: bool = False
+
+    def push(self, n: int, same: bool) -> list:
+        """
+        Add the next row.
+        :param n: row index
+        :param same: boolean indicating if the row is the same on both sides
+        :return: list of (start, end, folded) ranges that are ready to be added to the table
+        """
+        if self.context < 0:
+            return [(n, n + 1, False)]
+
+        if not same:
+            items = [] if self.in_hunk else self.close_run(n, self.context)
+            items.append((n, n + 1, False))
+            self.in_hunk = True
+            self.seen_hunk = True
+            self.shown_to = n + 1
+            return items
+
+        if self.in_hunk:
+            self.in_hunk = False
+            self.context_end = n + self.context
+
+        # Context after a hunk can be shown straight away
+        if self.seen_hunk and n < self.context_end and self.shown_to == n:
+            self.shown_to = n + 1
+            return [(n, n + 1, False)]
+        return []
+
+    def finish(self, row_count: int) -> list:
+        """
+        Called after the last row has been pushed.
+        :param row_count: number of rows in the diff
+        :return: list of (start, end, folded) ranges that are ready to be added to the table
+        """
+        if self.context < 0 or self.shown_to >= row_count:
+            return []
+        return self.close_run(row_count, 0)
+
+    def close_run(self, end: int, tail: int) -> list:
+        """
+        Fold the run of unchanged rows that hasn't been shown yet, keeping tail rows of context.
+        :param end: row after the last row of the run
+        :param tail: number of rows to show at the end of the run
+        :return: list of (start, end, folded) ranges
+        """
+        items: list = []
+        fold_start = self.shown_to
+        fold_end = max(end - tail, fold_start)
+
+        if fold_end - fold_start >= MIN_FOLD_SIZE:
+            items.append((fold_start, fold_end, True))
+        else:
+            fold_end = fold_start
+        if fold_end < end:
+            items.append((fold_end, end, False))
+        self.shown_to = end
+        return items
@@ -0,0 +1,150 @@
+"""
+###########################################################################
+File: intraline.py
+Author:
+Description: Finds the parts of a pair of changed lines that are actually different.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+Intra-line differences are only calculated when a changed row is painted, and the results are kept
+in a bounded LRU cache keyed by the line pair, so rows that are never scrolled into view cost nothing.
+
+The common prefix and suffix of the two lines are removed first. If what is left is the same length
+on both sides and only a few characters differ, the differing characters are found with
+utilities.line_bit_vector. Otherwise the lines are split into word, space and punctuation tokens and
+the tokens are matched with the Myers LCS from longest_common_subseq.
+"""
+
+import functools
+import re
+
+import longest_common_subseq
+import utilities
+
+MAX_LINE_LEN = 4000     # Longer lines are shown as changed with no detail
+MAX_TOKENS = 400        # Longer middles are shown as one changed span rather than running the LCS
+MAX_HAMMING_RATIO = 4   # Use the character fast path if at most 1 in 4 characters differ
+CACHE_SIZE = 4096
+
+TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+def tokenize(line: str) -> list:
+    """
+    Split a line into word, whitespace and punctuation tokens.
+    :param line: line to split
+    :return: list of token strings
+    """
+    return TOKEN_RE.findall(line)
+
+
+def common_affix_len(line_a: str, line_b: str) -> tuple:
+    """
+    Gets the length of the common prefix and of the common suffix of two lines. The two never overlap.
+    :param line_a: line to compare
+    :param line_b: line to compare
+    :return: tuple of (prefix length, suffix length)
+    """
+    limit = min(len(line_a), len(line_b))
+    prefix = 0
+    while prefix < limit and line_a[prefix] == line_b[prefix]:
+        prefix += 1
+
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and line_a[-1 - suffix] == line_b[-1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+
+def bit_vector_spans(bit_vec: list, offset: int) -> list:
+    """
+    Convert a bit vector from utilities.line_bit_vector into runs of differing characters.
+    :param bit_vec: list of 0/1 values, 1 for a differing character
+    :param offset: position of the first bit in the line
+    :return: list of (start, end) character spans
+    """
+    spans: list = []
+    for n, bit in enumerate(bit_vec):
+        if not bit:
+            continue
+        if len(spans) > 0 and spans[-1][1] == offset + n:
+            spans[-1] = (spans[-1][0], offset + n + 1)
+        else:
+            spans.append((offset + n, offset + n + 1))
+    return spans
+
+
+def unmatched_spans(tokens: list, matched: list, offset: int) -> list:
+    """
+    Convert the tokens that are not part of the LCS into character spans.
+    :param tokens: list of token strings
+    :param matched: sorted indices of the tokens that are part of the LCS
+    :param offset: position of the first token in the line
+    :return: list of (start, end) character spans
+    """
+    spans: list = []
+    matched = set(matched)
+    pos = offset
+    for n, token in enumerate(tokens):
+        end = pos + len(token)
+        if n not in matched:
+            if len(spans) > 0 and spans[-1][1] == pos:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((pos, end))
+        pos = end
+    return spans
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def changed_spans(line_a: str, line_b: str) -> tuple or None:
+    """
+    Find the parts of two lines that are different.
+    :param line_a: left hand line
+    :param line_b: right hand line
+    :return: tuple of (spans in line_a, spans in line_b), where each is a list of (start, end)
+             character spans. None if either line is too long to compare.
+    """
+    if len(line_a) > MAX_LINE_LEN or len(line_b) > MAX_LINE_LEN:
+        return None
+
+    prefix, suffix = common_affix_len(line_a, line_b)
+    middle_a = line_a[prefix:len(line_a) - suffix]
+    middle_b = line_b[prefix:len(line_b) - suffix]
+
+    if middle_a == "" or middle_b == "":
+        spans_a = [(prefix, prefix + len(middle_a))] if middle_a != "" else []
+        spans_b = [(prefix, prefix + len(middle_b))] if middle_b != "" else []
+        return spans_a, spans_b
+
+    # A few characters were replaced, such as a typo fix
+    if len(middle_a) == len(middle_b) and \
+            utilities.hamming_dist(middle_a, middle_b) * MAX_HAMMING_RATIO <= len(middle_a):
+        spans = bit_vector_spans(utilities.line_bit_vector(middle_a, middle_b), prefix)
+        return spans, list(spans)
+
+    tokens_a = tokenize(middle_a)
+    tokens_b = tokenize(middle_b)
+    if len(tokens_a) + len(tokens_b) > MAX_TOKENS:
+        return [(prefix, prefix + len(middle_a))], [(prefix, prefix + len(middle_b))]
+
+    matches = longest_common_subseq.longest_common_subsequence2(tokens_a, tokens_b)
+    return unmatched_spans(tokens_a, matches[0], prefix), unmatched_spans(tokens_b, matches[1], prefix)
@@ -0,0 +1,102 @@
+"""
+###########################################################################
+File: intraline_delegate.py
+Author:
+Description: Item delegate that highlights the changed parts of changed lines in the main table.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+Qt only asks the delegate to paint cells that are on screen, so intra-line differences are worked
+out for visible rows only. The results are cached by intraline.changed_spans.
+"""
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QStyle, QStyledItemDelegate, QStyleOptionViewItem
+
+import gui_config as gui_cfg
+import intraline
+import pymerge_enums
+
+
+class IntralineDelegate(QStyledItemDelegate):
+    def __init__(self, table_obj):
+        """
+        Initialize the IntralineDelegate class
+        :param table_obj: MainTable instance the delegate paints for
+        """
+        super().__init__(table_obj.table)
+        self.table_obj = table_obj
+
+    def get_spans(self, index) -> list or None:
+        """
+        Gets the changed character spans of a table cell.
+        :param index: model index of the cell
+        :return: list of (start, end) spans, or None if the cell should be painted normally
+        """
+        line_num = self.table_obj.line_at(index.row())
+        if line_num == -1 or line_num >= len(self.table_obj.rows):
+            return None
+        row = self.table_obj.rows[line_num]
+
+        # Only lines that were changed on both sides have anything to compare
+        if row is None or row.change_state_flags[0] != pymerge_enums.CHANGEDENUM.CHANGED or \
+                row.change_state_flags[1] != pymerge_enums.CHANGEDENUM.CHANGED:
+            return None
+
+        # Compare the text that is shown, which is only part of the line for long lines
+        table = self.table_obj.table
+        spans = intraline.changed_spans(
+            table.item(index.row(), gui_cfg.LEFT_TXT_COL_IDX).text(),
+            table.item(index.row(), gui_cfg.RIGHT_TXT_COL_IDX).text()
+        )
+        if spans is None:
+            return None
+        return spans[0] if index.column() == gui_cfg.LEFT_TXT_COL_IDX else spans[1]
+
+    def paint(self, painter, option, index):
+        spans = self.get_spans(index)
+        if not spans:
+            super().paint(painter, option, index)
+            return
+
+        opt = QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        text = opt.text
+        style = opt.widget.style()
+
+        # Draw the background and selection without the text, then the spans, then the text on top
+        opt.text = ""
+        style.drawControl(QStyle.CE_ItemViewItem, opt, painter, opt.widget)
+        text_rect = style.subElementRect(QStyle.SE_ItemViewItemText, opt, opt.widget)
+        margin = style.pixelMetric(QStyle.PM_FocusFrameHMargin, None, opt.widget) + 1
+        text_rect.adjust(margin, 0, -margin, 0)
+
+        painter.save()
+        painter.setClipRect(text_rect)
+        metrics = opt.fontMetrics
+        for start, end in spans:
+            # Measure up to the end of the span, tab stops depend on everything before them
+            x = text_rect.left() + metrics.size(Qt.TextExpandTabs, text[:start]).width()
+            width = max(metrics.size(Qt.TextExpandTabs, text[:end]).width() + text_rect.left() - x, 2)
+            painter.fillRect(x, text_rect.top(), width, text_rect.height(), gui_cfg.COLORS["ROW_DIFF_INTRALINE"])
+        painter.setFont(opt.font)
+        painter.setPen(opt.palette.color(opt.palette.Text))
+        painter.drawText(text_rect, int(opt.displayAlignment) | Qt.TextExpandTabs, text)
+        painter.restore()
@@ -0,0 +1,148 @@
+"""
+###########################################################################
+File: long_lines.py
+Author:
+Description: Helpers for showing very long lines, such as minified or generated files.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+The table only ever holds a window of a long line, so the cost of creating, laying out and
+painting a cell doesn't depend on the length of the line. The window is moved with a separate
+horizontal scroll bar, which slices the full text again for the long lines only.
+
+Changed long lines are compared a chunk at a time using string slice comparison, and every part
+of them that differs gets a window of its own, see diff_windows. A row starts at its first window
+and can be stepped through the others. Text inserted on one side moves everything after it, so
+after each window the lines are lined up again by looking for the text that follows the window in
+the other line, near where it would be without the insertion. Each window therefore has a start on
+each side. The scroll bar can go below 0 by as much as the furthest window start, so the start of
+every line can still be reached. Lines that are the same on both sides are shown from their start.
+"""
+
+LONG_LINE_LEN = 1000  # Lines longer than this are shown through a window
+WINDOW_LEN = 400      # Number of characters of a long line shown at a time
+CONTEXT_LEN = 40      # Characters shown before each difference of a changed long line
+CHUNK_LEN = 4096      # Characters compared at a time when looking for differences
+MAX_WINDOWS = 100     # Most windows found for a pair of lines
+SYNC_LEN = 32         # Characters after a window looked for in the other line to line them up again
+SYNC_RANGE = 4096     # Characters either side of the expected position that are searched
+ELLIPSIS = "..."
+
+
+def is_long(text: str) -> bool:
+    return len(text) > LONG_LINE_LEN
+
+
+def common_prefix(line_a: str, line_b: str, pos_a: int = 0, pos_b: int = 0) -> int:
+    """
+    Counts the characters that are the same in two lines from a position in each, comparing a chunk at a time.
+    :param line_a: line to compare
+    :param line_b: line to compare
+    :param pos_a: position in line_a to start at
+    :param pos_b: position in line_b to start at
+    :return: number of matching characters
+    """
+    limit = max(min(len(line_a) - pos_a, len(line_b) - pos_b), 0)
+    count = 0
+    while count < limit and \
+            line_a[pos_a + count:pos_a + count + CHUNK_LEN] == line_b[pos_b + count:pos_b + count + CHUNK_LEN]:
+        count += CHUNK_LEN
+    if count >= limit:
+        return limit
+
+    # The difference is inside this chunk
+    end = min(count + CHUNK_LEN, limit)
+    while count < end and line_a[pos_a + count] == line_b[pos_b + count]:
+        count += 1
+    return count
+
+
+def first_difference(line_a: str, line_b: str) -> int:
+    """
+    Gets the position of the first character that differs between two lines.
+    :param line_a: line to compare
+    :param line_b: line to compare
+    :return: position of the first difference, or the length of the shorter line if one starts with the other
+    """
+    return common_prefix(line_a, line_b)
+
+
+def resync(line_a: str, line_b: str, pos_a: int, pos_b: int) -> int:
+    """
+    Finds where the text at a position of one line carries on in the other line.
+    :param line_a: line the text is taken from
+    :param line_b: line to look in
+    :param pos_a: position of the text in line_a
+    :param pos_b: position the text would be at in line_b if nothing had been inserted or removed
+    :return: position in line_b, the nearest match to pos_b within SYNC_RANGE, or pos_b if there is none
+    """
+    probe = line_a[pos_a:pos_a + SYNC_LEN]
+    if len(probe) < SYNC_LEN or line_b.startswith(probe, pos_b):
+        return pos_b
+    after = line_b.find(probe, pos_b, pos_b + SYNC_RANGE + SYNC_LEN)
+    before = line_b.rfind(probe, max(pos_b - SYNC_RANGE, 0), pos_b + SYNC_LEN - 1)
+    if after == -1 and before == -1:
+        return pos_b
+    if after == -1 or (before != -1 and pos_b - before < after - pos_b):
+        return before
+    return after
+
+
+def diff_windows(line_a: str, line_b: str) -> list:
+    """
+    Gets the windows of a pair of lines that hold their differences.
+    :param line_a: left hand line
+    :param line_b: right hand line
+    :return: list of (start in line_a, start in line_b), [(0, 0)] if the lines are short or the same
+    """
+    if not is_long(line_a) and not is_long(line_b):
+        return [(0, 0)]
+    windows: list = []
+    pos_a = 0
+    pos_b = 0
+    while len(windows) < MAX_WINDOWS:
+        same = common_prefix(line_a, line_b, pos_a, pos_b)
+        pos_a += same
+        pos_b += same
+        if pos_a >= len(line_a) and pos_b >= len(line_b):
+            break
+        windows.append((max(pos_a - CONTEXT_LEN, 0), max(pos_b - CONTEXT_LEN, 0)))
+
+        # Differences in the rest of the window are shown with this one
+        pos_a += WINDOW_LEN - CONTEXT_LEN
+        pos_b = resync(line_a, line_b, pos_a, pos_b + WINDOW_LEN - CONTEXT_LEN)
+    return windows if len(windows) > 0 else [(0, 0)]
+
+
+def window(text: str, start: int) -> str:
+    """
+    Gets the part of a line to show in the table. Short lines are returned as they are.
+    :param text: full line
+    :param start: position of the first character to show
+    :return: display text, with an ellipsis on either end that has been cut off
+    """
+    if not is_long(text):
+        return text
+
+    start = min(max(start, 0), len(text) - WINDOW_LEN)
+    end = start + WINDOW_LEN
+    prefix = ELLIPSIS if start > 0 else ""
+    suffix = ELLIPSIS if end < len(text) else ""
+    return prefix + text[start:end] + suffix
@@ -23,9 +23,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 use_cython = False
+cython_available = False
 
 try:
     from cython_accelerator import lcs_cython
+    cython_available = True
 except ImportError:
     use_cython = False
 
@@ -38,7 +40,7 @@ def mat_print(mat):
         print(row)
 
 
-def longest_common_subsequence2(left_set, right_set):
+def longest_common_subsequence2(left_set, right_set, max_edits=None):
     left_set_size = len(left_set)
     right_set_size = len(right_set)
     total_size = left_set_size + right_set_size
@@ -48,6 +50,9 @@ def longest_common_subsequence2(left_set, right_set):
     outp = [[], []]
 
     for d in range(total_size + 1):
+        # Give up once the sets differ by more lines than the caller is willing to pay for
+        if max_edits is not None and d > max_edits:
+            return None
         for k in range(-d, d + 1, 2):
             if k == -d or (
                 k != d and bounded_array[total_size + k - 1] < bounded_array[total_size + k + 1]
@@ -102,8 +107,28 @@ def pad_raw_line_matches(match_list, file_length_max):
     return outp_list
 
 
-def padded_lcs(right_set, left_set, file_length_max):
-    if use_cython:
+# Names of the LCS implementations padded_lcs can use. "auto" picks the default set by use_cython
+ENGINES = ("auto", "myers", "cython")
+
+
+# Raises ValueError if engine isn't one of ENGINES, or is "cython" and the Cython implementation hasn't
+# been built. None is the same as "auto"
+def check_engine(engine):
+    if engine is not None and engine not in ENGINES:
+        raise ValueError(f"Unknown diff engine '{engine}', expected one of {', '.join(ENGINES)}")
+    if engine == "cython" and not cython_available:
+        raise ValueError("The cython diff engine hasn't been built")
+
+
+# engine is "myers" for the Python implementation, "cython" for the Cython one, or None or "auto" for the
+# default set by use_cython. See check_engine for the engines that raise ValueError
+def padded_lcs(right_set, left_set, file_length_max, engine=None):
+    check_engine(engine)
+    if engine is None or engine == "auto":
+        cython = use_cython
+    else:
+        cython = engine == "cython"
+    if cython:
         outp = lcs_cython.padded_lcs(right_set, left_set, myers=USE_MYERS_DIFF)
         return outp
     else:
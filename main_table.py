@@ -22,11 +22,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 ###########################################################################
 """
 
+import bisect
+import functools
 import os
 
 from PyQt5 import QtGui
 from PyQt5 import QtWidgets
-from PyQt5.QtCore import pyqtSlot, Qt
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt, QTimer
 from PyQt5.QtWidgets import (
     QHeaderView,
     QWidget,
@@ -35,30 +37,48 @@ from PyQt5.QtWidgets import (
     QGridLayout,
     QApplication,
     QPushButton,
-    QMessageBox
+    QMessageBox,
+    QScrollBar,
 )
 
+import diff_minimap
+import diff_worker
 import file_io
 # Project imports
 import gui_config as gui_cfg
+import hunks
+import intraline_delegate
+import long_lines
+import merge_button_delegate
 import merge_finalizer
 import pymerge_enums
+import row_store
+import save_job
+import splice_writer
 import table_row
 import undo_redo
 import utilities
 
 class MainTable(QWidget):
+    FOLD_CONTEXT = 3  # Unchanged lines shown around each block of differences in the folded view
+    unresolved_changed = pyqtSignal(int)  # Number of blocks of differences that haven't been fully merged
+    save_progress = pyqtSignal(int, int)  # Save steps finished and total number of steps
+    save_finished = pyqtSignal(object)    # merge_finalizer.Status value
+
     def __init__(self, change_set_a, change_set_b):
         """
         Initialize the MainTable class
         """
         super().__init__()
 
+        # Row instances indexed by line number. Lines inside a fold are None until the fold is expanded
         self.rows: list = []
+        self.shown_lines: list = []  # Sorted line numbers of the rows that have been created
         grid = QGridLayout()
         self.setLayout(grid)
         self.table = QTableWidget()
-        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        # Shift-click selects a range of rows, so several blocks of differences can be merged at once
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.ContiguousSelection)
         self.file_dropped = ""
         self.table.setRowCount(0)  # Set the initial row count to 0
         self.table.setColumnCount(5)  # Set the column count to 5
@@ -68,18 +88,36 @@ class MainTable(QWidget):
         # List containing indices of all diff rows. This is used for jump to diff functions
         self.diff_indices: list = []
         self.diff_index_block_end: list = []
+        self.diff_block_types: list = []   # Change type of the first line of each block, for the minimap
+        self.diff_block_merged: list = []  # True once every line in the block has been merged
+        self.unresolved_count: int = 0     # Number of False entries in diff_block_merged
+        self.shown_unresolved: int = -1    # Count last sent out by unresolved_changed
+        self.dirty_blocks: set = set()     # Blocks with merges that haven't been checked yet
         # Contains the index of the current diff that has been jumped to
         self.curr_diff_idx: int = -1
         self.selected_block: list = [0, 0]
-        self.block_undo_size: list = []
-        self.block_redo_size: list = []
 
         self.table.cellClicked.connect(self.cellClickedEvent)
         
         self.change_set_a = change_set_a
         self.change_set_b = change_set_b
+        self.store = row_store.RowStore(change_set_a, change_set_b)  # Text and merge state of every line
         self.left_file: str = ""
         self.right_file: str = ""
+        self.diff_worker = None  # Background diff for progressively loaded files
+        self.save_job = None     # Background save of both files
+
+        # Folded view. Each fold is a run of unchanged lines [start, end) shown as one placeholder table row
+        self.fold_context: int = -1  # -1 shows every line
+        self.fold_builder = hunks.FoldBuilder(self.fold_context)
+        self.fold_starts: list = []
+        self.fold_ends: list = []
+        self.fold_rows: list = []
+
+        # Lines too long to put in the table in full, see long_lines.py
+        self.long_line_nums: list = []  # Sorted line numbers of the long lines
+        self.long_line_max: int = 0     # Length of the longest line
+        self.long_anchor_max: int = 0   # Furthest window anchor, the scroll bar goes this far below 0
 
         self.table.verticalHeader().setVisible(
             False
@@ -122,12 +160,33 @@ class MainTable(QWidget):
         # Make the table read only for the user
         self.table.setEditTriggers(QTableWidget.NoEditTriggers)
 
+        # Highlight the parts of changed lines that are different
+        self.intraline_delegate = intraline_delegate.IntralineDelegate(self)
+        self.table.setItemDelegateForColumn(gui_cfg.LEFT_TXT_COL_IDX, self.intraline_delegate)
+        self.table.setItemDelegateForColumn(gui_cfg.RIGHT_TXT_COL_IDX, self.intraline_delegate)
+
+        # Merge buttons are painted rather than being a widget in every changed row
+        self.merge_button_delegate = merge_button_delegate.MergeButtonDelegate(self)
+        self.table.setItemDelegateForColumn(merge_button_delegate.MERGE_RIGHT_COL_IDX, self.merge_button_delegate)
+        self.table.setItemDelegateForColumn(merge_button_delegate.MERGE_LEFT_COL_IDX, self.merge_button_delegate)
+
         # Convert icon paths from gui_config.py to QIcon objects
         # gui_cgf.converted ensures test software can run correctly
         if not gui_cfg.converted:
             gui_cfg.convert_icon_dict()
 
-        grid.addWidget(self.table)
+        grid.addWidget(self.table, 0, 0)
+
+        # Scrolls the text of long lines, only shown when there are long lines
+        self.line_scroll = QScrollBar(Qt.Horizontal)
+        self.line_scroll.setToolTip("scroll long lines")
+        self.line_scroll.setSingleStep(long_lines.WINDOW_LEN // 10)
+        self.line_scroll.setPageStep(long_lines.WINDOW_LEN)
+        self.line_scroll.valueChanged.connect(self.set_long_line_offset)
+        self.line_scroll.hide()
+        grid.addWidget(self.line_scroll, 1, 0)
+        self.minimap = diff_minimap.DiffMinimap(self)
+        grid.addWidget(self.minimap, 0, 1)
     
     def set_tbl_fonts_and_colors(self):
         """
@@ -222,6 +281,14 @@ class MainTable(QWidget):
                 # I use a local instance of fileIO to generate changesets, since
                 # main_table can't access the main window instance of fileIO
                 self.file_io = file_io.FileIO()
+
+                # Large files are diffed in the background and streamed into the table
+                if self.file_io.progressive_load(self.file_dropped, fileB):
+                    if self.file_io.check_files(self.file_dropped, fileB) == pymerge_enums.RESULT.GOOD:
+                        self.load_table_contents_progressive(self.file_dropped, fileB)
+                    self.file_dropped = ""
+                    return
+
                 result = self.file_io.diff_files(self.file_dropped, fileB)
                 if result == pymerge_enums.RESULT.GOOD:
                     result = result = self.file_io.get_change_sets(self.file_io.changes_a, self.file_io.changes_b)
@@ -250,10 +317,12 @@ class MainTable(QWidget):
         Scrolls the table window to the next difference incrementally (starts at the first diff)
         :return: No return value
         """        
-        if len(self.diff_indices) == 0:
+        # Only blocks that have been fully loaded can be jumped to
+        hunk_count = len(self.diff_index_block_end)
+        if hunk_count == 0:
             return
 
-        if self.curr_diff_idx == len(self.diff_indices) - 1:
+        if self.curr_diff_idx >= hunk_count - 1:
             self.curr_diff_idx = 0
             self.jump_to_line(self.diff_indices[self.curr_diff_idx])
         else:
@@ -263,17 +332,31 @@ class MainTable(QWidget):
         self.select_block()
         return
 
+    def goto_diff(self, block_idx: int):
+        """
+        Scrolls the table window to a block of differences and selects it
+        :param block_idx: index into the block lists
+        :return: No return value
+        """
+        if block_idx < 0 or block_idx >= len(self.diff_index_block_end):
+            return
+        self.curr_diff_idx = block_idx
+        self.jump_to_line(self.diff_indices[block_idx])
+        self.select_block()
+        self.table.repaint()
+
     @pyqtSlot()
     def goto_prev_diff(self):
         """
         Scrolls the table window to the previous difference incrementally
         :return: No return value
         """
-        if len(self.diff_indices) == 0:
+        hunk_count = len(self.diff_index_block_end)
+        if hunk_count == 0:
             return
 
         if self.curr_diff_idx == 0 or self.curr_diff_idx == -1:
-            self.curr_diff_idx = len(self.diff_indices) - 1
+            self.curr_diff_idx = hunk_count - 1
             self.jump_to_line(self.diff_indices[self.curr_diff_idx])
         else:
             self.curr_diff_idx -= 1
@@ -289,26 +372,7 @@ class MainTable(QWidget):
         undoes last change or group of changes
         :return: No return value
         """
-        undo_stack_size = 0
-        for n in self.block_undo_size:
-            undo_stack_size += n
-        
-        difference = self.undo_ctrlr.undo_buf_size - undo_stack_size
-        for i in range(difference):            
-            self.block_undo_size.append(1)
-        
-        if len(self.block_undo_size) != 0:
-            n = self.block_undo_size.pop()
-            self.block_redo_size.append(n)
-            for i in range(n):            
-                self.undo_ctrlr.undo()
-                self.undo_ctrlr.undo_buf_size -= 1
-        else:
-            self.undo_ctrlr.undo()
-            if self.undo_ctrlr.undo_buf_size != 0:
-                self.undo_ctrlr.undo_buf_size -= 1
-        for row in self.rows:
-            row.set_row_state()
+        self.refresh_transaction(self.undo_ctrlr.undo())
 
     @pyqtSlot()
     def redo_last_undo(self):
@@ -316,67 +380,162 @@ class MainTable(QWidget):
         redo last undo performed
         :return: No return value
         """
-        if len(self.block_redo_size) != 0:
-            n = self.block_redo_size.pop()
-            self.block_undo_size.append(n)
-            for i in range(n):
-                self.undo_ctrlr.redo()
-        else:
-            self.undo_ctrlr.redo()
-        for row in self.rows:
-            row.set_row_state()
+        self.refresh_transaction(self.undo_ctrlr.redo())
+
+    def refresh_transaction(self, transaction):
+        """
+        Show the lines touched by an undone or redone transaction.
+        :param transaction: undo_redo.Transaction or None if nothing was undone or redone
+        :return: No return value
+        """
+        if transaction is None:
+            return
+        for start, end in transaction.spans(self.store):
+            self.refresh_lines(start, end)
+            self.update_merged_blocks(start, end)
+        self.table.viewport().update()
 
     @pyqtSlot()
     def merge_left(self):
         """
         merge the whole left selection into the right
         """
-        
-        self.table.clearSelection()
-        for n in range(self.selected_block[0], self.selected_block[1]):
-            self.rows[n].merge_left()
-        
-        self.block_undo_size.append(self.selected_block[1] - self.selected_block[0])
-                
-        undo_stack_size = 0
-        for n in self.block_undo_size:
-            undo_stack_size += n
-        
-        difference = undo_stack_size - self.undo_ctrlr.undo_buf_size
-        difference = abs(difference)
-        for i in range(difference):
-            self.block_undo_size.insert( len(self.block_undo_size)-1, 1)
-
-        return
+        self.merge_lines(self.selected_block[0], self.selected_block[1], row_store.MERGED_LEFT)
 
     @pyqtSlot()
     def merge_right(self):
         """
         merge the whole right selection into the left
         """
+        self.merge_lines(self.selected_block[0], self.selected_block[1], row_store.MERGED_RIGHT)
+
+    @pyqtSlot()
+    def merge_all_left(self):
+        """
+        merge every block of differences from the left into the right
+        """
+        self.merge_lines(0, len(self.rows), row_store.MERGED_LEFT)
+
+    @pyqtSlot()
+    def merge_all_right(self):
+        """
+        merge every block of differences from the right into the left
+        """
+        self.merge_lines(0, len(self.rows), row_store.MERGED_RIGHT)
+
+    @pyqtSlot()
+    def merge_selection_left(self):
+        """
+        merge every block of differences in the selected rows from the left into the right
+        """
+        start, end = self.get_selected_span()
+        self.merge_lines(start, end, row_store.MERGED_LEFT)
+
+    @pyqtSlot()
+    def merge_selection_right(self):
+        """
+        merge every block of differences in the selected rows from the right into the left
+        """
+        start, end = self.get_selected_span()
+        self.merge_lines(start, end, row_store.MERGED_RIGHT)
+
+    def merge_lines(self, start: int, end: int, state: int):
+        """
+        Merge every changed line in the range [start, end) as a single change, which is undone in one step.
+        :param start: first line to merge
+        :param end: line to stop at
+        :param state: row_store.MERGED_LEFT or row_store.MERGED_RIGHT
+        :return: No return value
+        """
+        if start >= end:
+            return
+
         self.table.clearSelection()
-        for n in range(self.selected_block[0], self.selected_block[1]):
-            self.rows[n].merge_right()
+        self.undo_ctrlr.begin()
+        self.undo_ctrlr.record_action(self.store, start, self.store.merge_span(start, end, state))
+        self.undo_ctrlr.commit()
+        self.refresh_lines(start, end)
+        self.update_merged_blocks(start, end)
 
-        self.block_undo_size.append(self.selected_block[1] - self.selected_block[0])
-        
-        undo_stack_size = 0
-        for n in self.block_undo_size:
-            undo_stack_size += n
-
-        difference = undo_stack_size - self.undo_ctrlr.undo_buf_size
-        difference = abs(difference)
-        for i in range(difference):
-            self.block_undo_size.insert( len(self.block_undo_size)-1, 1)
-        
-        return
+    def refresh_lines(self, start: int, end: int):
+        """
+        Show the current merge state of the changed lines in the range [start, end).
+        Unchanged lines can't be merged so they are skipped.
+        :param start: first line to refresh
+        :param end: line to stop at
+        :return: No return value
+        """
+        hunk_ranges = self.get_hunk_ranges()
+        first = bisect.bisect_right(self.diff_index_block_end, start)
+
+        self.begin_row_update()
+        for block_start, block_end in hunk_ranges[first:]:
+            if block_start >= end:
+                break
+            for n in range(max(block_start, start), min(block_end, end)):
+                self.rows[n].set_row_state()
+        self.end_row_update()
+
+    def get_selected_span(self) -> tuple:
+        """
+        Gets the lines of the blocks of differences that are at least partly selected.
+        :return: tuple of (first line, line after the last line), empty if no blocks are selected
+        """
+        tbl_ranges = self.table.selectedRanges()
+        block_count = len(self.diff_index_block_end)
+        if len(tbl_ranges) == 0 or block_count == 0:
+            return 0, 0
+
+        start = self.line_of_row(min(tbl_range.topRow() for tbl_range in tbl_ranges))
+        end = self.line_of_row(max(tbl_range.bottomRow() for tbl_range in tbl_ranges)) + 1
+
+        # Widen the selection to whole blocks
+        first = bisect.bisect_right(self.diff_index_block_end, start)
+        last = min(bisect.bisect_left(self.diff_indices, end) - 1, block_count - 1)
+        if first > last:
+            return 0, 0
+        return self.diff_indices[first], self.diff_index_block_end[last]
 
     def jump_to_line(self, line_num, col=0):
         self.table.clearSelection()
         self.table.scrollToItem(
-            self.table.item(line_num-1, col), QtWidgets.QAbstractItemView.PositionAtTop
+            self.table.item(self.table_row_of(line_num) - 1, col), QtWidgets.QAbstractItemView.PositionAtTop
         )
-        
+
+    def table_row_of(self, line_num: int) -> int:
+        """
+        Gets the table row showing a line. Lines inside a fold are shown by the fold's placeholder row.
+        :param line_num: line number (index into self.rows)
+        :return: table row index
+        """
+        if self.rows[line_num] is not None:
+            return self.rows[line_num].row_num
+        return self.fold_rows[bisect.bisect_right(self.fold_starts, line_num) - 1]
+
+    def line_of_row(self, tbl_row: int) -> int:
+        """
+        Gets the first line shown by a table row, including fold placeholders.
+        :param tbl_row: table row index
+        :return: line number
+        """
+        line_num = self.line_at(tbl_row)
+        if line_num == -1:
+            return self.fold_starts[bisect.bisect_left(self.fold_rows, tbl_row)]
+        return line_num
+
+    def line_at(self, tbl_row: int) -> int:
+        """
+        Gets the line number shown in a table row.
+        :param tbl_row: table row index
+        :return: line number, or -1 if the table row is a fold placeholder
+        """
+        fold_idx = bisect.bisect_right(self.fold_rows, tbl_row) - 1
+        if fold_idx < 0:
+            return tbl_row
+        if self.fold_rows[fold_idx] == tbl_row:
+            return -1
+        return self.fold_ends[fold_idx] + tbl_row - self.fold_rows[fold_idx] - 1
+
     def add_line(
         self,
         right_text: str,
@@ -385,6 +544,8 @@ class MainTable(QWidget):
         change_flags,
         left_line_num=0,
         right_line_num=0,
+        tbl_row=-1,
+        insert_row=True,
     ):
         """
         Add a row into the table using the right and left text provided as parameters.
@@ -394,41 +555,272 @@ class MainTable(QWidget):
         :param left_text: Left text to display
         :param line_num: Line number to display. This isn't exactly where it's inserted, just a display value
         :param change_flags:
+        :param tbl_row: Table row to insert at. Defaults to the end of the table
+        :param insert_row: False if an empty table row has already been inserted for the line
         :return: No return value
 
         """
-        self.table.insertRow(line_num)
-        self.table.setRowHeight(line_num, 28)
-        self.table.setItem(line_num, 0, QTableWidgetItem(str(line_num + 1)))
-        self.table.setItem(line_num, 1, QTableWidgetItem(str(right_text)))
-        self.table.setItem(line_num, 2, QTableWidgetItem(""))
-        self.table.setItem(line_num, 3, QTableWidgetItem(""))
-        self.table.setItem(line_num, 4, QTableWidgetItem(str(left_text)))
-
-        self.table.item(line_num, 0).setTextAlignment(Qt.AlignCenter)
-        self.table.item(line_num, 2).setTextAlignment(Qt.AlignCenter)
-        self.table.item(line_num, 3).setTextAlignment(Qt.AlignCenter)
-
-        self.table.item(line_num, 0).setBackground(
+        if tbl_row == -1:
+            tbl_row = self.table.rowCount()
+
+        # Only part of a long line goes into the table, starting just before where a changed line first differs
+        windows = [(0, 0)]
+        long_line = long_lines.is_long(right_text) or long_lines.is_long(left_text)
+        if long_line:
+            windows = long_lines.diff_windows(right_text, left_text)
+            right_display = long_lines.window(right_text, windows[0][0] + self.line_scroll.value())
+            left_display = long_lines.window(left_text, windows[0][1] + self.line_scroll.value())
+        else:
+            right_display = right_text
+            left_display = left_text
+
+        if insert_row:
+            self.table.insertRow(tbl_row)
+        self.table.setRowHeight(tbl_row, 28)
+        self.table.setItem(tbl_row, 0, QTableWidgetItem(str(line_num + 1)))
+        self.table.setItem(tbl_row, 1, QTableWidgetItem(str(right_display)))
+        self.table.setItem(tbl_row, 2, QTableWidgetItem(""))
+        self.table.setItem(tbl_row, 3, QTableWidgetItem(""))
+        self.table.setItem(tbl_row, 4, QTableWidgetItem(str(left_display)))
+
+        self.table.item(tbl_row, 0).setTextAlignment(Qt.AlignCenter)
+        self.table.item(tbl_row, 2).setTextAlignment(Qt.AlignCenter)
+        self.table.item(tbl_row, 3).setTextAlignment(Qt.AlignCenter)
+
+        self.table.item(tbl_row, 0).setBackground(
             gui_cfg.COLORS["TBL_LINE_COL_DEFAULT_BG"]
         )
-        self.table.item(line_num, 2).setBackground(
+        self.table.item(tbl_row, 2).setBackground(
             gui_cfg.COLORS["TBL_LINE_COL_DEFAULT_BG"]
         )
-        self.table.item(line_num, 3).setBackground(
+        self.table.item(tbl_row, 3).setBackground(
             gui_cfg.COLORS["TBL_LINE_COL_DEFAULT_BG"]
         )
-        self.table.item(line_num, 4).setBackground(
+        self.table.item(tbl_row, 4).setBackground(
             gui_cfg.COLORS["TBL_LINE_COL_DEFAULT_BG"]
         )
 
         row_instance = table_row.Row(
-            line_num, self.table, right_text, left_text, line_num, change_flags
+            tbl_row, self.table, self.store, line_num, change_flags
         )
         row_instance.actual_indices[0] = left_line_num
         row_instance.actual_indices[1] = right_line_num
-        
-        self.rows.append(row_instance)
+        row_instance.windows = windows
+        row_instance.window_offset = self.line_scroll.value()
+        row_instance.merged.connect(self.row_merged)
+        if long_line:
+            self.add_long_line(line_num, max(len(right_text), len(left_text)), max(max(window) for window in windows))
+
+        # Lines are added in order while loading. Lines from an expanded fold replace the placeholders.
+        if line_num == len(self.rows):
+            self.rows.append(row_instance)
+            self.shown_lines.append(line_num)
+        else:
+            self.rows[line_num] = row_instance
+
+    def add_long_line(self, line_num: int, length: int, window_anchor: int = 0):
+        """
+        Record a long line so it is updated when the long line scroll bar moves.
+        :param line_num: line number
+        :param length: length of the longer side of the line
+        :param window_anchor: furthest position the line is shown from when the scroll bar is at 0
+        :return: No return value
+        """
+        # Long lines inside folds are added again when the fold is expanded
+        idx = bisect.bisect_left(self.long_line_nums, line_num)
+        if idx == len(self.long_line_nums) or self.long_line_nums[idx] != line_num:
+            self.long_line_nums.insert(idx, line_num)
+
+        if length > self.long_line_max:
+            self.long_line_max = length
+            self.line_scroll.setMaximum(length - long_lines.WINDOW_LEN)
+            self.line_scroll.show()
+        # Lines shown from an anchor can be scrolled back to their start
+        if window_anchor > self.long_anchor_max:
+            self.long_anchor_max = window_anchor
+            self.line_scroll.setMinimum(-window_anchor)
+
+    @pyqtSlot(int)
+    def set_long_line_offset(self, offset: int):
+        """
+        Move the part of each long line that is shown. Only the long lines are touched.
+        :param offset: number of characters to scroll by
+        :return: No return value
+        """
+        for n in self.long_line_nums:
+            row = self.rows[n]
+            if row is None:
+                continue
+            row.window_offset = offset
+            row.refresh_text()
+
+    def goto_next_line_window(self):
+        """
+        Shows the next differing part of the selected long line.
+        :return: No return value
+        """
+        self.step_line_window(1)
+
+    def goto_prev_line_window(self):
+        """
+        Shows the previous differing part of the selected long line.
+        :return: No return value
+        """
+        self.step_line_window(-1)
+
+    def step_line_window(self, step: int):
+        """
+        Steps the selected long line through the windows that hold its differences, see long_lines.diff_windows.
+        :param step: 1 for the next window, -1 for the previous one
+        :return: No return value
+        """
+        line_num = self.line_at(self.table.currentRow())
+        if line_num < 0 or line_num >= len(self.rows) or self.rows[line_num] is None:
+            return
+        self.rows[line_num].step_window(step)
+
+    def add_fold(self, start: int, end: int, tbl_row=-1):
+        """
+        Add a placeholder row that stands in for a run of unchanged lines. The lines are only added
+        to the table when the fold is expanded.
+        :param start: first line in the fold
+        :param end: line after the last line in the fold
+        :param tbl_row: Table row to insert at. Defaults to the end of the table
+        :return: No return value
+        """
+        if tbl_row == -1:
+            tbl_row = self.table.rowCount()
+
+        self.table.insertRow(tbl_row)
+        self.table.setRowHeight(tbl_row, 28)
+        self.table.setItem(tbl_row, 0, QTableWidgetItem("..."))
+        self.table.setItem(tbl_row, 2, QTableWidgetItem(""))
+        self.table.setItem(tbl_row, 3, QTableWidgetItem(""))
+        for col in (gui_cfg.LEFT_TXT_COL_IDX, gui_cfg.RIGHT_TXT_COL_IDX):
+            self.table.setItem(
+                tbl_row, col, QTableWidgetItem(f"... {end - start} unchanged lines (click to show) ...")
+            )
+        for col in range(5):
+            self.table.item(tbl_row, col).setTextAlignment(Qt.AlignCenter)
+            self.table.item(tbl_row, col).setBackground(gui_cfg.COLORS["ROW_FOLD"])
+
+        fold_idx = bisect.bisect_left(self.fold_starts, start)
+        self.fold_starts.insert(fold_idx, start)
+        self.fold_ends.insert(fold_idx, end)
+        self.fold_rows.insert(fold_idx, tbl_row)
+        if end > len(self.rows):
+            self.rows.extend([None] * (end - len(self.rows)))
+
+    def show_lines(self, ranges: list):
+        """
+        Add the ranges produced by hunks.FoldBuilder to the end of the table.
+        :param ranges: list of (start, end, folded) line ranges
+        :return: No return value
+        """
+        for start, end, folded in ranges:
+            if folded:
+                self.add_fold(start, end)
+                continue
+            for n in range(start, end):
+                data_a = [""]
+                data_b = [""]
+                change_type_a = [pymerge_enums.CHANGEDENUM.SAME]
+                change_type_b = [pymerge_enums.CHANGEDENUM.SAME]
+                self.change_set_a.get_change(n, change_type_a, data_a)
+                self.change_set_b.get_change(n, change_type_b, data_b)
+
+                self.add_line(data_a[0], data_b[0], n, [change_type_a[0], change_type_b[0]])
+
+    def expand_folds(self, fold_indices: list):
+        """
+        Replace fold placeholders with the lines they stand in for.
+        :param fold_indices: indices into the fold lists
+        :return: No return value
+        """
+        self.begin_row_update()
+        # Work from the bottom up so the table rows of the remaining folds stay valid
+        for fold_idx in sorted(fold_indices, reverse=True):
+            start = self.fold_starts.pop(fold_idx)
+            end = self.fold_ends.pop(fold_idx)
+            tbl_row = self.fold_rows.pop(fold_idx)
+            self.table.removeRow(tbl_row)
+
+            # Insert the table rows in one go, inserting them one at a time moves every row below each time
+            self.table.model().insertRows(tbl_row, end - start)
+            for n in range(start, end):
+                data = [""]
+                change_type = [pymerge_enums.CHANGEDENUM.SAME]
+                self.change_set_a.get_change(n, change_type, data)
+                self.add_line(
+                    data[0], data[0], n, [change_type[0], change_type[0]],
+                    tbl_row=tbl_row + n - start, insert_row=False
+                )
+
+            insert_idx = bisect.bisect_left(self.shown_lines, start)
+            self.shown_lines[insert_idx:insert_idx] = range(start, end)
+        self.renumber_rows()
+        self.end_row_update()
+
+    def fold_unchanged(self, context: int):
+        """
+        Fold the runs of unchanged lines in a fully expanded table, using the block boundaries.
+        :param context: number of unchanged lines to keep around each block of differences
+        :return: No return value
+        """
+        row_count = len(self.rows)
+        folds = hunks.fold_ranges(self.diff_indices, self.diff_index_block_end, row_count, context)
+
+        self.begin_row_update()
+        for start, end in reversed(folds):
+            tbl_row = self.rows[start].row_num
+            self.table.model().removeRows(tbl_row, end - start)
+            self.rows[start:end] = [None] * (end - start)
+            self.add_fold(start, end, tbl_row)
+
+        # Drop the lines that were folded from the list of created rows
+        self.shown_lines = [n for n in self.shown_lines if self.rows[n] is not None]
+        self.renumber_rows()
+        self.end_row_update()
+
+    def renumber_rows(self):
+        """
+        Update the table row of every created row and fold placeholder after rows have been added or removed.
+        :return: No return value
+        """
+        tbl_row = 0
+        fold_idx = 0
+        fold_count = len(self.fold_starts)
+
+        for n in self.shown_lines:
+            while fold_idx < fold_count and self.fold_starts[fold_idx] < n:
+                self.fold_rows[fold_idx] = tbl_row
+                tbl_row += 1
+                fold_idx += 1
+            self.rows[n].row_num = tbl_row
+            tbl_row += 1
+
+        while fold_idx < fold_count:
+            self.fold_rows[fold_idx] = tbl_row
+            tbl_row += 1
+            fold_idx += 1
+
+    def set_fold_context(self, context: int):
+        """
+        Switch between the folded and the full view. Only unchanged lines are removed or added, so
+        merges that have already been made are kept.
+        :param context: number of unchanged lines to keep around each block of differences, -1 to show every line
+        :return: No return value
+        """
+        self.fold_context = context
+
+        # A load that is still running keeps the view it was started with
+        if self.diff_worker is not None or len(self.rows) == 0:
+            return
+
+        if len(self.fold_starts) > 0:
+            self.expand_folds(list(range(len(self.fold_starts))))
+        if context >= 0:
+            self.fold_unchanged(context)
 
     def get_lines_from_tbl(self) -> list:
         """
@@ -438,36 +830,83 @@ class MainTable(QWidget):
         outp_left: list = []
         outp_right: list = []
 
-        for row in self.rows:
-            if row.row_deleted[1]:
+        # Folded lines are read from the store too, they are the same on both sides
+        for n in range(len(self.rows)):
+            if self.store.is_deleted(n):
                 outp_left.append(None)
-            else:
-                outp_left.append(row.left_text)
-            if row.row_deleted[0]:
                 outp_right.append(None)
             else:
-                outp_right.append(row.right_text)
+                outp_left.append(self.store.text_b(n))
+                outp_right.append(self.store.text_a(n))
 
         return [outp_left, outp_right]
 
+    def get_side_lines(self) -> tuple:
+        """
+        Gets the current text of every loaded line on both sides, including merges, without going
+        through the table items.
+        :return: tuple of (left hand lines, right hand lines)
+        """
+        line_count = len(self.rows)
+        lines_a = [change[2] for change in self.change_set_a.change_list[:line_count]]
+        lines_b = [change[2] for change in self.change_set_b.change_list[:line_count]]
+        for start, hunk_a, hunk_b in self.get_hunk_lines():
+            lines_a[start:start + len(hunk_a)] = hunk_a
+            lines_b[start:start + len(hunk_b)] = hunk_b
+        return lines_a, lines_b
+
+    def get_hunk_lines(self) -> list:
+        """
+        Gets the current text of the lines inside blocks of differences, including merges. Only these lines
+        can have been merged, and they are never folded.
+        :return: list of (first line, left hand lines, right hand lines) for each block
+        """
+        return [
+            (start, [self.rows[n].right_text for n in range(start, end)],
+             [self.rows[n].left_text for n in range(start, end)])
+            for start, end in self.get_hunk_ranges()
+        ]
+
+    def get_hunk_ranges(self) -> list:
+        """
+        Gets the loaded lines of every block of differences.
+        :return: list of (start, end) line ranges
+        """
+        ranges = list(zip(self.diff_indices, self.diff_index_block_end))
+        # The last block may still be loading
+        if len(self.diff_indices) > len(self.diff_index_block_end):
+            ranges.append((self.diff_indices[-1], len(self.rows)))
+        return ranges
+
     def clear_table(self) -> bool:
-        for row in self.rows:
-            try:
-                self.table.removeRow(row.row_num)
-            except (IndexError, Exception):
-                print("Error: could not clear main table.")
-                return False
+        self.stop_diff_worker()
         self.rows.clear()
+        self.store.clear()
+        self.undo_ctrlr.clear()
+        self.shown_lines.clear()
+        self.fold_starts.clear()
+        self.fold_ends.clear()
+        self.fold_rows.clear()
+        self.long_line_nums.clear()
+        self.long_line_max = 0
+        self.long_anchor_max = 0
+        self.line_scroll.setValue(0)
+        self.line_scroll.setMinimum(0)
+        self.line_scroll.hide()
         self.table.setRowCount(0)
-        del self.change_set_a.change_list[:]
-        del self.change_set_b.change_list[:]
-        self.block_undo_size.clear()
-        self.block_redo_size.clear()
+        self.change_set_a.clear()
+        self.change_set_b.clear()
         self.curr_diff_idx = -1
         self.selected_block[0] = 0
         self.selected_block[1] = 0
         self.diff_indices.clear()
         self.diff_index_block_end.clear()
+        self.diff_block_types.clear()
+        self.diff_block_merged.clear()
+        self.unresolved_count = 0
+        self.dirty_blocks.clear()
+        self.minimap.refresh()
+        self.emit_unresolved()
         return True
 
     def load_table_contents(self, file1=0, file2=0):
@@ -480,50 +919,300 @@ class MainTable(QWidget):
         :return: No return value
         """
 
+        self.set_file_headers(file1, file2)
+
+        # Get the change information for each line. Skip the last line, as that is the
+        # match token that has been appened on by diff_set in order to capture entire file
+        # contents.
+        row_count = len(self.change_set_a.change_list) - 1
+        self.fold_builder = hunks.FoldBuilder(self.fold_context)
+        self.add_rows(0, row_count)
+        self.finish_rows(row_count)
+
+    def set_file_headers(self, file1: str, file2: str):
+        """
+        Show the file paths in the table header and remember them for saving.
+        :param file1: left hand file
+        :param file2: right hand file
+        :return: No return value
+        """
         self.table.horizontalHeaderItem(1).setText(os.path.abspath(file1))
         self.table.horizontalHeaderItem(4).setText(os.path.abspath(file2))
         self.left_file = file1
         self.right_file = file2
 
-        # Get the change information for each line. Skip the last line, as that is the
-        # match token that has been appened on by diff_set in order to capture entire file
-        # contents.
-        for n in range(len(self.change_set_a.change_list) - 1):
-            data_a = [""]
-            data_b = [""]
-            change_type_a = [pymerge_enums.CHANGEDENUM.SAME]
-            change_type_b = [pymerge_enums.CHANGEDENUM.SAME]
-            self.change_set_a.get_change(n, change_type_a, data_a)
-            self.change_set_b.get_change(n, change_type_b, data_b)
-
-            self.add_line(data_a[0], data_b[0], n, [change_type_a[0], change_type_b[0]])
-
-        # generate list of diff lines, to enable prev/next diff jump buttons
-        n = 0
-        while n < len(self.change_set_a.change_list) - 1:
-            data_a = [""]
-            change_type_a = [pymerge_enums.CHANGEDENUM.SAME]
-            self.change_set_a.get_change(n, change_type_a, data_a)
-            if change_type_a[0] != pymerge_enums.CHANGEDENUM.SAME:
+    def add_rows(self, start: int, end: int):
+        """
+        Add the rows in the range [start, end) of the change sets to the table, and record the
+        start and end of each block of differences for the prev/next diff jump buttons.
+        :param start: first change set index to add
+        :param end: change set index to stop at
+        :return: No return value
+        """
+        # This runs for every line of the file, so look everything up once
+        change_list_a = self.change_set_a.change_list
+        same_flag = pymerge_enums.CHANGEDENUM.SAME
+        fold_push = self.fold_builder.push
+        in_block = len(self.diff_indices) > len(self.diff_index_block_end)
+        self.store.extend(start, end)
+
+        self.begin_row_update()
+        for n in range(start, end):
+            same = change_list_a[n][1] == same_flag
+
+            if not same and not in_block:
                 self.diff_indices.append(n)
-                while change_type_a[0] != pymerge_enums.CHANGEDENUM.SAME:
-                    n += 1
-                    self.change_set_a.get_change(n, change_type_a, data_a)
+                self.diff_block_types.append(change_list_a[n][1])
+                self.diff_block_merged.append(False)
+                self.unresolved_count += 1
+                in_block = True
+            elif same and in_block:
                 self.diff_index_block_end.append(n)
-            n += 1
+                in_block = False
+
+            # In the folded view, runs of unchanged lines are held back until the next block of differences
+            ranges = fold_push(n, same)
+            if len(ranges) > 0:
+                self.show_lines(ranges)
+        self.end_row_update()
+        self.minimap.refresh()
+        self.emit_unresolved()
+
+    def finish_rows(self, row_count: int):
+        """
+        Called once every row has been passed to add_rows. Ends the last block of differences if the
+        file ended inside of it, and adds any unchanged lines that were held back for folding.
+        :param row_count: number of rows
+        :return: No return value
+        """
+        if len(self.diff_indices) > len(self.diff_index_block_end):
+            self.diff_index_block_end.append(row_count)
+
+        self.begin_row_update()
+        self.show_lines(self.fold_builder.finish(row_count))
+        self.end_row_update()
+        self.minimap.refresh()
+
+    def begin_row_update(self):
+        """
+        Rows repaint the table as they are created and the sized-to-contents columns are measured
+        again on every change, so hold both off while rows are added or removed.
+        :return: No return value
+        """
+        self.table.setUpdatesEnabled(False)
+        for col in (0, 2, 3):
+            self.table.horizontalHeader().setSectionResizeMode(col, QHeaderView.Fixed)
+
+    def end_row_update(self):
+        """
+        Resume the updates paused by begin_row_update.
+        :return: No return value
+        """
+        for col in (0, 2, 3):
+            self.table.horizontalHeader().setSectionResizeMode(col, QHeaderView.ResizeToContents)
+        self.table.setUpdatesEnabled(True)
+
+    def load_table_contents_progressive(self, file1: str, file2: str):
+        """
+        Diff two files on a worker thread and add the rows to the table as they are produced.
+        The top of the file is shown first and the table can be scrolled while the rest loads.
+        :param file1: left hand file
+        :param file2: right hand file
+        :return: No return value
+        """
+        self.stop_diff_worker()
+        self.set_file_headers(file1, file2)
+        self.fold_builder = hunks.FoldBuilder(self.fold_context)
+
+        self.diff_worker = diff_worker.DiffWorker(file1, file2, self)
+        self.diff_worker.rows_ready.connect(self.append_rows)
+        self.diff_worker.diff_finished.connect(self.finish_progressive_load)
+        self.diff_worker.finished.connect(self.diff_worker.deleteLater)
+        self.diff_worker.start()
+
+    def stop_diff_worker(self):
+        """
+        Stop a progressive load that is still running. Results that are still queued are ignored.
+        :return: No return value
+        """
+        if self.diff_worker is None:
+            return
+        self.diff_worker.rows_ready.disconnect(self.append_rows)
+        self.diff_worker.diff_finished.disconnect(self.finish_progressive_load)
+        self.diff_worker.requestInterruption()
+        self.diff_worker = None
+
+    @pyqtSlot(list)
+    def append_rows(self, rows: list):
+        """
+        Add a batch of rows produced by diff_worker.DiffWorker to the change sets and the table.
+        :param rows: list of row tuples, as yielded by diff_resolution.iter_diff
+        :return: No return value
+        """
+        start = len(self.change_set_a.change_list)
+        self.change_set_a.add_changes([(row[0], row[1], row[2]) for row in rows])
+        self.change_set_b.add_changes([(row[0], row[3], row[4]) for row in rows])
+        for row in rows:
+            if row[5] != -1:
+                self.change_set_a.add_file_line(row[0], row[5])
+                self.change_set_b.add_file_line(row[0], row[6])
+        self.add_rows(start, len(self.change_set_a.change_list))
+
+    @pyqtSlot(object)
+    def finish_progressive_load(self, result):
+        """
+        Called once diff_worker.DiffWorker has produced every row.
+        :param result: pymerge_enums.RESULT value returned by the diff
+        :return: No return value
+        """
+        self.diff_worker = None
+        row_count = len(self.change_set_a.change_list)
+
+        # Add the match token so the change sets look the same as ones created by diff_resolution.diff_set
+        self.change_set_a.add_change(row_count, pymerge_enums.CHANGEDENUM.SAME, "$")
+        self.change_set_b.add_change(row_count, pymerge_enums.CHANGEDENUM.SAME, "$")
+        self.finish_rows(row_count)
+
+        if result != pymerge_enums.RESULT.GOOD:
+            print("Error: the diff could not be completed.")
+
+    @pyqtSlot(int)
+    def row_merged(self, line_num: int):
+        """
+        Called when a line has been merged. Merging a whole block merges every line in it one at a
+        time, so the block is only checked once control returns to the event loop.
+        :param line_num: line that was merged
+        :return: No return value
+        """
+        block_idx = bisect.bisect_right(self.diff_indices, line_num) - 1
+        if block_idx < 0 or block_idx >= len(self.diff_index_block_end):
+            return
+        if len(self.dirty_blocks) == 0:
+            QTimer.singleShot(0, self.flush_merged_blocks)
+        self.dirty_blocks.add(block_idx)
+
+    def is_block_merged(self, block_idx: int) -> bool:
+        """
+        Checks if every line in a block of differences has been merged.
+        :param block_idx: index into the block lists
+        :return: boolean
+        """
+        return self.store.is_merged(self.diff_indices[block_idx], self.diff_index_block_end[block_idx])
+
+    @pyqtSlot()
+    def flush_merged_blocks(self):
+        """
+        Update the merged state of the blocks marked by row_merged and redraw them on the minimap.
+        :return: No return value
+        """
+        for block_idx in sorted(self.dirty_blocks):
+            # The table may have been cleared since the block was marked
+            if block_idx >= len(self.diff_index_block_end):
+                continue
+            if self.set_block_merged(block_idx, self.is_block_merged(block_idx)):
+                self.minimap.update_block(block_idx)
+        self.dirty_blocks.clear()
+        self.emit_unresolved()
+
+    def update_merged_blocks(self, start: int, end: int):
+        """
+        Check the merged state of the blocks overlapping the lines [start, end), after a change that can
+        touch any number of lines, and redraw the blocks that changed on the minimap.
+        :param start: first line that changed
+        :param end: line after the last line that changed
+        :return: No return value
+        """
+        first = bisect.bisect_right(self.diff_index_block_end, start)
+        last = bisect.bisect_left(self.diff_indices, end)
+        changed: list = []
+        for block_idx in range(first, min(last, len(self.diff_index_block_end))):
+            self.dirty_blocks.discard(block_idx)
+            if self.set_block_merged(block_idx, self.is_block_merged(block_idx)):
+                changed.append(block_idx)
+
+        # A change covering every line, such as merging all blocks, redraws the whole minimap once
+        if start <= 0 and end >= len(self.rows):
+            self.minimap.refresh()
+        else:
+            for block_idx in changed:
+                self.minimap.update_block(block_idx)
+        self.emit_unresolved()
+
+    def set_block_merged(self, block_idx: int, merged: bool) -> bool:
+        """
+        Set the merged state of a block and keep the count of unresolved blocks up to date.
+        :param block_idx: index into the block lists
+        :param merged: True if every line in the block has been merged
+        :return: True if the state changed
+        """
+        if self.diff_block_merged[block_idx] == merged:
+            return False
+        self.diff_block_merged[block_idx] = merged
+        self.unresolved_count += -1 if merged else 1
+        return True
+
+    def emit_unresolved(self):
+        """
+        Send out the number of unresolved blocks if it changed since it was last sent.
+        :return: No return value
+        """
+        if self.unresolved_count != self.shown_unresolved:
+            self.shown_unresolved = self.unresolved_count
+            self.unresolved_changed.emit(self.unresolved_count)
 
     @pyqtSlot()
     def write_merged_files(self):
-        merged_file_contents = self.get_lines_from_tbl()
+        """
+        Start saving both files in the background. save_progress and save_finished report how it went.
+        :return: No return value
+        """
+        if self.save_job is not None:
+            return
+
+        # Blocks merged a row at a time are only counted once control returns to the event loop
+        self.flush_merged_blocks()
+        sides_equal = self.store.sides_equal()
+        if not sides_equal:
+            print(
+                "Warning: Files are not identicle, %d conflicts remaining. Merge all lines before saving in order "
+                "for files to be 100%% syncronized." % self.unresolved_count
+            )
+
         merge_writer = merge_finalizer.MergeFinalizer(
             self.left_file, self.right_file, "file_backup"
         )
-        if not merge_writer.set_equal(merged_file_contents[0][:-1], merged_file_contents[1][:-1]):
-            print("Warning: Files are not identicle, merge all lines before saving in order for files to be 100% syncronized.")
-            
-        merge_writer.finalize_merge(
-            merged_file_contents[0][:-1], merged_file_contents[1][:-1]
-        )
+        status = merge_writer.check_save(sides_equal)
+        if status != merge_finalizer.Status.MERGE_FINALIZE_SUCCESS:
+            self.save_finished.emit(status)
+            return
+
+        # The files are written from a copy of the store, so merges made during the save don't end up in it.
+        # The lines are streamed from the copy, and the unchanged parts of each file are copied from the
+        # original where possible. Either way the last line only has a line ending if the original's did
+        store = self.store.snapshot()
+        line_count = len(self.rows)
+        files = [
+            (
+                file_name,
+                splice_writer.keep_final_newline(store.merged_lines(line_count, side_a=side_a), file_name),
+                functools.partial(splice_writer.write_spliced, store, line_count, side_a),
+            )
+            for file_name, side_a in ((self.left_file, True), (self.right_file, False))
+        ]
+        self.save_job = save_job.SaveJob(merge_writer, files, self)
+        self.save_job.progress.connect(self.save_progress)
+        self.save_job.save_finished.connect(self.finish_save)
+        self.save_job.start()
+
+    @pyqtSlot(object)
+    def finish_save(self, status):
+        """
+        Called once save_job.SaveJob has saved both files.
+        :param status: merge_finalizer.Status value
+        :return: No return value
+        """
+        self.save_job = None
+        self.save_finished.emit(status)
         
     def load_test_files(self, file1: str, file2: str):
         """
@@ -553,21 +1242,44 @@ class MainTable(QWidget):
                    self.curr_diff_idx = j 
                 j += 1
 
+        # The block containing the row may still be loading
+        if self.curr_diff_idx >= len(self.diff_index_block_end):
+            return
+
         self.table.setSelectionMode(QtWidgets.QAbstractItemView.MultiSelection)
         self.table.clearSelection()
         self.selected_block[0] = self.diff_indices[self.curr_diff_idx]
         self.selected_block[1] = self.diff_index_block_end[self.curr_diff_idx]
         for n in range(self.diff_indices[self.curr_diff_idx], self.diff_index_block_end[self.curr_diff_idx]):
-            self.table.selectRow(n)
+            self.table.selectRow(self.rows[n].row_num)
 
-        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.ContiguousSelection)
 
     @pyqtSlot()
     def cellClickedEvent(self):
-        if self.rows[self.table.currentRow()].change_state_flags[0] == pymerge_enums.CHANGEDENUM.SAME:
+        # Shift-click extends the selected range rather than selecting a block
+        if QApplication.keyboardModifiers() & Qt.ShiftModifier:
+            return
+        line_num = self.line_at(self.table.currentRow())
+
+        # Clicking a fold placeholder shows the lines it stands in for
+        if line_num == -1:
+            self.table.clearSelection()
+            self.expand_folds([bisect.bisect_left(self.fold_rows, self.table.currentRow())])
+        elif self.table.currentColumn() in (merge_button_delegate.MERGE_RIGHT_COL_IDX,
+                                            merge_button_delegate.MERGE_LEFT_COL_IDX) and \
+                self.rows[line_num].has_merge_buttons:
+            # Merge buttons are disabled once the row has been merged
+            if self.store.state[line_num] != row_store.UNMERGED:
+                self.table.clearSelection()
+            elif self.table.currentColumn() == merge_button_delegate.MERGE_RIGHT_COL_IDX:
+                self.rows[line_num].merge_right()
+            else:
+                self.rows[line_num].merge_left()
+        elif self.rows[line_num].change_state_flags[0] == pymerge_enums.CHANGEDENUM.SAME:
             self.table.clearSelection()
         else:
-            self.select_block(self.table.currentRow())
+            self.select_block(line_num)
         
  
  
@@ -35,9 +35,11 @@ from sys import platform
 from PyQt5.QtWidgets import *
 
 import control_buttons
+import diff_search
 import file_io
 import file_open_dialog
 import main_table
+import merge_finalizer
 import pymerge_enums
 import utilities
 
@@ -56,9 +58,15 @@ class MainWindow(QMainWindow, QMessageBox):
 
         # load files and generate changesets
         result = pymerge_enums.RESULT.ERROR
+        progressive = False
         self.fIO = file_io.FileIO()
         if fileA != 0 and fileB != 0:
-            result = self.fIO.diff_files(fileA, fileB)
+            # Large files are diffed in the background once the table exists
+            progressive = self.fIO.progressive_load(fileA, fileB)
+            if progressive:
+                result = self.fIO.check_progressive_load(fileA, fileB)
+            else:
+                result = self.fIO.diff_files(fileA, fileB)
             if result == pymerge_enums.RESULT.GOOD:
                 result = self.fIO.get_change_sets(self.fIO.changes_a, self.fIO.changes_b)
 
@@ -77,16 +85,58 @@ class MainWindow(QMainWindow, QMessageBox):
         
         # load table with fileA and B if present from command line
         if fileA != 0 and fileB != 0:
-            self.table_widget.load_table_contents(fileA, fileB)  # Left list arguments for now
+            if not progressive:
+                self.table_widget.load_table_contents(fileA, fileB)  # Left list arguments for now
+            elif self.fIO.check_files(fileA, fileB) == pymerge_enums.RESULT.GOOD:
+                self.table_widget.load_table_contents_progressive(fileA, fileB)
         self.table_widget.load_table_contents()  # Left list arguments for now
         
         self.control_buttons_widget = control_buttons.ControlButtons(self.table_widget)
         layout.addWidget(self.control_buttons_widget, 0, 0)
+        self.search_bar = diff_search.SearchBar(self.table_widget)
+        self.search_bar.hide()
+        layout.addWidget(self.search_bar, 2, 0)
         widget = QWidget()
         widget.setLayout(layout)
         self.setCentralWidget(widget)
+        # The conflict count stays in the corner of the status bar, save messages are shown next to it
+        self.unresolved_label = QLabel()
+        self.statusBar().addPermanentWidget(self.unresolved_label)
+        self.table_widget.unresolved_changed.connect(self.show_unresolved)
+        self.show_unresolved(self.table_widget.unresolved_count)
+        self.table_widget.save_progress.connect(self.show_save_progress)
+        self.table_widget.save_finished.connect(self.show_save_finished)
         self.init_ui()
 
+    def show_unresolved(self, count: int):
+        """
+        Show the number of blocks of differences that still need to be merged in the status bar.
+        :param count: number of unresolved blocks
+        :return: No return value
+        """
+        if count == 1:
+            self.unresolved_label.setText("1 conflict remaining")
+        else:
+            self.unresolved_label.setText("%d conflicts remaining" % count)
+
+    def show_save_progress(self, steps_done: int, steps: int):
+        self.statusBar().showMessage("Saving... (%d/%d)" % (steps_done, steps))
+
+    def show_save_finished(self, status):
+        """
+        Show the result of a save in the status bar.
+        :param status: merge_finalizer.Status value
+        :return: No return value
+        """
+        if status == merge_finalizer.Status.MERGE_FINALIZE_SUCCESS:
+            self.statusBar().showMessage("Files saved", 5000)
+        elif status == merge_finalizer.Status.FILE_PERMISSION_ERR:
+            self.statusBar().showMessage("Save failed: files are read only")
+        elif status == merge_finalizer.Status.BACKUP_ERROR:
+            self.statusBar().showMessage("Save failed: files could not be backed up")
+        else:
+            self.statusBar().showMessage("Save failed")
+
     def init_ui(self):
         # start GUI
 
@@ -95,6 +145,7 @@ class MainWindow(QMainWindow, QMessageBox):
 
     def open_file(self):
 
+        self.search_bar.reset()
         self.table_widget.clear_table()
 
         file_opener_a = file_open_dialog.FileOpenDialog()
@@ -106,8 +157,12 @@ class MainWindow(QMainWindow, QMessageBox):
         if file_a != "":
             file_opener_b.open_file_name_dialog("file B")
         file_b = file_opener_b.file_name
-        
-        result = self.fIO.diff_files(file_a, file_b)
+
+        progressive = self.fIO.progressive_load(file_a, file_b)
+        if progressive:
+            result = self.fIO.check_progressive_load(file_a, file_b)
+        else:
+            result = self.fIO.diff_files(file_a, file_b)
 
         if result == pymerge_enums.RESULT.GOOD:
             result = self.fIO.get_change_sets(self.fIO.changes_a, self.fIO.changes_b)
@@ -121,8 +176,10 @@ class MainWindow(QMainWindow, QMessageBox):
         elif result == pymerge_enums.RESULT.READONLYB:
             QMessageBox.about(self, "Warning ", os.path.basename(file_b) + " is read only")
 
-
-        self.table_widget.load_table_contents(file_a, file_b)
+        if not progressive:
+            self.table_widget.load_table_contents(file_a, file_b)
+        elif self.fIO.check_files(file_a, file_b) == pymerge_enums.RESULT.GOOD:
+            self.table_widget.load_table_contents_progressive(file_a, file_b)
         return result
 
     def menu_items(self):
@@ -155,6 +212,26 @@ class MainWindow(QMainWindow, QMessageBox):
         merge_right_btn.triggered.connect(self.table_widget.merge_right)
         edit_menu.addAction(merge_right_btn)
 
+        merge_sel_left_btn = QAction("Merge Selection Left", self)
+        #no shortcut
+        merge_sel_left_btn.triggered.connect(self.table_widget.merge_selection_left)
+        edit_menu.addAction(merge_sel_left_btn)
+
+        merge_sel_right_btn = QAction("Merge Selection Right", self)
+        #no shortcut
+        merge_sel_right_btn.triggered.connect(self.table_widget.merge_selection_right)
+        edit_menu.addAction(merge_sel_right_btn)
+
+        merge_all_left_btn = QAction("Merge All Left", self)
+        merge_all_left_btn.setShortcut('Ctrl+Shift+l')
+        merge_all_left_btn.triggered.connect(self.table_widget.merge_all_left)
+        edit_menu.addAction(merge_all_left_btn)
+
+        merge_all_right_btn = QAction("Merge All Right", self)
+        merge_all_right_btn.setShortcut('Ctrl+Shift+r')
+        merge_all_right_btn.triggered.connect(self.table_widget.merge_all_right)
+        edit_menu.addAction(merge_all_right_btn)
+
         prev_diff_btn = QAction("Previous Difference", self)
         prev_diff_btn.setShortcut('Ctrl+p')
         prev_diff_btn.triggered.connect(self.table_widget.goto_prev_diff)
@@ -165,6 +242,16 @@ class MainWindow(QMainWindow, QMessageBox):
         next_diff_btn.triggered.connect(self.table_widget.goto_next_diff)
         edit_menu.addAction(next_diff_btn)
 
+        next_line_diff_btn = QAction("Next Difference In Line", self)
+        next_line_diff_btn.setShortcut('Ctrl+Shift+n')
+        next_line_diff_btn.triggered.connect(self.table_widget.goto_next_line_window)
+        edit_menu.addAction(next_line_diff_btn)
+
+        prev_line_diff_btn = QAction("Previous Difference In Line", self)
+        prev_line_diff_btn.setShortcut('Ctrl+Shift+p')
+        prev_line_diff_btn.triggered.connect(self.table_widget.goto_prev_line_window)
+        edit_menu.addAction(prev_line_diff_btn)
+
         undo_change_btn = QAction("Undo", self)
         undo_change_btn.setShortcut('Ctrl+z')
         undo_change_btn.triggered.connect(self.table_widget.undo_last_change)
@@ -175,16 +262,43 @@ class MainWindow(QMainWindow, QMessageBox):
         redo_change_btn.triggered.connect(self.table_widget.redo_last_undo)
         edit_menu.addAction(redo_change_btn)
 
+        find_btn = QAction("Find", self)
+        find_btn.setShortcut('Ctrl+f')
+        find_btn.triggered.connect(lambda: self.search_bar.show_bar())
+        edit_menu.addAction(find_btn)
+
+        find_next_btn = QAction("Find Next", self)
+        find_next_btn.setShortcut('F3')
+        find_next_btn.triggered.connect(lambda: self.search_bar.find_next())
+        edit_menu.addAction(find_next_btn)
+
+        find_prev_btn = QAction("Find Previous", self)
+        find_prev_btn.setShortcut('Shift+F3')
+        find_prev_btn.triggered.connect(lambda: self.search_bar.find_prev())
+        edit_menu.addAction(find_prev_btn)
+
         hide_show_btns = QAction("Hide/Show Buttons", self)
         #no shortcut
         hide_show_btns.triggered.connect(lambda: self.hide_show_btns_func())
         view_menu.addAction(hide_show_btns)
 
+        fold_unchanged_btn = QAction("Fold Unchanged Lines", self)
+        fold_unchanged_btn.setCheckable(True)
+        #no shortcut
+        fold_unchanged_btn.triggered.connect(lambda checked: self.fold_unchanged_func(checked))
+        view_menu.addAction(fold_unchanged_btn)
+
         help_btn = QAction("Manual", self)
         #no shortcut
         help_btn.triggered.connect(lambda: self.open_help())
         help_menu.addAction(help_btn)
 
+    def fold_unchanged_func(self, checked: bool):
+        if checked:
+            self.table_widget.set_fold_context(main_table.MainTable.FOLD_CONTEXT)
+        else:
+            self.table_widget.set_fold_context(-1)
+
     def hide_show_btns_func(self):
         if self.control_buttons_widget.isVisible():
             self.control_buttons_widget.hide()
@@ -0,0 +1,86 @@
+"""
+###########################################################################
+File: merge_button_delegate.py
+Author:
+Description: Item delegate that paints the per row merge buttons of the main table.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+A QPushButton cell widget for every changed row makes every row insert and every merge
+of a large file move and repaint thousands of widgets. The buttons are painted instead, only for
+the rows on screen, and enabled or disabled from the merge state in the row store. Clicks are
+handled by MainTable.cellClickedEvent.
+"""
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtWidgets import QStyle, QStyledItemDelegate, QStyleOptionButton
+
+import gui_config as gui_cfg
+import row_store
+
+MERGE_RIGHT_COL_IDX = 2
+MERGE_LEFT_COL_IDX = 3
+BUTTON_WIDTH = 60
+
+
+class MergeButtonDelegate(QStyledItemDelegate):
+    def __init__(self, table_obj):
+        """
+        Initialize the MergeButtonDelegate class
+        :param table_obj: MainTable instance the delegate paints for
+        """
+        super().__init__(table_obj.table)
+        self.table_obj = table_obj
+
+    def get_row(self, index):
+        """
+        Gets the row shown in a table cell if it has merge buttons.
+        :param index: model index of the cell
+        :return: table_row.Row instance or None
+        """
+        line_num = self.table_obj.line_at(index.row())
+        if line_num == -1 or line_num >= len(self.table_obj.rows):
+            return None
+        row = self.table_obj.rows[line_num]
+        if row is None or not row.has_merge_buttons:
+            return None
+        return row
+
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        row = self.get_row(index)
+        if row is None:
+            return
+
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.state = QStyle.State_Raised
+        if self.table_obj.store.state[row.line_num] == row_store.UNMERGED:
+            button.state |= QStyle.State_Enabled
+        if index.column() == MERGE_RIGHT_COL_IDX:
+            button.icon = gui_cfg.ICONS["MERGE_RIGHT"]
+        else:
+            button.icon = gui_cfg.ICONS["MERGE_LEFT"]
+        button.iconSize = QSize(16, 16)
+        option.widget.style().drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        return QSize(max(size.width(), BUTTON_WIDTH), size.height())
@@ -23,14 +23,22 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import os
+import shutil
+import tempfile
 from enum import Enum, unique
 
-import file_backup
+import backup_store
 import utilities
 
 """
 Get data from table -> type checking -> deletions -> original file backup -> truncate file -> write data to file
 -> close file -> alert user (to be handled in frontend)
+
+Files are never truncated in place. The merged lines are written to a temporary file in the same directory,
+which is flushed to disk and then renamed over the original, so a crash part way through a save leaves either
+the old file or the new one. write_merge takes the lines as iterables, so they can be streamed from the row
+store without building a list of either file. A splice function, such as splice_writer.write_spliced, can
+write the temporary file from the original file instead, and the lines are only used if it can't.
 """
 
 
@@ -52,12 +60,21 @@ class Status(Enum):
     MERGE_FINALIZE_SUCCESS = 13
 
 
+# Keyword arguments for backup_store.BackupStore.prune, applied after each save
+BACKUP_RETENTION = {"keep_last": 20, "max_age_days": None, "max_size": None}
+# Compression of saved backups, one of backup_store.CODECS and a level from 1 to 9
+BACKUP_CODEC = "auto"
+BACKUP_LEVEL = 6
+
+
 class MergeFinalizer(object):
-    def __init__(self, outp_file_left: str, outp_file_right: str, backup_dir: str):
+    def __init__(self, outp_file_left: str, outp_file_right: str, backup_dir: str, retention: dict = None,
+                 codec: str = BACKUP_CODEC, level: int = BACKUP_LEVEL):
         self.outp_file_left: str = outp_file_left
         self.outp_file_right: str = outp_file_right
-        self.backup = file_backup.Backup()
+        self.backup = backup_store.BackupStore(backup_dir, delta=True, codec=codec, level=level)
         self.backup_dir = backup_dir
+        self.retention: dict = BACKUP_RETENTION if retention is None else retention
 
     @staticmethod
     def check_for_backup_dir():
@@ -121,25 +138,64 @@ class MergeFinalizer(object):
 
         :return:
         """
+        if self.backup_one(self.outp_file_left) != Status.BACKUP_SUCCESS:
+            return Status.BACKUP_ERROR
+        return self.backup_one(self.outp_file_right)
+
+    def backup_one(self, file_name: str) -> Status:
+        """
+        Back up a single file. Can be called from any thread.
+        :param file_name: file to back up
+        :return: enumerated Status value
+        """
+        try:
+            self.backup.backup(file_name)
+        except Exception as ex:
+            print(ex)
+            return Status.BACKUP_ERROR
+        return Status.BACKUP_SUCCESS
+
+    def prune_backups(self) -> Status:
+        """
+        Apply the retention policy to the backups. Mustn't run while files are being backed up.
+        :return: enumerated Status value
+        """
         try:
-            self.backup.create_backup(f"{self.outp_file_left}", self.backup_dir)
-            self.backup.create_backup(f"{self.outp_file_right}", self.backup_dir)
+            self.backup.prune(**self.retention)
         except Exception as ex:
             print(ex)
             return Status.BACKUP_ERROR
         return Status.BACKUP_SUCCESS
 
-    def finalize_merge(self, left_set: list or set, right_set: list or set) -> Status:
+    def check_save(self, sides_equal: bool) -> Status:
+        """
+        Checks that both files can be saved, before anything is backed up or written.
+        :param sides_equal: whether both files have the same contents
+        :return: enumerated Status value, MERGE_FINALIZE_SUCCESS if the files can be saved
+        """
+        if not sides_equal:
+            return Status.FILE_WRITE_ERROR
+
+        self.check_for_backup_dir()
+
+        if not utilities.file_writable(self.outp_file_left) or not utilities.file_writable(self.outp_file_right):
+            return Status.FILE_PERMISSION_ERR
+        return Status.MERGE_FINALIZE_SUCCESS
+
+    def finalize_merge(self, left_set: list or set, right_set: list or set, sides_equal: bool = None) -> Status:
         """
 
         :param left_set:
         :param right_set:
+        :param sides_equal: result of an equality check already made by the caller, the sets are compared if None
         :return:
         """
         outp_set_left: list = []
         outp_set_right: list = []
 
-        if not self.set_equal(left_set, right_set):
+        if sides_equal is None:
+            sides_equal = self.set_equal(left_set, right_set)
+        if not sides_equal:
             return Status.FILE_WRITE_ERROR
 
         self.check_for_backup_dir()
@@ -161,22 +217,74 @@ class MergeFinalizer(object):
 
         elif self.backup_file() != Status.BACKUP_SUCCESS:
             return Status.BACKUP_ERROR
-        else:
-            try:
-                with open(self.outp_file_left, "w") as file:
-                    for line in outp_set_left:
-                        file.write(line)
-                        if "\n" not in line:
-                            file.write("\n")
-            except (FileExistsError, FileNotFoundError):
-                return Status.FILE_WRITE_ERROR
+        elif (
+            self.write_file(self.outp_file_left, (line if "\n" in line else line + "\n" for line in outp_set_left))
+            != Status.FILE_WRITE_SUCCESS
+            or self.write_file(
+                self.outp_file_right, (line if "\n" in line else line + "\n" for line in outp_set_right)
+            )
+            != Status.FILE_WRITE_SUCCESS
+        ):
+            return Status.FILE_WRITE_ERROR
+
+        return Status.MERGE_FINALIZE_SUCCESS
+
+    def write_merge(self, left_lines, right_lines, sides_equal: bool, left_splice=None, right_splice=None) -> Status:
+        """
+        Back up both files and replace them with the merged lines.
+        :param left_lines: iterable of the lines of the left hand file, with line endings
+        :param right_lines: iterable of the lines of the right hand file, with line endings
+        :param sides_equal: whether both files have the same contents
+        :param left_splice: optional function that writes the left hand file by splicing, see write_file
+        :param right_splice: optional function that writes the right hand file by splicing, see write_file
+        :return: enumerated Status value
+        """
+        status = self.check_save(sides_equal)
+        if status != Status.MERGE_FINALIZE_SUCCESS:
+            return status
+        elif self.backup_file() != Status.BACKUP_SUCCESS:
+            return Status.BACKUP_ERROR
+        elif (
+            self.write_file(self.outp_file_left, left_lines, left_splice) != Status.FILE_WRITE_SUCCESS
+            or self.write_file(self.outp_file_right, right_lines, right_splice) != Status.FILE_WRITE_SUCCESS
+        ):
+            return Status.FILE_WRITE_ERROR
+        self.prune_backups()
+        return Status.MERGE_FINALIZE_SUCCESS
+
+    @staticmethod
+    def write_file(file_name: str, lines, splice=None) -> Status:
+        """
+        Write lines to a temporary file next to the output file, then rename it over the output file.
+        :param file_name: file to replace
+        :param lines: iterable of lines, with line endings
+        :param splice: optional function taking the output file name and the file descriptor of the empty temporary
+        file. It writes the file from the original and returns True, or returns False if the lines have to be used
+        :return: enumerated Status value
+        """
+        directory = os.path.dirname(os.path.abspath(file_name))
+        try:
+            fd, temp_name = tempfile.mkstemp(prefix="." + os.path.basename(file_name) + ".", dir=directory)
+        except OSError:
+            return Status.FILE_WRITE_ERROR
+
+        try:
+            with os.fdopen(fd, "w") as file:
+                if splice is None or not splice(file_name, fd):
+                    # Anything written before the splice gave up is thrown away
+                    os.ftruncate(fd, 0)
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    file.writelines(lines)
+                file.flush()
+                os.fsync(file.fileno())
+            # mkstemp creates the file readable by the owner only
+            if os.path.exists(file_name):
+                shutil.copymode(file_name, temp_name)
+            os.replace(temp_name, file_name)
+        except OSError:
             try:
-                with open(self.outp_file_right, "w") as file:
-                    for line in outp_set_right:
-                        file.write(line)
-                        if "\n" not in line:
-                            file.write("\n")
-            except (FileExistsError, FileNotFoundError):
-                return Status.FILE_WRITE_ERROR
-
-        return Status.MERGE_FINALIZE_SUCCESS
\ No newline at end of file
+                os.remove(temp_name)
+            except OSError:
+                pass
+            return Status.FILE_WRITE_ERROR
+        return Status.FILE_WRITE_SUCCESS
\ No newline at end of file
@@ -0,0 +1,332 @@
+"""
+###########################################################################
+File: patch_apply.py
+Author:
+Description: Applies a unified diff to a file.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+import mmap
+import os
+import re
+from enum import Enum, unique
+
+import splice_writer
+
+"""
+A patch is applied in two passes, and the file is only written if every hunk can be placed.
+
+The first pass maps the file and builds a splice_writer.LineIndex of it, which reads the file once, then reads
+the patch one hunk at a time. Each hunk is looked for where its header says it starts, moved by the offset the
+hunk before it was found at, as patch does. Only the context and removed lines of the hunk are read from the
+file there. If they don't match, the lines from WINDOW lines before to WINDOW lines after that position are
+read once and the closest match is used. Hunks have to be in order and can't overlap.
+
+The second pass writes the new file with merge_finalizer.MergeFinalizer.write_file, so it goes to a temporary
+file that replaces the original once it is complete. merge_finalizer pulls in the backup store, so it is only
+imported once there is something to write, which keeps importing this module cheap. The lines between hunks
+are byte ranges of the original and are copied with splice_writer.copy_range, so only the lines of the hunks
+pass through Python.
+
+Lines are compared as bytes without their line endings, so the patch and the file don't need to be decoded
+and a patch made on another platform still applies. Added lines are written with the line ending of the file.
+"""
+
+WINDOW = 1000  # Lines either side of the expected position a hunk is looked for in
+INDEX_CHUNK_SIZE = 4096  # A patch can have thousands of hunks, so lines are found from a finer index than a save uses
+
+HUNK_HEADER = re.compile(rb"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+@unique
+class Status(Enum):
+    APPLIED = 0
+    HUNK_FAILED = 1     # At least one hunk couldn't be placed, nothing was written
+    BADPATCH = 2
+    BADFILE = 3
+    FILE_WRITE_ERROR = 4
+
+
+class Hunk(object):
+    def __init__(self, old_start: int, new_start: int):
+        """
+        Initialize the Hunk class
+        :param old_start: first line of the hunk in the original file, as given in the header
+        :param new_start: first line of the hunk in the new file, as given in the header
+        """
+        self.old_start: int = old_start
+        self.new_start: int = new_start
+        self.old_lines: list = []   # Context and removed lines, as bytes without line endings
+        self.new_lines: list = []   # Context and added lines
+        self.no_newline: bool = False  # The last new line is the end of the file and has no line ending
+
+    @property
+    def position(self) -> int:
+        # An empty range is given as the line before it
+        return self.old_start if len(self.old_lines) == 0 else self.old_start - 1
+
+
+class PatchResult(object):
+    def __init__(self, file_name: str):
+        """
+        Initialize the PatchResult class
+        :param file_name: patched file
+        """
+        self.file_name: str = file_name
+        self.status: Status = Status.APPLIED
+        self.hunks: int = 0
+        self.offsets: list = []  # Lines each hunk was moved by from its header, None if it failed
+        self.error: str = ""
+
+    @property
+    def failed(self) -> list:
+        # 1 based numbers of the hunks that couldn't be placed
+        return [n + 1 for n, offset in enumerate(self.offsets) if offset is None]
+
+
+def strip_ending(line: bytes) -> bytes:
+    if line.endswith(b"\n"):
+        line = line[:-1]
+    if line.endswith(b"\r"):
+        line = line[:-1]
+    return line
+
+
+def parse_patch(patch_lines):
+    """
+    Reads the hunks of a unified diff of a single file.
+    :param patch_lines: iterable of the lines of the patch, as bytes
+    :return: yields a Hunk for each hunk
+    :raises ValueError: if the patch is malformed or holds more than one file
+    """
+    hunk = None
+    done = None  # Held until the next line, which can say the hunk ends without a line ending
+    old_left = 0
+    new_left = 0
+    last_tag = b" "
+    seen_hunk = False
+    for line in patch_lines:
+        if line.startswith(b"\\"):
+            # '\ No newline at end of file' is about the line before it. Only the new side is written
+            if last_tag in (b" ", b"+") and (done or hunk) is not None:
+                (done or hunk).no_newline = True
+            continue
+        if done is not None:
+            yield done
+            done = None
+
+        if hunk is None:
+            if line.startswith(b"@@"):
+                match = HUNK_HEADER.match(line)
+                if match is None:
+                    raise ValueError(f"Bad hunk header: {line.decode('latin-1').rstrip()}")
+                hunk = Hunk(int(match.group(1)), int(match.group(3)))
+                old_left = 1 if match.group(2) is None else int(match.group(2))
+                new_left = 1 if match.group(4) is None else int(match.group(4))
+                if old_left == 0 and new_left == 0:
+                    raise ValueError(f"Empty hunk: {line.decode('latin-1').rstrip()}")
+                last_tag = b" "
+                seen_hunk = True
+            elif line.startswith(b"--- ") and seen_hunk:
+                raise ValueError("Patch holds more than one file")
+            # Anything else outside a hunk, such as the file names, is ignored
+            continue
+
+        tag = line[:1]
+        text = strip_ending(line[1:])
+        # Some tools strip the space from empty context lines
+        if tag in (b"\n", b"\r"):
+            tag = b" "
+        if tag == b" ":
+            hunk.old_lines.append(text)
+            hunk.new_lines.append(text)
+            old_left -= 1
+            new_left -= 1
+        elif tag == b"-":
+            hunk.old_lines.append(text)
+            old_left -= 1
+        elif tag == b"+":
+            hunk.new_lines.append(text)
+            new_left -= 1
+        else:
+            raise ValueError(f"Hunk at line {hunk.old_start} is shorter than its header")
+        if old_left < 0 or new_left < 0:
+            raise ValueError(f"Hunk at line {hunk.old_start} is longer than its header")
+        last_tag = tag
+        if old_left == 0 and new_left == 0:
+            done = hunk
+            hunk = None
+
+    if hunk is not None:
+        raise ValueError(f"Hunk at line {hunk.old_start} is shorter than its header")
+    if done is not None:
+        yield done
+
+
+def file_lines(data, index: splice_writer.LineIndex, start: int, end: int) -> list:
+    """
+    Gets lines of the file, without line endings.
+    :param data: mmap or bytes of the file contents
+    :param index: LineIndex of the file
+    :param start: first line
+    :param end: line after the last line
+    :return: list of bytes
+    """
+    lines = data[index.offset(start):index.offset(end)].split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+    return [line[:-1] if line.endswith(b"\r") else line for line in lines]
+
+
+def find_hunk(data, index: splice_writer.LineIndex, hunk: Hunk, expected: int, low: int, window: int):
+    """
+    Finds where the context and removed lines of a hunk are in the file.
+    :param data: mmap or bytes of the file contents
+    :param index: LineIndex of the file
+    :param hunk: Hunk to place
+    :param expected: line the hunk should start at
+    :param low: first line the hunk may start at, the end of the hunk before it
+    :param window: number of lines either side of the expected line to look in
+    :return: first line of the hunk in the file, or None if it isn't there
+    """
+    size = len(hunk.old_lines)
+    if low <= expected <= index.line_count - size and \
+            file_lines(data, index, expected, expected + size) == hunk.old_lines:
+        return expected
+
+    first = max(low, expected - window)
+    last = min(index.line_count - size, expected + window)
+    if first > last:
+        return None
+    # The whole window is read once, the closest match to the expected line wins
+    lines = file_lines(data, index, first, last + size)
+    for distance in range(1, window + 1):
+        for pos in (expected + distance, expected - distance):
+            if first <= pos <= last and (size == 0 or lines[pos - first] == hunk.old_lines[0]) and \
+                    lines[pos - first:pos - first + size] == hunk.old_lines:
+                return pos
+    return None
+
+
+def hunk_text(data, index: splice_writer.LineIndex, hunk: Hunk, start: int) -> bytes:
+    """
+    Gets the bytes that replace the lines of a hunk in the file.
+    :param data: mmap or bytes of the file contents
+    :param index: LineIndex of the file
+    :param hunk: placed Hunk
+    :param start: first line of the hunk in the file
+    :return: new lines with line endings
+    """
+    newline = index.newline
+    text = b"".join(line + newline for line in hunk.new_lines)
+    end = start + len(hunk.old_lines)
+    if hunk.no_newline and end == index.line_count and len(text) > 0:
+        text = text[:-len(newline)]
+    # Lines added after a last line without a line ending have to start on a line of their own
+    if start == index.line_count and len(data) > 0 and data[-1:] != b"\n" and len(text) > 0:
+        text = newline + text
+    return text
+
+
+def locate(data, index: splice_writer.LineIndex, hunks, result: PatchResult, window: int) -> list:
+    """
+    Places every hunk in the file.
+    :param data: mmap or bytes of the file contents
+    :param index: LineIndex of the file
+    :param hunks: iterable of Hunk, in order
+    :param result: PatchResult, the offset of each hunk is added to it
+    :param window: number of lines either side of the expected line to look in
+    :return: list of (first byte, byte after the last byte, new bytes) for each placed hunk
+    """
+    plan: list = []
+    low = 0
+    drift = 0  # Later hunks are expected to have moved as far as the last one that was placed
+    for hunk in hunks:
+        pos = find_hunk(data, index, hunk, hunk.position + drift, low, window)
+        if pos is None:
+            result.offsets.append(None)
+            continue
+        drift = pos - hunk.position
+        result.offsets.append(drift)
+        low = pos + len(hunk.old_lines)
+        plan.append((index.offset(pos), index.offset(low), hunk_text(data, index, hunk, pos)))
+    result.hunks = len(result.offsets)
+    return plan
+
+
+def write_patched(src_fd: int, dst_fd: int, data, plan: list) -> bool:
+    """
+    Writes the patched file to an empty file.
+    :param src_fd: file descriptor of the original file
+    :param dst_fd: file descriptor of the output file
+    :param data: mmap or bytes of the original file contents
+    :param plan: list returned by locate
+    :return: True
+    """
+    pos = 0
+    for start, end, text in plan:
+        splice_writer.copy_range(src_fd, dst_fd, data, pos, start)
+        splice_writer.write_all(dst_fd, text)
+        pos = end
+    splice_writer.copy_range(src_fd, dst_fd, data, pos, len(data))
+    return True
+
+
+def apply_patch(file_name: str, patch_lines, output: str = None, window: int = WINDOW,
+                dry_run: bool = False) -> PatchResult:
+    """
+    Applies a unified diff to a file. Nothing is written unless every hunk can be placed.
+    :param file_name: file to patch
+    :param patch_lines: iterable of the lines of the patch, as bytes, such as a file opened in binary mode
+    :param output: file to write, defaults to the file being patched
+    :param window: number of lines either side of the expected line to look for a hunk in
+    :param dry_run: only check that the patch applies
+    :return: PatchResult
+    """
+    result = PatchResult(file_name)
+    output = file_name if output is None else output
+    try:
+        with open(file_name, "rb") as src:
+            size = os.fstat(src.fileno()).st_size
+            data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+            try:
+                index = splice_writer.LineIndex(data, check_endings=False, chunk_size=INDEX_CHUNK_SIZE)
+                try:
+                    plan = locate(data, index, parse_patch(patch_lines), result, window)
+                except ValueError as ex:
+                    result.status = Status.BADPATCH
+                    result.error = str(ex)
+                    return result
+
+                if len(result.failed) > 0:
+                    result.status = Status.HUNK_FAILED
+                elif not dry_run:
+                    import merge_finalizer
+                    status = merge_finalizer.MergeFinalizer.write_file(
+                        output, (), lambda name, fd: write_patched(src.fileno(), fd, data, plan)
+                    )
+                    if status != merge_finalizer.Status.FILE_WRITE_SUCCESS:
+                        result.status = Status.FILE_WRITE_ERROR
+            finally:
+                if size > 0:
+                    data.close()
+    except (OSError, ValueError) as ex:
+        result.status = Status.BADFILE
+        result.error = str(ex)
+    return result
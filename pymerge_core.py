@@ -0,0 +1,235 @@
+"""
+###########################################################################
+File: pymerge_core.py
+Author:
+Description: Qt free interface to the diff engine, for scripts and command line tools.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+diff() reads two files, diffs them with the same engine the GUI uses and returns a DiffResult holding
+a change set for each file and the hunks of rows that differ. Nothing here, or in anything it imports,
+may import PyQt5: importing this module has to stay cheap enough for short lived scripts, and
+test_pymerge_core checks how long it takes.
+"""
+
+import changeset
+import diff_resolution
+import longest_common_subseq
+import pymerge_enums
+import utilities
+
+ENGINES = longest_common_subseq.ENGINES  # See longest_common_subseq.padded_lcs
+
+
+class DiffResult(object):
+    def __init__(self, left_path: str, right_path: str):
+        """
+        Initialize the DiffResult class
+        :param left_path: left hand file
+        :param right_path: right hand file
+        """
+        self.left_path: str = left_path
+        self.right_path: str = right_path
+        self.result: pymerge_enums.RESULT = pymerge_enums.RESULT.GOOD
+        self.changes_a: changeset.ChangeSet = changeset.ChangeSet()
+        self.changes_b: changeset.ChangeSet = changeset.ChangeSet()
+        self.row_count: int = 0
+        self.hunks: list = []  # [start, end) row ranges that are not the same on both sides
+        # [start a, end a, start b, end b] file line ranges that differ. Lines the table has no row for, which
+        # happens to differences before the first matching line, are included
+        self.file_hunks: list = []
+        self.error: str = ""  # Why a file couldn't be read
+        self.lines_a: list = []  # Lines of each file, without line endings
+        self.lines_b: list = []
+        # Whether the last line of each file has a line ending. A last line without one differs from the same
+        # text with one, as in diff
+        self.newline_a: bool = True
+        self.newline_b: bool = True
+
+    @property
+    def identical(self) -> bool:
+        return self.result == pymerge_enums.RESULT.GOOD and len(self.file_hunks) == 0
+
+    def rows(self, start: int = 0, end: int = None):
+        """
+        Yields one tuple per row: (change type a, line a, change type b, line b).
+        :param start: first row
+        :param end: row after the last row, defaults to the end of the diff
+        """
+        end = self.row_count if end is None else min(end, self.row_count)
+        for n in range(start, end):
+            change_a = self.changes_a.change_list[n]
+            change_b = self.changes_b.change_list[n]
+            yield change_a[1], change_a[2], change_b[1], change_b[2]
+
+    def matched_runs(self):
+        """
+        Yields the runs of unchanged rows that are consecutive lines in both files, as
+        (first row, first line a, first line b, length) tuples.
+        """
+        runs_a = self.changes_a.line_runs
+        runs_b = self.changes_b.line_runs
+        idx_a = 0
+        idx_b = 0
+        while idx_a < len(runs_a) and idx_b < len(runs_b):
+            run_a = runs_a[idx_a]
+            run_b = runs_b[idx_b]
+            start = max(run_a[0], run_b[0])
+            end = min(run_a[0] + run_a[2], run_b[0] + run_b[2])
+            if start < end:
+                yield start, run_a[1] + start - run_a[0], run_b[1] + start - run_b[0], end - start
+            if run_a[0] + run_a[2] <= run_b[0] + run_b[2]:
+                idx_a += 1
+            else:
+                idx_b += 1
+
+    def classify(self):
+        """
+        Finds the hunks of the diff: the rows that aren't the same on both sides, from the change type of each
+        row, and the lines of each file between the matched lines.
+        :return: No return value
+        """
+        self.hunks = []
+        hunk_start = -1
+        for n in range(self.row_count):
+            same = self.changes_a.change_list[n][1] == pymerge_enums.CHANGEDENUM.SAME and \
+                self.changes_b.change_list[n][1] == pymerge_enums.CHANGEDENUM.SAME
+            if not same and hunk_start == -1:
+                hunk_start = n
+            elif same and hunk_start != -1:
+                self.hunks.append([hunk_start, n])
+                hunk_start = -1
+        if hunk_start != -1:
+            self.hunks.append([hunk_start, self.row_count])
+
+        self.file_hunks = []
+        end_a = 0
+        end_b = 0
+        for row, line_a, line_b, length in self.matched_runs():
+            last_a = line_a + length == len(self.lines_a) and not self.newline_a
+            last_b = line_b + length == len(self.lines_b) and not self.newline_b
+            if last_a != last_b:
+                length -= 1
+            if line_a > end_a or line_b > end_b:
+                self.file_hunks.append([end_a, line_a, end_b, line_b])
+            end_a = line_a + length
+            end_b = line_b + length
+        if end_a < len(self.lines_a) or end_b < len(self.lines_b):
+            self.file_hunks.append([end_a, len(self.lines_a), end_b, len(self.lines_b)])
+
+
+def read_lines(path: str, encoding: str = None) -> list:
+    """
+    Reads a file the way the GUI does, as a list of lines without line endings.
+    :param path: file to read
+    :param encoding: text encoding, defaults to the locale's
+    :return: list of lines
+    """
+    return read_file(path, encoding)[0]
+
+
+def read_file(path: str, encoding: str = None) -> (list, bool):
+    """
+    Reads a file as read_lines does, and checks whether its last line has a line ending.
+    :param path: file to read
+    :param encoding: text encoding, defaults to the locale's
+    :return: list of lines, and False if the file has a last line without a line ending
+    """
+    with open(path, "r", encoding=encoding) as file:
+        text = file.read()
+    # Anything splitlines breaks at ends a line, and an empty file has no last line
+    return text.splitlines(), text[-1:].splitlines() != [text[-1:]]
+
+
+def check_files(left_path: str, right_path: str) -> pymerge_enums.RESULT:
+    """
+    Checks that both files have been given and have acceptable file types, like file_io.FileIO.check_files.
+    :return: pymerge_enums.RESULT value
+    """
+    if left_path == "" or right_path == "":
+        return pymerge_enums.RESULT.EMPTYFILE
+    if not utilities.valid_file_ext(left_path) or not utilities.valid_file_ext(right_path):
+        return pymerge_enums.RESULT.BADFILE
+    return pymerge_enums.RESULT.GOOD
+
+
+def diff_lines(left_lines: list, right_lines: list, engine: str = "auto", left_path: str = "",
+               right_path: str = "", left_newline: bool = True, right_newline: bool = True) -> DiffResult:
+    """
+    Diffs two lists of lines.
+    :param left_lines: left hand lines, without line endings
+    :param right_lines: right hand lines, without line endings
+    :param engine: LCS implementation, one of ENGINES
+    :param left_path: name to record for the left hand lines
+    :param right_path: name to record for the right hand lines
+    :param left_newline: whether the last left hand line has a line ending
+    :param right_newline: whether the last right hand line has a line ending
+    :return: DiffResult
+    :raises ValueError: if the engine is unknown or hasn't been built, see longest_common_subseq.check_engine
+    """
+    longest_common_subseq.check_engine(engine)
+    diff_result = DiffResult(left_path, right_path)
+    diff_result.lines_a = left_lines
+    diff_result.lines_b = right_lines
+    diff_result.newline_a = left_newline
+    diff_result.newline_b = right_newline
+    diff_result.result = diff_resolution.diff_lines(
+        left_lines, right_lines, diff_result.changes_a, diff_result.changes_b, engine
+    )
+    if diff_result.result != pymerge_enums.RESULT.GOOD:
+        return diff_result
+
+    # The last entry is the match token, which isn't a row
+    diff_result.row_count = len(diff_result.changes_a.change_list) - 1
+    diff_result.changes_a.change_set_ready = True
+    diff_result.changes_b.change_set_ready = True
+    diff_result.classify()
+    return diff_result
+
+
+def diff(left_path: str, right_path: str, engine: str = "auto", encoding: str = None,
+         check_types: bool = True) -> DiffResult:
+    """
+    Reads and diffs two files.
+    :param left_path: left hand file
+    :param right_path: right hand file
+    :param engine: LCS implementation, one of ENGINES
+    :param encoding: text encoding of both files, defaults to the locale's
+    :param check_types: refuse files with extensions the GUI doesn't accept
+    :return: DiffResult, with result BADFILE if a file can't be read or isn't accepted
+    :raises ValueError: if the engine is unknown or hasn't been built, see longest_common_subseq.check_engine
+    """
+    longest_common_subseq.check_engine(engine)
+    if check_types:
+        result = check_files(left_path, right_path)
+        if result != pymerge_enums.RESULT.GOOD:
+            diff_result = DiffResult(left_path, right_path)
+            diff_result.result = result
+            return diff_result
+
+    try:
+        left_lines, left_newline = read_file(left_path, encoding)
+        right_lines, right_newline = read_file(right_path, encoding)
+    except (OSError, UnicodeDecodeError) as ex:
+        diff_result = DiffResult(left_path, right_path)
+        diff_result.result = pymerge_enums.RESULT.BADFILE
+        diff_result.error = str(ex)
+        return diff_result
+    return diff_lines(left_lines, right_lines, engine, left_path, right_path, left_newline, right_newline)
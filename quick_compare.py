@@ -0,0 +1,171 @@
+"""
+###########################################################################
+File: quick_compare.py
+Author:
+Description: Checks whether two files are identical without diffing them.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+import os
+from enum import Enum, unique
+
+"""
+Files of different sizes are known to differ without reading them. Otherwise both files are read a block at a
+time with readinto, into two buffers that are reused for the whole file, and the comparison stops at the first
+block that differs. Whole buffers are compared with bytearray ==, which is a memcmp; comparing memoryviews
+would go byte by byte.
+
+With ignore_line_endings, CRLF and LF line endings are the same, so the sizes say nothing and the blocks of
+each file are normalized before they are compared. A block that ends in CR holds it back until the next block
+shows whether an LF follows. Normalized blocks can have different lengths, so the common prefix of the two
+pending blocks is compared each time.
+
+Only the standard library is used, so this works without a display and without the diff engine.
+"""
+
+BLOCK_SIZE = 1024 * 1024
+
+
+@unique
+class Status(Enum):
+    # The values are the exit codes of cmp and diff
+    IDENTICAL = 0
+    DIFFERENT = 1
+    ERROR = 2
+
+
+def compare_exact(left, right, block_size: int) -> Status:
+    """
+    Compares two open files of the same size byte for byte.
+    :param left: left hand file, opened in binary mode without buffering
+    :param right: right hand file, opened in binary mode without buffering
+    :param block_size: bytes read from each file at a time
+    :return: IDENTICAL or DIFFERENT
+    """
+    buffer_a = bytearray(block_size)
+    buffer_b = bytearray(block_size)
+    while True:
+        count_a = left.readinto(buffer_a)
+        count_b = right.readinto(buffer_b)
+        if count_a == block_size and count_b == block_size:
+            if buffer_a != buffer_b:
+                return Status.DIFFERENT
+            continue
+        # A short read, usually the end of both files
+        if count_a != count_b:
+            return compare_rest(left, right, buffer_a[:count_a], buffer_b[:count_b], block_size)
+        if buffer_a[:count_a] != buffer_b[:count_b]:
+            return Status.DIFFERENT
+        if count_a == 0:
+            return Status.IDENTICAL
+
+
+def compare_rest(left, right, pending_a: bytes, pending_b: bytes, block_size: int) -> Status:
+    # Reads can come back short before the end of a file, such as when it is a pipe or is growing
+    return compare_blocks(chain_blocks(pending_a, left, block_size), chain_blocks(pending_b, right, block_size))
+
+
+def chain_blocks(first: bytes, file, block_size: int):
+    if len(first) > 0:
+        yield bytes(first)
+    while True:
+        block = file.read(block_size)
+        if not block:
+            return
+        yield block
+
+
+def normalized_blocks(file, block_size: int):
+    """
+    Reads a file with every CRLF replaced by LF.
+    :param file: file opened in binary mode
+    :param block_size: bytes read at a time
+    :return: yields non-empty blocks of bytes
+    """
+    carry = b""
+    while True:
+        block = file.read(block_size)
+        if not block:
+            if len(carry) > 0:
+                yield carry
+            return
+        block = carry + block
+        carry = b""
+        if block.endswith(b"\r"):
+            carry = b"\r"
+            block = block[:-1]
+        returns = block.count(b"\r")
+        if returns > 0:
+            # Deleting every CR is far quicker than replacing millions of CRLFs, and the same if no CR is alone
+            if block.count(b"\r\n") == returns:
+                block = block.translate(None, b"\r")
+            else:
+                block = block.replace(b"\r\n", b"\n")
+        if len(block) > 0:
+            yield block
+
+
+def compare_blocks(blocks_a, blocks_b) -> Status:
+    """
+    Compares two streams of blocks that can be split at different places.
+    :param blocks_a: iterator of non-empty bytes blocks of the left hand file
+    :param blocks_b: iterator of non-empty bytes blocks of the right hand file
+    :return: IDENTICAL or DIFFERENT
+    """
+    pending_a = b""
+    pending_b = b""
+    while True:
+        if len(pending_a) == 0:
+            pending_a = next(blocks_a, b"")
+        if len(pending_b) == 0:
+            pending_b = next(blocks_b, b"")
+        if len(pending_a) == 0 or len(pending_b) == 0:
+            return Status.IDENTICAL if len(pending_a) == len(pending_b) else Status.DIFFERENT
+
+        count = min(len(pending_a), len(pending_b))
+        if pending_a[:count] != pending_b[:count]:
+            return Status.DIFFERENT
+        pending_a = pending_a[count:]
+        pending_b = pending_b[count:]
+
+
+def compare(left_path: str, right_path: str, ignore_line_endings: bool = False,
+            block_size: int = BLOCK_SIZE) -> Status:
+    """
+    Checks whether two files have the same contents.
+    :param left_path: left hand file
+    :param right_path: right hand file
+    :param ignore_line_endings: treat CRLF and LF line endings as the same
+    :param block_size: bytes read from each file at a time
+    :return: Status value, ERROR if either file can't be read
+    """
+    try:
+        stat_a = os.stat(left_path)
+        stat_b = os.stat(right_path)
+        if os.path.samestat(stat_a, stat_b):
+            return Status.IDENTICAL
+        if not ignore_line_endings and stat_a.st_size != stat_b.st_size:
+            return Status.DIFFERENT
+
+        with open(left_path, "rb", buffering=0) as left, open(right_path, "rb", buffering=0) as right:
+            if ignore_line_endings:
+                return compare_blocks(normalized_blocks(left, block_size), normalized_blocks(right, block_size))
+            return compare_exact(left, right, block_size)
+    except OSError:
+        return Status.ERROR
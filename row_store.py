@@ -0,0 +1,244 @@
+"""
+###########################################################################
+File: row_store.py
+Author:
+Description: Merge state of every line in the diff, stored as one byte per line.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+The text of each line comes from the change sets and never changes. What a merge changes is which
+side's text each file ends up with, so the merge state of a line is a single byte:
+    UNMERGED      both files keep their own line
+    MERGED_LEFT   the left hand (file A) line is copied into the right hand file
+    MERGED_RIGHT  the right hand (file B) line is copied into the left hand file
+Table rows read their text from the store, so a span of lines is merged by one bytes.translate
+over the diff mask, no matter how many lines or blocks of differences are in it.
+
+Each side also keeps a digest of its lines inside blocks of differences, the sum mod 2^64 of a BLAKE2b
+hash of every line number and text. Python's hash of a tuple is too weak for this: swapping the text of
+two lines often leaves the sum of their hashes unchanged. A merge or undo only takes out and adds back the lines it touched, so checking
+whether both files are the same before saving doesn't need a pass over either file. Unchanged lines are
+the same on both sides and are left out of the digests.
+"""
+
+import hashlib
+
+import pymerge_enums
+
+DIGEST_MASK = (1 << 64) - 1
+
+UNMERGED = 0
+MERGED_LEFT = 1
+MERGED_RIGHT = 2
+
+
+def line_digest(line_num: int, text: str) -> int:
+    """
+    Hashes a line together with its position.
+    :param line_num: line number
+    :param text: text of the line
+    :return: 64 bit digest
+    """
+    data = line_num.to_bytes(8, "little") + text.encode("utf-8", "surrogatepass")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class RowStore(object):
+    def __init__(self, change_set_a, change_set_b):
+        """
+        Initialize the RowStore class
+        :param change_set_a: change set for the left hand file
+        :param change_set_b: change set for the right hand file
+        """
+        self.change_set_a = change_set_a
+        self.change_set_b = change_set_b
+        self.state: bytearray = bytearray()      # Merge state of each line
+        self.diff_mask: bytearray = bytearray()  # 1 for lines inside a block of differences
+        self.digest_a: int = 0                   # Digest of the changed lines in the left hand file
+        self.digest_b: int = 0                   # Digest of the changed lines in the right hand file
+        self.generation: int = 0                 # Counts clears, so undo records of earlier files can be told apart
+
+    def __len__(self):
+        return len(self.state)
+
+    def snapshot(self):
+        """
+        Gets a copy of the store that isn't affected by later merges, or by the change sets being cleared.
+        :return: RowStore instance
+        """
+        store = RowStore(self.change_set_a.copy(), self.change_set_b.copy())
+        store.state = bytearray(self.state)
+        store.diff_mask = self.diff_mask
+        store.digest_a = self.digest_a
+        store.digest_b = self.digest_b
+        return store
+
+    def clear(self):
+        self.generation += 1
+        self.state = bytearray()
+        self.diff_mask = bytearray()
+        self.digest_a = 0
+        self.digest_b = 0
+
+    def extend(self, start: int, end: int):
+        """
+        Add the lines [start, end) of the change sets, which must directly follow the lines already added.
+        :param start: first change set index to add
+        :param end: change set index to stop at
+        :return: No return value
+        """
+        same_flag = pymerge_enums.CHANGEDENUM.SAME
+        self.diff_mask.extend(change[1] != same_flag for change in self.change_set_a.change_list[start:end])
+        self.state.extend(bytes(end - start))
+        self.add_digests(start, end, 1)
+
+    def text_a(self, line_num: int) -> str:
+        """
+        Gets the current text of a line in the left hand file.
+        :param line_num: line number
+        :return: line text
+        """
+        if self.state[line_num] == MERGED_RIGHT:
+            return self.change_set_b.change_list[line_num][2]
+        return self.change_set_a.change_list[line_num][2]
+
+    def text_b(self, line_num: int) -> str:
+        """
+        Gets the current text of a line in the right hand file.
+        :param line_num: line number
+        :return: line text
+        """
+        if self.state[line_num] == MERGED_LEFT:
+            return self.change_set_a.change_list[line_num][2]
+        return self.change_set_b.change_list[line_num][2]
+
+    def is_deleted(self, line_num: int) -> bool:
+        """
+        Checks if a line has been removed from both files, by merging in the missing side of an added line.
+        :param line_num: line number
+        :return: boolean
+        """
+        state = self.state[line_num]
+        if state == MERGED_LEFT:
+            return self.change_set_a.change_list[line_num][1] == pymerge_enums.CHANGEDENUM.ADDED
+        if state == MERGED_RIGHT:
+            return self.change_set_b.change_list[line_num][1] == pymerge_enums.CHANGEDENUM.ADDED
+        return False
+
+    def get_states(self, start: int, end: int) -> bytes:
+        return bytes(self.state[start:end])
+
+    def set_states(self, start: int, states: bytes):
+        end = start + len(states)
+        self.add_digests(start, end, -1)
+        self.state[start:end] = states
+        self.add_digests(start, end, 1)
+
+    def merge_span(self, start: int, end: int, state: int) -> bytes:
+        """
+        Merge every line in the range [start, end) that is inside a block of differences.
+        Unchanged lines are left alone.
+        :param start: first line to merge
+        :param end: line to stop at
+        :param state: MERGED_LEFT or MERGED_RIGHT
+        :return: the previous states of the range, for undo
+        """
+        prev_states = self.get_states(start, end)
+        self.add_digests(start, end, -1)
+        # The mask is 0 or 1, so the translation table maps it straight to the new state
+        self.state[start:end] = self.diff_mask[start:end].translate(bytes([UNMERGED, state]) + bytes(254))
+        self.add_digests(start, end, 1)
+        return prev_states
+
+    def is_merged(self, start: int, end: int) -> bool:
+        """
+        Checks if every line in a block of differences has been merged.
+        :param start: first line of the block
+        :param end: line after the last line of the block
+        :return: boolean
+        """
+        return self.state.find(UNMERGED, start, end) == -1
+
+    def merged_lines(self, end: int, side_a: bool = True):
+        """
+        Yields the lines of one of the files as they will be saved, with line endings and without deleted lines.
+        Runs of unchanged lines come straight from the change set.
+        :param end: number of lines to save
+        :param side_a: True for the left hand file, False for the right hand file
+        :return: generator of lines
+        """
+        change_list = self.change_set_a.change_list if side_a else self.change_set_b.change_list
+        text = self.text_a if side_a else self.text_b
+        pos = 0
+        while pos < end:
+            run_start = self.diff_mask.find(1, pos, end)
+            if run_start == -1:
+                run_start = end
+            for change in change_list[pos:run_start]:
+                yield change[2] + "\n"
+
+            pos = self.diff_mask.find(0, run_start, end)
+            if pos == -1:
+                pos = end
+            for line_num in range(run_start, pos):
+                if not self.is_deleted(line_num):
+                    yield text(line_num) + "\n"
+
+    def changed_lines(self, start: int, end: int):
+        """
+        Yields the line numbers in the range [start, end) that are inside a block of differences,
+        skipping over runs of unchanged lines without looking at each one.
+        :param start: first line
+        :param end: line to stop at
+        :return: generator of line numbers
+        """
+        pos = self.diff_mask.find(1, start, end)
+        while pos != -1:
+            run_end = self.diff_mask.find(0, pos, end)
+            if run_end == -1:
+                run_end = end
+            yield from range(pos, run_end)
+            pos = self.diff_mask.find(1, run_end, end)
+
+    def add_digests(self, start: int, end: int, sign: int):
+        """
+        Add the current lines in the range [start, end) to the digest of each side, or take them out.
+        :param start: first line
+        :param end: line to stop at
+        :param sign: 1 to add the lines, -1 to take them out
+        :return: No return value
+        """
+        digest_a = self.digest_a
+        digest_b = self.digest_b
+        for line_num in self.changed_lines(start, end):
+            # Deleted lines aren't written to either file
+            if self.is_deleted(line_num):
+                continue
+            digest_a += sign * line_digest(line_num, self.text_a(line_num))
+            digest_b += sign * line_digest(line_num, self.text_b(line_num))
+        self.digest_a = digest_a & DIGEST_MASK
+        self.digest_b = digest_b & DIGEST_MASK
+
+    def sides_equal(self) -> bool:
+        """
+        Checks if both files have the same contents, by comparing the digests of each side.
+        :return: boolean
+        """
+        return self.digest_a == self.digest_b
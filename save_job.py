@@ -0,0 +1,150 @@
+"""
+###########################################################################
+File: save_job.py
+Author:
+Description: Backs up and saves both merged files in the background.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+Saving runs in two phases on a two thread pool. Both files are backed up first, one per thread. The
+merged lines are written only after both backups have succeeded, so a failed backup of either file
+leaves both files untouched. The GUI thread only starts the job and receives its signals, which Qt
+queues back to it from the pool threads.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import merge_finalizer
+
+
+class SaveJob(QObject):
+    progress = pyqtSignal(int, int)     # Steps finished and total number of steps
+    save_finished = pyqtSignal(object)  # merge_finalizer.Status value
+
+    STEPS_PER_FILE = 2  # Backup and write
+
+    def __init__(self, merge_writer, files: list, parent=None):
+        """
+        Initialize the SaveJob class
+        :param merge_writer: merge_finalizer.MergeFinalizer used to back up and write the files
+        :param files: list of (file name, lines, splice function) tuples, see MergeFinalizer.write_file
+        :param parent: parent QObject
+        """
+        super().__init__(parent)
+        self.merge_writer = merge_writer
+        self.files: list = files
+        self.executor = None
+        self.lock = threading.Lock()
+        self.steps_done: int = 0
+        self.results: list = []
+
+    def start(self):
+        """
+        Start backing up every file. Returns straight away, the writes are started by backup_done.
+        :return: No return value
+        """
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        for file_name, _, _ in self.files:
+            future = self.executor.submit(self.backup_file, file_name)
+            future.add_done_callback(self.backup_done)
+
+    def backup_file(self, file_name: str) -> merge_finalizer.Status:
+        """
+        Back up a file. Runs on a pool thread.
+        :return: enumerated Status value
+        """
+        status = self.merge_writer.backup_one(file_name)
+        self.step_done()
+        return status
+
+    def write_file(self, file_name: str, lines, splice) -> merge_finalizer.Status:
+        """
+        Replace a file with its merged lines. Runs on a pool thread.
+        :return: enumerated Status value
+        """
+        status = self.merge_writer.write_file(file_name, lines, splice)
+        self.step_done()
+        return status
+
+    def step_done(self):
+        with self.lock:
+            self.steps_done += 1
+            steps_done = self.steps_done
+        self.progress.emit(steps_done, len(self.files) * self.STEPS_PER_FILE)
+
+    def collect(self, future, error: merge_finalizer.Status) -> list:
+        """
+        Record the result of one task of the current phase.
+        :param future: finished future of the task
+        :param error: status recorded if the task raised an exception
+        :return: results of the whole phase once every file has finished it, otherwise None
+        """
+        try:
+            status = future.result()
+        except Exception as ex:
+            print(ex)
+            status = error
+
+        with self.lock:
+            self.results.append(status)
+            if len(self.results) < len(self.files):
+                return None
+            results = self.results
+            self.results = []
+        return results
+
+    def backup_done(self, future):
+        results = self.collect(future, merge_finalizer.Status.BACKUP_ERROR)
+        if results is None:
+            return
+
+        # Nothing is written unless every file has a backup
+        for result in results:
+            if result != merge_finalizer.Status.BACKUP_SUCCESS:
+                self.finish(result)
+                return
+
+        for file_name, lines, splice in self.files:
+            future = self.executor.submit(self.write_file, file_name, lines, splice)
+            future.add_done_callback(self.write_done)
+
+    def write_done(self, future):
+        results = self.collect(future, merge_finalizer.Status.FILE_WRITE_ERROR)
+        if results is None:
+            return
+
+        # Report the first failure, if there was one
+        status = merge_finalizer.Status.MERGE_FINALIZE_SUCCESS
+        for result in results:
+            if result != merge_finalizer.Status.FILE_WRITE_SUCCESS:
+                status = result
+                break
+
+        # Both backups are done, so old ones can be pruned without racing them
+        if status == merge_finalizer.Status.MERGE_FINALIZE_SUCCESS:
+            self.merge_writer.prune_backups()
+        self.finish(status)
+
+    def finish(self, status: merge_finalizer.Status):
+        self.executor.shutdown(wait=False)
+        self.save_finished.emit(status)
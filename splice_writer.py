@@ -0,0 +1,331 @@
+"""
+###########################################################################
+File: splice_writer.py
+Author:
+Description: Saves a merged file by copying its unchanged byte ranges from the original file.
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+"""
+A merged file is the original file with the blocks of differences replaced. The output is written
+as a list of segments, either a (start, end) byte range of the original file or the encoded text of
+the rows of a block. Byte ranges are copied by the kernel with os.copy_file_range or os.sendfile,
+or written from an mmap of the original where neither is available, so Python only handles the
+lines inside the blocks of differences.
+
+Unchanged rows are found in the original file through the line runs recorded by the diff. A
+LineIndex holds the byte offset of every CHUNK_SIZE bytes or so of the original file, and finds the
+offset of a line by counting newlines from the nearest chunk. If the file can't be mapped exactly,
+such as with mixed line endings or rows that weren't produced by the diff, no segments are returned
+and the caller writes the file line by line instead.
+
+Whether the last line of the saved file has a line ending is taken from the original file, both here and in
+keep_final_newline for files written line by line, so the two ways of saving give the same file.
+
+The diff splits files with str.splitlines, which also breaks lines at form feeds, vertical tabs and a few
+other separators. A file holding any of them has more rows than newlines, so it is never indexed.
+"""
+
+import bisect
+import locale
+import mmap
+import os
+
+CHUNK_SIZE = 64 * 1024  # Bytes of the original file between each entry of the line index
+LINE_SEPARATORS = "\v\f\x1c\x1d\x1e\x85\u2028\u2029"  # Line breaks for str.splitlines, other than \r and \n
+
+
+def line_separators(encoding: str) -> tuple:
+    """
+    Gets the encoded forms of the line separators that aren't line endings.
+    :param encoding: encoding of the file
+    :return: tuple of bytes, without the separators the encoding can't represent
+    """
+    separators: list = []
+    for separator in LINE_SEPARATORS:
+        try:
+            separators.append(separator.encode(encoding))
+        except UnicodeEncodeError:
+            pass
+    return tuple(separators)
+
+
+class LineIndex(object):
+    def __init__(self, data, check_endings: bool = True, chunk_size: int = CHUNK_SIZE, separators: tuple = ()):
+        """
+        Initialize the LineIndex class
+        :param data: mmap or bytes of the file contents
+        :param check_endings: treat a file with mixed line endings as invalid
+        :param chunk_size: bytes between entries, smaller chunks make offset faster and the index larger
+        :param separators: treat a file holding any of these as invalid, see line_separators
+        """
+        self.data = data
+        self.check_endings: bool = check_endings
+        self.separators: tuple = separators
+        self.chunk_size: int = chunk_size
+        self.chunk_offsets: list = []   # Byte offset of the start of each chunk, always the start of a line
+        self.chunk_lines: list = []     # Line number of the first line of each chunk
+        self.line_count: int = 0
+        self.newline: bytes = b"\n"
+        self.valid: bool = self.build()
+
+    def build(self) -> bool:
+        """
+        Count the lines of the file a chunk at a time and check that every line has the same ending.
+        :return: True if the file can be indexed
+        """
+        size = len(self.data)
+        first_newline = self.data.find(b"\n")
+        if first_newline > 0 and self.data[first_newline - 1:first_newline] == b"\r":
+            self.newline = b"\r\n"
+
+        pos = 0
+        while pos < size:
+            # Chunks end on a line ending, so a \r\n pair is never split
+            end = self.data.find(b"\n", min(pos + self.chunk_size, size) - 1)
+            end = size if end == -1 else end + 1
+            chunk = self.data[pos:end]
+            newlines = chunk.count(b"\n")
+            if self.check_endings and chunk.count(b"\r") != (newlines if self.newline == b"\r\n" else 0):
+                return False
+            # Chunks end on a newline, which is never part of a multi byte separator
+            if any(separator in chunk for separator in self.separators):
+                return False
+
+            self.chunk_offsets.append(pos)
+            self.chunk_lines.append(self.line_count)
+            self.line_count += newlines
+            pos = end
+
+        # A last line without a line ending is still a line
+        if size > 0 and self.data[size - 1:size] != b"\n":
+            self.line_count += 1
+        return True
+
+    def offset(self, line_num: int) -> int:
+        """
+        Gets the byte offset of the start of a line.
+        :param line_num: line number, may be the line count for the end of the file
+        :return: byte offset
+        """
+        if line_num >= self.line_count:
+            return len(self.data)
+        chunk_idx = bisect.bisect_right(self.chunk_lines, line_num) - 1
+        pos = self.chunk_offsets[chunk_idx]
+        for _ in range(line_num - self.chunk_lines[chunk_idx]):
+            pos = self.data.find(b"\n", pos) + 1
+        return pos
+
+
+def file_ranges(change_set, start: int, end: int) -> list:
+    """
+    Gets the file lines of a run of unchanged rows from the line runs recorded by the diff.
+    :param change_set: change set of the file
+    :param start: first row of the run
+    :param end: row after the last row of the run
+    :return: list of [first file line, line after the last file line) pairs, or None if a row isn't covered
+    """
+    line_runs = change_set.line_runs
+    ranges: list = []
+    run_idx = bisect.bisect_right(line_runs, [start, float("inf")]) - 1
+    row = start
+    while row < end:
+        if run_idx < 0 or run_idx >= len(line_runs):
+            return None
+        run_row, run_line, run_len = line_runs[run_idx]
+        if not run_row <= row < run_row + run_len:
+            return None
+        run_end = min(run_row + run_len, end)
+        ranges.append((run_line + row - run_row, run_line + run_end - run_row))
+        row = run_end
+        run_idx += 1
+    return ranges
+
+
+def segments(store, end: int, side_a: bool, index: LineIndex, encoding: str) -> list:
+    """
+    Gets the segments of one side of the merge. The rows give the same lines as
+    row_store.RowStore.merged_lines.
+    :param store: row_store.RowStore holding the merge state
+    :param end: number of rows to save
+    :param side_a: True for the left hand file, False for the right hand file
+    :param index: LineIndex of the original file
+    :param encoding: encoding of the file
+    :return: list of (start, end) byte ranges and bytes, or None if the file can't be mapped
+    """
+    change_set = store.change_set_a if side_a else store.change_set_b
+    text = store.text_a if side_a else store.text_b
+    newline = index.newline.decode("ascii")
+    output: list = []
+
+    pos = 0
+    while pos < end:
+        run_start = store.diff_mask.find(1, pos, end)
+        if run_start == -1:
+            run_start = end
+        if run_start > pos:
+            ranges = file_ranges(change_set, pos, run_start)
+            if ranges is None:
+                return None
+            for first_line, end_line in ranges:
+                if end_line > index.line_count:
+                    return None
+                output.append((index.offset(first_line), index.offset(end_line)))
+
+        pos = store.diff_mask.find(0, run_start, end)
+        if pos == -1:
+            pos = end
+        if pos > run_start:
+            lines = [text(n) + newline for n in range(run_start, pos) if not store.is_deleted(n)]
+            output.append("".join(lines).encode(encoding))
+    return output
+
+
+def copy_range(src_fd: int, dst_fd: int, data, start: int, end: int):
+    """
+    Copy a byte range of the original file to the end of the output file, in the kernel if possible.
+    :param src_fd: file descriptor of the original file
+    :param dst_fd: file descriptor of the output file, positioned at its end
+    :param data: mmap of the original file, used if the kernel can't copy between the files
+    :param start: first byte to copy
+    :param end: byte after the last byte to copy
+    :return: No return value
+    """
+    while start < end:
+        copied = kernel_copy(src_fd, dst_fd, start, end - start)
+        if copied <= 0:
+            with memoryview(data) as view:
+                write_all(dst_fd, view[start:end])
+            return
+        start += copied
+
+
+def kernel_copy(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """
+    Copy bytes between two files without reading them into Python.
+    :return: number of bytes copied, 0 if neither os.copy_file_range nor os.sendfile could be used
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset)
+        except OSError:
+            pass
+    if hasattr(os, "sendfile"):
+        try:
+            return os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError:
+            pass
+    return 0
+
+
+def write_all(fd: int, data):
+    # os.write can write less than it was given
+    while len(data) > 0:
+        data = data[os.write(fd, data):]
+
+
+def without_final_newline(output: list, size: int, newline: bytes) -> list:
+    """
+    Takes the line ending off the last line of the segments of a file.
+    :param output: list returned by segments
+    :param size: size of the original file
+    :param newline: line ending of the original file
+    :return: list of segments
+    """
+    output = [segment for segment in output if not isinstance(segment, bytes) or len(segment) > 0]
+    if len(output) > 0:
+        last = output[-1]
+        if isinstance(last, bytes):
+            output[-1] = last[:-len(newline)]
+        elif last[1] < size:
+            # The original's own last line is the only one without a line ending
+            output[-1] = (last[0], last[1] - len(newline))
+    return output
+
+
+def ends_with_newline(file_name: str) -> bool:
+    """
+    Checks whether the last line of a file has a line ending.
+    :param file_name: file to check
+    :return: False only if the file has a last line without a line ending
+    """
+    try:
+        with open(file_name, "rb") as file:
+            if file.seek(0, os.SEEK_END) == 0:
+                return True
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+    except OSError:
+        return True
+
+
+def keep_final_newline(lines, file_name: str):
+    """
+    Leaves the line ending off the last line if the file being replaced has none on its last line, as
+    write_spliced does. The file is checked when the first line is asked for, so just before it is written.
+    :param lines: iterable of lines, with line endings
+    :param file_name: file the lines are saved to
+    :return: generator of lines
+    """
+    strip = not ends_with_newline(file_name)
+    last = None
+    for line in lines:
+        if last is not None:
+            yield last
+        last = line
+    if last is not None:
+        yield last[:-1] if strip and last.endswith("\n") else last
+
+
+def write_spliced(store, end: int, side_a: bool, src_name: str, dst_fd: int) -> bool:
+    """
+    Write one side of the merge to an empty file, copying the unchanged byte ranges from the original.
+    :param store: row_store.RowStore holding the merge state
+    :param end: number of rows to save
+    :param side_a: True for the left hand file, False for the right hand file
+    :param src_name: original file
+    :param dst_fd: file descriptor of the output file
+    :return: True if the file was written, False if it has to be written line by line instead
+    """
+    try:
+        with open(src_name, "rb") as src:
+            if os.fstat(src.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                encoding = locale.getpreferredencoding(False)
+                index = LineIndex(data, separators=line_separators(encoding))
+                if not index.valid:
+                    return False
+                output = segments(store, end, side_a, index, encoding)
+                if output is None:
+                    return False
+                if data[-1:] != b"\n":
+                    output = without_final_newline(output, len(data), index.newline)
+
+                for n, segment in enumerate(output):
+                    if isinstance(segment, bytes):
+                        write_all(dst_fd, segment)
+                        continue
+                    copy_range(src.fileno(), dst_fd, data, segment[0], segment[1])
+                    # The last line of the original may not have a line ending, but more lines follow it
+                    if segment[1] == len(data) and n < len(output) - 1 and data[-1:] != b"\n":
+                        write_all(dst_fd, index.newline)
+    except (OSError, ValueError, UnicodeEncodeError):
+        return False
+    return True
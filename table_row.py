@@ -24,50 +24,48 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from copy import deepcopy
 from PyQt5 import QtCore
-from PyQt5.QtCore import pyqtSlot
-from PyQt5.QtWidgets import (
-    QPushButton,
-    QTableWidget,
-    QTableWidgetItem,
-)
+from PyQt5.QtCore import pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QTableWidget
 
 # Project imports
 import gui_config as gui_cfg
+import long_lines
 import pymerge_enums
+import row_store
 import undo_redo
 
 
 class Row(QtCore.QObject):
+    merged = pyqtSignal(int)  # Emits the line number after either side has been merged
+
     def __init__(
         self,
         row: int,
         table: QTableWidget,
-        right_text: str or None,
-        left_text: str or None,
+        store: row_store.RowStore,
         line_num: int,
         change_flags: list,
     ):
         """
-        Initialize the Row class instance
+        Initialize the Row class instance. The text and merge state of the row are read from the store.
         :param row: row number
         :param table: table widget instance
-        :param right_text: string containing the right side text
-        :param left_text: string containg the left side text
+        :param store: merge state of every line
         :param line_num:
         """
         super().__init__()
         self.row_num: int = row
         self.table: QTableWidget = table
-        self.right_text: str = right_text
-        self.left_text: str = left_text
+        self.store: row_store.RowStore = store
         self.line_num: int = line_num
         self.right_background_color = None
         self.left_background_color = None
         self.change_state_flags = deepcopy(change_flags)
-        self.row_deleted: list = [False, False]  # Indicates if either side was deleted.
-        self.right_button = None
-        self.left_button = None
+        self.has_merge_buttons: bool = False  # Merge buttons are painted by merge_button_delegate.py
         self.actual_indices = [-1, -1]    # Actual line numbers in the files
+        self.windows: list = [(0, 0)]     # Differing parts of a long line, see long_lines.diff_windows
+        self.window_idx: int = 0          # Index of the window that is shown
+        self.window_offset: int = 0       # Horizontal scroll position for long lines
         self.undo_ctrlr = undo_redo.UndoRedo.get_instance()
 
         # Set the left and right background colors
@@ -95,13 +93,34 @@ class Row(QtCore.QObject):
         elif self.change_state_flags[1] == pymerge_enums.CHANGEDENUM.SAME:
             self.set_right_background(gui_cfg.COLORS["ROW_DEFAULT"])
 
+        # Colors to go back to when a merge is undone
+        self.unmerged_colors: list = [self.left_background_color, self.right_background_color]
+        if self.store.state[self.line_num] != row_store.UNMERGED:
+            self.set_row_state()
+
+    @property
+    def right_text(self) -> str:
+        # The left hand file's line, shown in the left text column
+        return self.store.text_a(self.line_num)
+
+    @property
+    def left_text(self) -> str:
+        # The right hand file's line, shown in the right text column
+        return self.store.text_b(self.line_num)
+
+    @property
+    def row_deleted(self) -> list:
+        # Indicates if either side was deleted.
+        deleted = self.store.is_deleted(self.line_num)
+        return [deleted, deleted]
+
     def set_right_background(self, background, buttons=False):
         self.table.item(self.row_num, gui_cfg.RIGHT_TXT_COL_IDX).setBackground(
             background
         )        
         self.right_background_color = background
         if buttons:
-            self.add_row_merge_buttons()
+            self.has_merge_buttons = True
         self.table.repaint()
 
     def set_left_background(self, background, buttons=False):
@@ -110,59 +129,16 @@ class Row(QtCore.QObject):
         )
         self.left_background_color = background
         if buttons:
-            self.add_row_merge_buttons()
+            self.has_merge_buttons = True
         self.table.repaint()
 
-    def add_row_merge_buttons(self):
-        self.right_button = QPushButton(self.table)
-        self.right_button.setIcon(gui_cfg.ICONS["MERGE_RIGHT"])
-        self.right_button.clicked.connect(self.merge_right)
-        self.right_button.setMaximumSize(60, 40)
-        self.table.setCellWidget(self.line_num, 2, self.right_button)
-
-        self.left_button = QPushButton(self.table)
-        self.left_button.setIcon(gui_cfg.ICONS["MERGE_LEFT"])
-        self.left_button.clicked.connect(self.merge_left)
-        self.left_button.setMaximumSize(60, 40)
-        self.table.setCellWidget(self.line_num, 3, self.left_button)
-        return
-
     @pyqtSlot()
     def merge_right(self):
         """
         Merge lines from the right to the left
         :return: No return value
         """
-        # This is a significant user action so we need to record the change in the undo stack
-        self.undo_ctrlr.record_action(self)        
-        self.undo_ctrlr.undo_buf_size += 1
-        # Set booleans
-        if self.change_state_flags[1] == pymerge_enums.CHANGEDENUM.ADDED:
-            self.row_deleted[0] = True
-            self.row_deleted[1] = True
-
-        # Copy the left text to the right side
-        self.table.setItem(
-            self.row_num, gui_cfg.LEFT_TXT_COL_IDX, QTableWidgetItem(self.left_text)
-        )
-
-        # Set the background colors accordingly. We need a change flag to determine the color to use
-        self.table.item(self.row_num, gui_cfg.LEFT_TXT_COL_IDX).setBackground(
-            gui_cfg.COLORS["ROW_MERGED"]
-        )
-        self.table.item(self.row_num, gui_cfg.RIGHT_TXT_COL_IDX).setBackground(
-            gui_cfg.COLORS["ROW_MERGED"]
-        )
-
-        self.left_background_color = gui_cfg.COLORS["ROW_MERGED"]
-        self.right_background_color = gui_cfg.COLORS["ROW_MERGED"]
-        self.right_text = self.left_text
-        self.right_button.setEnabled(False)
-        self.left_button.setEnabled(False)
-                
-        # Table isn't gonna repaint itself. Gotta show users the changes we just made.
-        self.table.clearSelection()
-        self.table.repaint()
+        self.merge(row_store.MERGED_RIGHT)
 
     @pyqtSlot()
     def merge_left(self):
@@ -170,50 +146,73 @@ class Row(QtCore.QObject):
         Merge lines from the left to the right
         :return: No return value
         """
+        self.merge(row_store.MERGED_LEFT)
+
+    def merge(self, state: int):
+        """
+        Merge the row in either direction
+        :param state: row_store.MERGED_LEFT or row_store.MERGED_RIGHT
+        :return: No return value
+        """
         # This is a significant user action so we need to record the change in the undo stack
-        self.undo_ctrlr.record_action(self)    
-        self.undo_ctrlr.undo_buf_size += 1
-        # Set booleans
-        if self.change_state_flags[0] == pymerge_enums.CHANGEDENUM.ADDED:
-            self.row_deleted[0] = True
-            self.row_deleted[1] = True
-
-        # Copy the right text to the right side
-        self.table.setItem(
-            self.row_num, gui_cfg.RIGHT_TXT_COL_IDX, QTableWidgetItem(self.right_text)
-        )
+        prev_states = self.store.merge_span(self.line_num, self.line_num + 1, state)
+        self.undo_ctrlr.record_action(self.store, self.line_num, prev_states)
+        self.set_row_state()
 
-        # Set the background colors accordingly. We need a change flag to determine the color to use
-        self.table.item(self.row_num, gui_cfg.LEFT_TXT_COL_IDX).setBackground(
-            gui_cfg.COLORS["ROW_MERGED"]
-        )
-        self.table.item(self.row_num, gui_cfg.RIGHT_TXT_COL_IDX).setBackground(
-            gui_cfg.COLORS["ROW_MERGED"]
-        )
-        self.left_background_color = gui_cfg.COLORS["ROW_MERGED"]
-        self.right_background_color = gui_cfg.COLORS["ROW_MERGED"]
-        self.left_text = self.right_text
-        
-        self.left_button.setEnabled(False)
-        self.right_button.setEnabled(False)        
         # Table isn't gonna repaint itself. Gotta show users the changes we just made.
         self.table.clearSelection()
         self.table.repaint()
+        self.merged.emit(self.line_num)
 
-    def set_row_state(self):
-        self.table.setItem(
-            self.row_num, gui_cfg.LEFT_TXT_COL_IDX, QTableWidgetItem(self.right_text)
-        )
-        self.table.setItem(
-            self.row_num, gui_cfg.RIGHT_TXT_COL_IDX, QTableWidgetItem(self.left_text)
-        )
-
-        self.table.item(self.row_num, gui_cfg.RIGHT_TXT_COL_IDX).setBackground(
-            self.right_background_color
-        )
-        self.table.item(self.row_num, gui_cfg.LEFT_TXT_COL_IDX).setBackground(
-            self.left_background_color
-        )
+    def display_text(self, text: str, side_a: bool) -> str:
+        """
+        Gets the text to show in the table, only part of a long line is shown.
+        :param text: full line
+        :param side_a: True for the left hand file's line, False for the right hand file's
+        :return: text to show
+        """
+        # Once merged both sides hold the same line, so both show it from the same place
+        state = self.store.state[self.line_num]
+        if state != row_store.UNMERGED:
+            side_a = state == row_store.MERGED_LEFT
+        start = self.windows[self.window_idx][0 if side_a else 1]
+        return long_lines.window(text, start + self.window_offset)
+
+    def refresh_text(self):
+        """
+        Show the text again after the horizontal scroll position or the window of a long line has changed.
+        :return: No return value
+        """
+        self.table.item(self.row_num, gui_cfg.LEFT_TXT_COL_IDX).setText(self.display_text(self.right_text, True))
+        self.table.item(self.row_num, gui_cfg.RIGHT_TXT_COL_IDX).setText(self.display_text(self.left_text, False))
 
-        self.table.repaint()
+    def step_window(self, step: int) -> bool:
+        """
+        Show another of the differing windows of a long line.
+        :param step: 1 for the next window, -1 for the previous one, wrapping around
+        :return: True if the line has more than one window
+        """
+        if len(self.windows) < 2:
+            return False
+        self.window_idx = (self.window_idx + step) % len(self.windows)
+        self.refresh_text()
+        return True
 
+    def set_row_state(self):
+        """
+        Show the text and colors for the row's current merge state.
+        :return: No return value
+        """
+        merged = self.store.state[self.line_num] != row_store.UNMERGED
+        if merged:
+            self.left_background_color = gui_cfg.COLORS["ROW_MERGED"]
+            self.right_background_color = gui_cfg.COLORS["ROW_MERGED"]
+        else:
+            self.left_background_color, self.right_background_color = self.unmerged_colors
+
+        left_item = self.table.item(self.row_num, gui_cfg.LEFT_TXT_COL_IDX)
+        right_item = self.table.item(self.row_num, gui_cfg.RIGHT_TXT_COL_IDX)
+        left_item.setText(self.display_text(self.right_text, True))
+        right_item.setText(self.display_text(self.left_text, False))
+        left_item.setBackground(self.left_background_color)
+        right_item.setBackground(self.right_background_color)
@@ -22,11 +22,17 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 ###########################################################################
 """
 
+import gzip
 import hashlib
 import os
+import tempfile
+import time
+import zipfile
 from unittest import TestCase
 
+import backup_store
 import file_backup
+import merge_finalizer
 
 
 class TestBackup(TestCase):
@@ -97,6 +103,98 @@ class TestMethods(TestBackup):
         self.assertEqual(self.backup.get_hash("hash_test.txt"), "cf83e1357eefb8bdf1542850d66d8007d620e4050b5715dc83f4a921d36ce9ce47d0d13c5d85f2b0ff8318d2877eec2f63b931bd47417a81a538327af927da3e")
         os.remove("hash_test.txt")
 
+    def test_get_hash_contents(self):
+        with open("hash_test.txt", "wb") as file:
+            file.write(b"x" * (self.backup.BLOCK_SIZE * 2 + 1))
+        for hash_type in ("SHA256", "BLAKE2B"):
+            self.backup.hash_func = self.backup.get_hash_func(hash_type)
+            expected = self.backup.hash_func(b"x" * (self.backup.BLOCK_SIZE * 2 + 1)).hexdigest()
+            self.assertEqual(self.backup.get_hash("hash_test.txt"), expected)
+        os.remove("hash_test.txt")
+
+    def test_backup_round_trip(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                with open("backup_test.txt", "w") as file:
+                    file.write("line\n" * 50000)
+                self.backup.create_backup("backup_test.txt", ".")
+                self.assertEqual(
+                    self.backup.get_hash("backup_test.txt"), self.backup.get_hash_from_backup("backup_test.txt.bak")
+                )
+                meta_info = self.backup.get_meta_from_backup("backup_test.txt.bak")
+                self.assertEqual(("backup_test.txt", 250000), (meta_info["NAME"], meta_info["SIZE"]))
+
+                os.remove("backup_test.txt")
+                self.backup.retrieve_backup("backup_test.txt.bak", "backup_test.txt")
+                with open("backup_test.txt") as file:
+                    self.assertEqual("line\n" * 50000, file.read())
+                self.assertEqual(["backup_test.txt", "backup_test.txt.bak"], sorted(os.listdir(".")))
+            finally:
+                os.chdir(cwd)
+
+    def test_verify_and_restore_mismatch(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                with open("verify_test.txt", "w") as file:
+                    file.write("original\n")
+                self.backup.create_backup("verify_test.txt", ".")
+                self.assertTrue(self.backup.verify_backup("verify_test.txt.bak"))
+
+                # Same members, but the file no longer matches the hash
+                with zipfile.ZipFile("verify_test.txt.bak") as src, zipfile.ZipFile("bad.bak", "w") as dst:
+                    for name in src.namelist():
+                        dst.writestr(name, b"tampered\n" if name == "verify_test.txt" else src.read(name))
+                self.assertFalse(self.backup.verify_backup("bad.bak"))
+                self.assertFalse(self.backup.verify_backup("missing.bak"))
+
+                with open("verify_test.txt", "w") as file:
+                    file.write("current\n")
+                self.assertFalse(self.backup.retrieve_backup("bad.bak", "verify_test.txt"))
+                with open("verify_test.txt") as file:
+                    self.assertEqual("current\n", file.read())
+                self.assertTrue(self.backup.retrieve_backup("verify_test.txt.bak", "verify_test.txt"))
+                with open("verify_test.txt") as file:
+                    self.assertEqual("original\n", file.read())
+                self.assertEqual(["bad.bak", "verify_test.txt", "verify_test.txt.bak"], sorted(os.listdir(".")))
+            finally:
+                os.chdir(cwd)
+
+    def test_backup_codecs(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                with open("text.txt", "w") as file:
+                    file.write("line\n" * 50000)
+                with open("dense.bin", "wb") as file:
+                    file.write(os.urandom(300000))
+                self.assertEqual("deflate", self.backup.choose_codec("text.txt", "auto"))
+                self.assertEqual("stored", self.backup.choose_codec("dense.bin", "auto"))
+
+                for codec, level in (("stored", None), ("deflate", 1), ("bzip2", 9), ("lzma", None), ("auto", None)):
+                    backup = file_backup.Backup(codec=codec, level=level)
+                    backup.create_backup("text.txt", ".")
+                    os.remove("text.txt")
+                    backup.retrieve_backup("text.txt.bak", "text.txt")
+                    with open("text.txt") as file:
+                        self.assertEqual("line\n" * 50000, file.read())
+
+                # The level reaches the compressor
+                with open("words.txt", "w") as file:
+                    file.write(" ".join(str(n * n % 7919) for n in range(100000)))
+                sizes: list = []
+                for level in (1, 9):
+                    file_backup.Backup(codec="deflate", level=level).create_backup("words.txt", ".")
+                    with zipfile.ZipFile("words.txt.bak") as archive:
+                        sizes.append(archive.getinfo("words.txt").compress_size)
+                self.assertGreater(sizes[0], sizes[1])
+            finally:
+                os.chdir(cwd)
+
     def test_get_hash_file_name(self):
         self.assertEqual(self.backup.get_hash_file_name("SHA256"), "SHA256.txt")
         self.assertEqual(self.backup.get_hash_file_name("SHA224"), "SHA224.txt")
@@ -105,3 +203,155 @@ class TestMethods(TestBackup):
         self.assertEqual(self.backup.get_hash_file_name(""), ".txt")
         self.assertEqual(self.backup.get_hash_file_name("TEST"), "TEST.txt")
         self.assertEqual(self.backup.get_hash_file_name(" "), " .txt")
+
+
+class TestBackupStore(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = backup_store.BackupStore(os.path.join(self.tmp_dir.name, "store"))
+        self.file = os.path.join(self.tmp_dir.name, "store_test.txt")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def write_file(self, contents: str):
+        with open(self.file, "w") as file:
+            file.write(contents)
+
+    def test_unchanged_backup_skipped(self):
+        self.write_file("first\n")
+        digest = self.store.backup(self.file)
+        self.assertEqual(digest, self.store.backup(self.file))
+
+        # Rewriting the same contents doesn't add a version
+        self.write_file("first\n")
+        os.utime(self.file, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        self.assertEqual(digest, self.store.backup(self.file))
+        self.assertEqual(1, len(self.store.entries(self.file)))
+
+        # but records the new time, so the file isn't read again next time
+        self.assertEqual(os.stat(self.file).st_mtime_ns, self.store.latest(self.file)["mtime_ns"])
+        self.store.store_object = None
+        self.assertEqual(digest, self.store.backup(self.file))
+
+    def test_codecs(self):
+        self.write_file("line\n" * 10000)
+        root = os.path.join(self.tmp_dir.name, "store")
+        stored = backup_store.BackupStore(os.path.join(self.tmp_dir.name, "stored"), codec="stored")
+        stored_size = stored.stored_size(stored.backup(self.file))
+        for codec, ext in (("deflate", ".gz"), ("bzip2", ".bz2"), ("lzma", ".xz")):
+            store = backup_store.BackupStore(os.path.join(self.tmp_dir.name, codec), codec=codec, level=9)
+            digest = store.backup(self.file)
+            self.assertTrue(store.object_path(digest).endswith(ext))
+            self.assertLess(store.stored_size(digest), stored_size / 10)
+            self.assertEqual(codec, store.latest(self.file)["codec"])
+            self.assertTrue(store.verify(digest))
+
+        # Objects written with different codecs can share a store, each is read by its own extension
+        self.store = backup_store.BackupStore(root, delta=True, codec="lzma")
+        first = self.store.backup(self.file)
+        self.write_file("line\n" * 9999 + "last\n")
+        self.store = backup_store.BackupStore(root, delta=True, codec="bzip2")
+        second = self.store.backup(self.file)
+        self.assertEqual(["lzma", "bzip2"], [entry["codec"] for entry in self.store.entries(self.file)])
+        self.assertEqual([], self.store.verify_all())
+        restored = os.path.join(self.tmp_dir.name, "restored.txt")
+        self.assertTrue(self.store.restore(first, restored))
+        with open(restored) as file:
+            self.assertEqual("line\n" * 10000, file.read())
+        self.assertTrue(self.store.restore(second, restored))
+
+        with self.assertRaises(ValueError):
+            backup_store.BackupStore(root, codec="zstd")
+        with self.assertRaises(ValueError):
+            merge_finalizer.MergeFinalizer("a", "b", root, codec="zstd")
+        finalizer = merge_finalizer.MergeFinalizer("a", "b", root, codec="bzip2", level=1)
+        self.assertEqual(("bzip2", 1), (finalizer.backup.codec, finalizer.backup.level))
+
+    def test_versions_restore(self):
+        self.write_file("first\n")
+        first = self.store.backup(self.file)
+        self.write_file("second\n")
+        second = self.store.backup(self.file)
+        self.assertNotEqual(first, second)
+        self.assertEqual([first, second], [entry["digest"] for entry in self.store.entries(self.file)])
+
+        restored = os.path.join(self.tmp_dir.name, "restored.txt")
+        self.assertTrue(self.store.restore(first, restored))
+        with open(restored) as file:
+            self.assertEqual("first\n", file.read())
+
+    def test_delta_versions(self):
+        self.store = backup_store.BackupStore(os.path.join(self.tmp_dir.name, "store"), delta=True,
+                                              keyframe_interval=3)
+        lines = ["line %d of the file\n" % n for n in range(2000)]
+        versions: list = []
+        for version in range(7):
+            lines[version * 100] = "edit %d\r\n" % version
+            self.write_file("".join(lines))
+            versions.append((self.store.backup(self.file), "".join(lines)))
+
+        # Versions 0, 3 and 6 (the newest) are kept whole, the rest are small deltas
+        for version, (digest, contents) in enumerate(versions):
+            self.assertEqual(version % 3 == 0, os.path.exists(self.store.object_path(digest)))
+            self.assertNotEqual(version % 3 == 0, os.path.exists(self.store.delta_path(digest)))
+            if version % 3 != 0:
+                self.assertLess(os.path.getsize(self.store.delta_path(digest)), 200)
+
+            restored = os.path.join(self.tmp_dir.name, "restored.txt")
+            self.assertTrue(self.store.restore(digest, restored))
+            with open(restored, "rb") as file:
+                self.assertEqual(contents.encode(), file.read())
+
+    def test_verify(self):
+        self.write_file("good\n")
+        good = self.store.backup(self.file)
+        self.write_file("bad\n")
+        bad = self.store.backup(self.file)
+        self.assertEqual([], self.store.verify_all())
+
+        with gzip.open(self.store.object_path(bad), "wb") as corrupt:
+            corrupt.write(b"corrupt\n")
+        self.assertTrue(self.store.verify(good))
+        self.assertFalse(self.store.verify(bad))
+        self.assertEqual([bad], self.store.verify_all())
+
+        # A failed restore leaves the destination alone
+        self.assertFalse(self.store.restore(bad, self.file))
+        with open(self.file) as file:
+            self.assertEqual("bad\n", file.read())
+        self.assertEqual(["store", "store_test.txt"], sorted(os.listdir(self.tmp_dir.name)))
+
+    def test_prune(self):
+        self.store = backup_store.BackupStore(os.path.join(self.tmp_dir.name, "store"), delta=True,
+                                              keyframe_interval=100)
+        other = os.path.join(self.tmp_dir.name, "other.txt")
+        with open(other, "w") as file:
+            file.write("other\n")
+        other_digest = self.store.backup(other)
+
+        lines = ["line %d\n" % n for n in range(500)]
+        digests: list = []
+        for version in range(5):
+            lines[version] = "edit %d\n" % version
+            self.write_file("".join(lines))
+            digests.append(self.store.backup(self.file))
+        self.assertEqual(set(digests[1:4]), set(self.store.delta_bases()))
+
+        # Keeping the last two leaves version 3, a delta, and version 4, its base
+        removed = self.store.prune(keep_last=2)
+        self.assertEqual(digests[:3], [entry["digest"] for entry in removed])
+        self.assertEqual([other_digest] + digests[3:], [entry["digest"] for entry in self.store.entries()])
+        for digest in digests[:3]:
+            self.assertFalse(self.store.has_object(digest))
+        self.assertEqual([], self.store.verify_all())
+
+        # The newest version only just fits, so version 3 goes but its base stays
+        self.store.prune(max_size=self.store.stored_size(digests[4]) + self.store.stored_size(other_digest))
+        self.assertEqual([digests[4]], [entry["digest"] for entry in self.store.entries(self.file)])
+        self.assertTrue(self.store.verify(digests[4]))
+        self.assertFalse(self.store.has_object(digests[3]))
+
+        self.store.prune(max_age_days=1, now=time.time() + 2 * 24 * 60 * 60)
+        self.assertEqual([], self.store.entries())
+        self.assertFalse(self.store.has_object(other_digest))
@@ -22,12 +22,20 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 ###########################################################################
 """
 
+import functools
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 
-from PyQt5.QtWidgets import QApplication
+from PyQt5.QtWidgets import QApplication, QTableWidgetSelectionRange
 
+import diff_search
 import main_window
+import merge_finalizer
+import save_job
+import splice_writer
 
 app = QApplication(sys.argv)
 
@@ -39,6 +47,11 @@ class TestMainTable(unittest.TestCase):
         # for testing button presses on window with no input files
         self.mainWindow2 = main_window.MainWindow()
         self.table2 = self.mainWindow2.table_widget
+
+    def tearDown(self):
+        # Windows left open are still painted by later tests, and can be garbage collected part way through a paint
+        self.mainWindow.close()
+        self.mainWindow2.close()
         
     def test_goto_next_diff(self):        
         self.table.goto_next_diff()
@@ -125,6 +138,400 @@ class TestMainTable(unittest.TestCase):
         self.assertEqual(self.table.rows[8].left_text, self.table.rows[8].right_text)
         self.assertEqual(self.table.rows[9].left_text, self.table.rows[9].right_text)
 
+
+    def test_undo_transaction(self):
+        # Merges made inside a transaction are undone together
+        undo_redo = self.table.undo_ctrlr
+        undo_redo.begin()
+        self.table.rows[8].merge_right()
+        self.table.rows[9].merge_right()
+        undo_redo.commit()
+
+        self.table.undo_last_change()
+        self.assertNotEqual(self.table.rows[8].left_text, self.table.rows[8].right_text)
+        self.assertNotEqual(self.table.rows[9].left_text, self.table.rows[9].right_text)
+
+        # A new change drops the redo history
+        self.table.rows[8].merge_left()
+        self.assertIsNone(undo_redo.redo())
+
+    def test_undo_after_reload(self):
+        # Changes made to files that are no longer shown can't be undone
+        self.table.goto_diff(1)
+        self.table.merge_right()
+        # The same steps as main_window.MainWindow.open_file once the files are picked
+        self.table.clear_table()
+        self.mainWindow.fIO.diff_files("example_files/file1.c", "example_files/file2.c")
+        self.table.load_table_contents("example_files/file1.c", "example_files/file2.c")
+        states = bytes(self.table.store.state)
+
+        self.assertIsNone(self.table.undo_ctrlr.undo())
+        self.table.undo_last_change()
+        self.assertEqual(states, bytes(self.table.store.state))
+        self.assertFalse(any(self.table.diff_block_merged))
+
+    def test_undo_stale_records(self):
+        # Records made before the store was cleared are dropped, even if the history itself wasn't cleared
+        undo_redo = self.table.undo_ctrlr
+        buf_size = undo_redo.buf_size
+        undo_redo.buf_size = 1
+        try:
+            self.table.goto_diff(1)
+            self.table.merge_right()
+            self.table.goto_diff(2)
+            self.table.merge_right()
+            undo_redo.begin()
+            self.table.goto_diff(3)
+            self.table.merge_right()
+            self.table.store.clear()
+            self.table.store.extend(0, len(self.table.change_set_a.change_list) - 1)
+            undo_redo.commit()
+
+            self.assertGreater(len(undo_redo._undo_buf.spilled), 0)
+            self.assertIsNone(undo_redo.undo())
+            self.assertEqual(0, len(undo_redo._undo_buf))
+            self.assertEqual(bytes(len(self.table.store)), bytes(self.table.store.state))
+        finally:
+            undo_redo.buf_size = buf_size
+
+    def test_undo_spill(self):
+        # With a tiny buffer, older changes are moved to the temporary file and still undo in order
+        undo_redo = self.table.undo_ctrlr
+        buf_size = undo_redo.buf_size
+        undo_redo.buf_size = 1
+        try:
+            self.table.goto_diff(1)
+            self.table.merge_right()
+            self.table.goto_diff(2)
+            self.table.merge_right()
+            self.assertGreater(len(undo_redo._undo_buf.spilled), 0)
+
+            self.table.undo_last_change()
+            self.table.undo_last_change()
+            self.assertFalse(any(self.table.diff_block_merged))
+        finally:
+            undo_redo.buf_size = buf_size
+
+    def test_merge_all(self):
+        self.table.merge_all_right()
+        left_lines, right_lines = self.table.get_lines_from_tbl()
+        self.assertEqual(left_lines, right_lines)
+        self.assertTrue(all(self.table.diff_block_merged))
+
+        self.assertEqual(0, self.table.unresolved_count)
+        self.assertTrue(self.table.store.sides_equal())
+        self.assertEqual("0 conflicts remaining", self.mainWindow.unresolved_label.text())
+
+        # Merging every block is a single change
+        self.table.undo_last_change()
+        self.assertFalse(any(self.table.diff_block_merged))
+        self.assertEqual(len(self.table.diff_block_merged), self.table.unresolved_count)
+        self.assertFalse(self.table.store.sides_equal())
+
+    def test_sides_equal_swapped_lines(self):
+        # Lines swapped between two rows leave the same set of texts on each side, but the files differ
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_a = os.path.join(tmp_dir, "file_a.c")
+            file_b = os.path.join(tmp_dir, "file_b.c")
+            with open(file_a, "w") as file:
+                file.write("x\nfoo\nm\nn\no\nbar\nz\n")
+            with open(file_b, "w") as file:
+                file.write("x\nbar\nm\nn\no\nfoo\nz\n")
+            window = main_window.MainWindow(file_a, file_b)
+            table = window.table_widget
+            self.assertEqual(2, table.unresolved_count)
+            self.assertFalse(table.store.sides_equal())
+            table.merge_all_left()
+            self.assertTrue(table.store.sides_equal())
+            window.close()
+
+    def test_merge_selection(self):
+        # Selecting part of the second and third blocks merges both of them completely
+        self.table.table.setRangeSelected(
+            QTableWidgetSelectionRange(9, 0, self.table.diff_indices[2], 4), True
+        )
+        self.table.merge_selection_left()
+        self.assertEqual([False, True, True, False], self.table.diff_block_merged[:4])
+        self.assertEqual(self.table.rows[8].right_text, self.table.rows[8].left_text)
+
+    def test_write_merged_files(self):
+        # Saving writes both files through a temporary file, in a scratch directory so backups end up there too
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_a = shutil.copy("example_files/file1.c", tmp_dir)
+            file_b = shutil.copy("example_files/file2.c", os.path.join(tmp_dir, "file2.c"))
+            window = main_window.MainWindow(file_a, file_b)
+            table = window.table_widget
+            table.merge_all_left()
+            expected = [line for line in table.get_lines_from_tbl()[1] if line is not None]
+
+            statuses = []
+            table.save_finished.connect(statuses.append)
+            os.chdir(tmp_dir)
+            try:
+                # Both files are saved in the background
+                table.write_merged_files()
+                while table.save_job is not None:
+                    app.processEvents()
+            finally:
+                os.chdir(cwd)
+            self.assertEqual([merge_finalizer.Status.MERGE_FINALIZE_SUCCESS], statuses)
+            self.assertEqual("Files saved", window.statusBar().currentMessage())
+            window.close()
+
+            with open(file_a) as file:
+                lines_a = file.read().splitlines()
+            with open(file_b) as file:
+                lines_b = file.read().splitlines()
+            self.assertEqual(expected, lines_a)
+            self.assertEqual(lines_a, lines_b)
+            self.assertEqual([], [name for name in os.listdir(tmp_dir) if name.startswith(".")])
+
+    def test_save_backup_failure(self):
+        # Neither file is written if either backup fails
+        class FailingFinalizer(merge_finalizer.MergeFinalizer):
+            def backup_one(self, file_name):
+                if file_name == self.outp_file_right:
+                    return merge_finalizer.Status.BACKUP_ERROR
+                return super().backup_one(file_name)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_a = shutil.copy("example_files/file1.c", tmp_dir)
+            file_b = shutil.copy("example_files/file2.c", tmp_dir)
+            merge_writer = FailingFinalizer(file_a, file_b, os.path.join(tmp_dir, "file_backup"))
+            files = [(file_a, ["merged\n"], None), (file_b, ["merged\n"], None)]
+            job = save_job.SaveJob(merge_writer, files)
+            statuses = []
+            job.save_finished.connect(statuses.append)
+            job.start()
+            while not statuses:
+                app.processEvents()
+
+            self.assertEqual([merge_finalizer.Status.BACKUP_ERROR], statuses)
+            for file_name, original in ((file_a, "example_files/file1.c"), (file_b, "example_files/file2.c")):
+                with open(file_name) as file, open(original) as expected:
+                    self.assertEqual(expected.read(), file.read())
+
+    def test_splice_save(self):
+        # Copying the unchanged parts of the original should give the same file as writing every line
+        self.table.goto_diff(1)
+        self.table.merge_right()
+        line_count = len(self.table.rows)
+        expected = "".join(self.table.store.merged_lines(line_count, side_a=True)).encode()
+
+        with tempfile.TemporaryFile() as file:
+            self.assertTrue(
+                splice_writer.write_spliced(
+                    self.table.store, line_count, True, "example_files/file1.c", file.fileno()
+                )
+            )
+            file.seek(0)
+            self.assertEqual(expected, file.read())
+
+    def test_splice_save_form_feed(self):
+        # splitlines breaks the diff rows at the form feed, so the original can't be mapped by its newlines
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_a = os.path.join(tmp_dir, "file_a.c")
+            file_b = os.path.join(tmp_dir, "file_b.c")
+            with open(file_a, "w") as file:
+                file.write("start\npage\fbreak\nsame\nCHANGE_A\n")
+            with open(file_b, "w") as file:
+                file.write("start\npage\fbreak\nsame\nCHANGE_B\n")
+            window = main_window.MainWindow(file_a, file_b)
+            table = window.table_widget
+            table.goto_diff(0)
+            table.merge_right()
+            line_count = len(table.rows)
+            expected = "".join(table.store.merged_lines(line_count, side_a=True))
+
+            with tempfile.TemporaryFile() as file:
+                self.assertFalse(splice_writer.write_spliced(table.store, line_count, True, file_a, file.fileno()))
+            splice = functools.partial(splice_writer.write_spliced, table.store, line_count, True)
+            self.assertEqual(
+                merge_finalizer.Status.FILE_WRITE_SUCCESS,
+                merge_finalizer.MergeFinalizer.write_file(
+                    file_a, table.store.merged_lines(line_count, side_a=True), splice
+                )
+            )
+            window.close()
+            with open(file_a) as file:
+                saved = file.read()
+            self.assertEqual(expected, saved)
+            self.assertEqual(1, saved.count("CHANGE_"))
+
+    def test_save_no_final_newline(self):
+        # Both ways of saving leave the last line without a line ending, as it was in the original
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_a = os.path.join(tmp_dir, "file_a.c")
+            file_b = os.path.join(tmp_dir, "file_b.c")
+            for last_a, last_b in (("CHANGE_A", "CHANGE_B"), ("CHANGE_A\nsame", "CHANGE_B\nsame")):
+                with open(file_a, "w") as file:
+                    file.write("start\nsame\n" + last_a)
+                with open(file_b, "w") as file:
+                    file.write("start\nsame\n" + last_b)
+                window = main_window.MainWindow(file_a, file_b)
+                table = window.table_widget
+                table.goto_diff(0)
+                table.merge_right()
+                line_count = len(table.rows)
+                expected = "".join(table.store.merged_lines(line_count, side_a=True)).rstrip("\n")
+
+                saved: list = []
+                for splice in (functools.partial(splice_writer.write_spliced, table.store, line_count, True), None):
+                    shutil.copy(file_a, file_a + ".orig")
+                    lines = splice_writer.keep_final_newline(table.store.merged_lines(line_count, side_a=True), file_a)
+                    self.assertEqual(
+                        merge_finalizer.Status.FILE_WRITE_SUCCESS,
+                        merge_finalizer.MergeFinalizer.write_file(file_a, lines, splice)
+                    )
+                    with open(file_a) as file:
+                        saved.append(file.read())
+                    os.replace(file_a + ".orig", file_a)
+                window.close()
+                self.assertEqual([expected, expected], saved)
+                self.assertEqual(1, expected.count("CHANGE_"))
+
+    def test_long_lines(self):
+        same = "".join(str(n % 10) for n in range(3000))
+        changed_a = "a" * 2000 + "X" + "b" * 999
+        changed_b = "a" * 2000 + "Y" + "b" * 999
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_a = os.path.join(tmp_dir, "file_a.txt")
+            file_b = os.path.join(tmp_dir, "file_b.txt")
+            with open(file_a, "w") as file:
+                file.write(f"{same}\n{changed_a}\n")
+            with open(file_b, "w") as file:
+                file.write(f"{same}\n{changed_b}\n")
+            window = main_window.MainWindow(file_a, file_b)
+            table = window.table_widget
+
+            # Identical lines start at the start, changed ones just before the difference
+            self.assertTrue(table.table.item(0, 1).text().startswith(same[:100]))
+            self.assertIn("X", table.table.item(1, 4).text() + table.table.item(1, 1).text())
+
+            # Scrolling back from the anchor reaches the start of the changed line
+            table.line_scroll.setValue(table.line_scroll.minimum())
+            self.assertLess(table.line_scroll.minimum(), 0)
+            self.assertTrue(table.table.item(1, 1).text().startswith("a" * 100))
+            self.assertTrue(table.table.item(0, 1).text().startswith(same[:100]))
+            window.close()
+
+            # A line with several differences, the second after text inserted on one side, can be stepped
+            # through each of them
+            part = ["".join(f"{n}," for n in range(start, start + 300)) for start in range(0, 1200, 300)]
+            with open(file_a, "w") as file:
+                file.write("start\n" + part[0] + "X" + part[1] + part[2] + "P" + part[3] + "\n")
+            with open(file_b, "w") as file:
+                file.write("start\n" + part[0] + "Y" + part[1] + "inserted" + part[2] + "Q" + part[3] + "\n")
+            window = main_window.MainWindow(file_a, file_b)
+            table = window.table_widget
+            table.line_scroll.setValue(0)
+            self.assertEqual(3, len(table.rows[1].windows))
+            table.table.setCurrentCell(1, 1)
+            shown: list = []
+            for _ in range(4):
+                shown.append(table.table.item(1, 1).text() + "|" + table.table.item(1, 4).text())
+                table.goto_next_line_window()
+            self.assertIn("X", shown[0])
+            self.assertIn("Y", shown[0])
+            self.assertIn("inserted", shown[1])
+            self.assertIn("P", shown[2])
+            self.assertIn("Q", shown[2])
+            self.assertEqual(shown[0], shown[3])
+            table.goto_prev_line_window()
+            table.goto_prev_line_window()
+            self.assertIn("P", table.table.item(1, 1).text())
+            window.close()
+
+    def test_fold_unchanged(self):
+        row_count = self.table.table.rowCount()
+        self.table.set_fold_context(1)
+        self.assertLess(self.table.table.rowCount(), row_count)
+        self.assertEqual(-1, self.table.line_at(self.table.fold_rows[0]))
+
+        # Jumping to a diff should land on the same lines as in the full view
+        self.table.goto_next_diff()
+        self.table.goto_next_diff()
+        self.assertEqual(9, self.table.line_at(self.table.table.currentRow()))
+
+        self.table.set_fold_context(-1)
+        self.assertEqual(row_count, self.table.table.rowCount())
+        self.assertEqual([], self.table.fold_starts)
+
+    def test_minimap_merged_blocks(self):
+        self.table.goto_diff(1)
+        self.assertEqual(9, self.table.table.currentRow())
+
+        # Merged blocks are picked up once control returns to the event loop
+        self.table.merge_right()
+        app.processEvents()
+        self.assertEqual([False, True], self.table.diff_block_merged[:2])
+
+        self.table.undo_last_change()
+        self.assertFalse(self.table.diff_block_merged[1])
+
+        # Merging a block redraws just that block in the cached minimap, merging every block redraws all of it
+        minimap = self.table.minimap
+        minimap.redraw()
+        pixmap = minimap.pixmap
+        self.table.goto_diff(1)
+        self.table.merge_left()
+        self.assertTrue(self.table.diff_block_merged[1])
+        self.assertIs(pixmap, minimap.pixmap)
+        self.table.undo_last_change()
+        self.assertIs(pixmap, minimap.pixmap)
+        self.table.merge_all_left()
+        self.assertIsNone(minimap.pixmap)
+
+    def test_search(self):
+        search_bar = self.mainWindow.search_bar
+        search_bar.search_text.setText("typedef struct")
+        # The search starts once typing pauses
+        self.assertIsNone(search_bar.worker)
+        while search_bar.search_timer.isActive() or search_bar.worker is not None:
+            app.processEvents()
+
+        lines_a, lines_b = self.table.get_side_lines()
+        expected = [n * 2 for n, line in enumerate(lines_a) if "typedef struct" in line]
+        expected += [n * 2 + 1 for n, line in enumerate(lines_b) if "typedef struct" in line]
+        self.assertEqual(sorted(expected), search_bar.matches)
+
+        # Next should land on the match after the first one, and previous should wrap back around
+        search_bar.find_next()
+        self.assertEqual(search_bar.matches[1] // 2, self.table.line_at(self.table.table.currentRow()))
+        search_bar.find_prev()
+        search_bar.find_prev()
+        self.assertEqual(len(search_bar.matches) - 1, search_bar.curr_match)
+
+        # Merged lines are searched with their new text, without copying every line again
+        self.table.goto_diff(1)
+        self.table.merge_right()
+        search_bar.search_text.setText("typedef structtypedefC")
+        while search_bar.search_timer.isActive() or search_bar.worker is not None:
+            app.processEvents()
+        self.assertEqual([16, 17], search_bar.matches)
+
+    def test_search_lines(self):
+        # Patterns that can match the newline between two lines only report lines that match on their own
+        lines = ["ab", "cd", "x y", "ef"]
+        self.assertEqual([2], diff_search.find_lines(diff_search.compile_pattern(r"\s", True, True), lines, 0, 4))
+        self.assertEqual([], diff_search.find_lines(diff_search.compile_pattern(r"b.*\nc", True, True), lines, 0, 4))
+        self.assertEqual(
+            [0, 1, 2, 3], diff_search.find_lines(diff_search.compile_pattern(r"[^q]", True, True), lines, 0, 4)
+        )
+        self.assertEqual([3], diff_search.find_lines(diff_search.compile_pattern("^e", True, True), lines, 0, 4))
+
+    def test_progressive_load(self):
+        # Rows streamed in from the worker thread should match a regular load
+        self.table2.load_table_contents_progressive("example_files/file1.c", "example_files/file2.c")
+        while self.table2.diff_worker is not None:
+            app.processEvents()
+
+        self.assertEqual(len(self.table.rows), len(self.table2.rows))
+        self.assertEqual(self.table.diff_indices, self.table2.diff_indices)
+        self.assertEqual(self.table.diff_index_block_end, self.table2.diff_index_block_end)
+        self.assertEqual(self.table.rows[9].left_text, self.table2.rows[9].left_text)
+
             
 if __name__ == '__main__':
     unittest.main()
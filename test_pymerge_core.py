@@ -0,0 +1,283 @@
+"""
+###########################################################################
+File: test_pymerge_core.py
+Author:
+Description: Unit tests for pymerge_core.py
+
+
+Copyright (C) PyMerge Team 2019
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+###########################################################################
+"""
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import batch_diff
+import diff_resolution
+import diff_writer
+import longest_common_subseq
+import patch_apply
+import PyMerge
+import pymerge_core
+import pymerge_enums
+import quick_compare
+
+MAX_IMPORT_SECONDS = 0.1
+
+IMPORT_SCRIPT = """
+import sys
+import time
+start = time.perf_counter()
+import batch_diff
+import diff_writer
+import patch_apply
+import pymerge_core
+import quick_compare
+print(time.perf_counter() - start, "PyQt5" in sys.modules)
+"""
+
+
+class TestPyMergeCore(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def write_file(self, name: str, lines: list) -> str:
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "w") as file:
+            file.write("".join(line + "\n" for line in lines))
+        return path
+
+    def test_import_without_qt(self):
+        # Each run is a fresh interpreter, the best of three keeps a busy machine from failing the test
+        times: list = []
+        for _ in range(3):
+            output = subprocess.run(
+                [sys.executable, "-c", IMPORT_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.PIPE, check=True, universal_newlines=True
+            ).stdout.split()
+            self.assertEqual("False", output[1])
+            times.append(float(output[0]))
+        self.assertLess(min(times), MAX_IMPORT_SECONDS)
+
+    def test_diff(self):
+        left = self.write_file("left.txt", ["same", "old", "same 2", "gone", "end"])
+        right = self.write_file("right.txt", ["same", "new", "same 2", "end"])
+        diff_result = pymerge_core.diff(left, right)
+        self.assertEqual(pymerge_enums.RESULT.GOOD, diff_result.result)
+        self.assertFalse(diff_result.identical)
+        self.assertEqual([[1, 2], [3, 4]], diff_result.hunks)
+
+        rows = list(diff_result.rows())
+        self.assertEqual(diff_result.row_count, len(rows))
+        self.assertEqual(("old", "new"), (rows[1][1], rows[1][3]))
+        self.assertEqual((pymerge_enums.CHANGEDENUM.SAME, "end", pymerge_enums.CHANGEDENUM.SAME, "end"), rows[-1])
+
+        self.assertTrue(pymerge_core.diff(left, left).identical)
+        self.assertEqual(pymerge_enums.RESULT.BADFILE, pymerge_core.diff(left, right + ".zip").result)
+        self.assertEqual(
+            pymerge_enums.RESULT.BADFILE, pymerge_core.diff(left, os.path.join(self.tmp_dir.name, "none.txt")).result
+        )
+
+        # An engine that doesn't exist, or hasn't been built, isn't quietly replaced by another one
+        self.assertTrue(pymerge_core.diff(left, left, "myers").identical)
+        unusable = ["fastest"] + ([] if longest_common_subseq.cython_available else ["cython"])
+        for engine in unusable:
+            self.assertRaises(ValueError, pymerge_core.diff, left, right, engine)
+            self.assertRaises(ValueError, pymerge_core.diff_lines, ["a"], ["b"], engine)
+            self.assertRaises(ValueError, longest_common_subseq.padded_lcs, ["a"], ["b"], 1, engine)
+            self.assertRaises(ValueError, batch_diff.run_batch, [(left, right)], io.StringIO(), 1, engine)
+
+    def test_diff_blocks(self):
+        lines_a = ["line %d" % n for n in range(3000)]
+        lines_b = list(lines_a)
+        for n in range(10, 3000, 100):
+            lines_b[n] = "changed %d" % n
+        lcs_calls: list = []
+        padded_lcs = longest_common_subseq.padded_lcs
+
+        def counting_lcs(*args):
+            lcs_calls.append(len(args[0]))
+            return padded_lcs(*args)
+
+        longest_common_subseq.padded_lcs = counting_lcs
+        try:
+            rows = diff_resolution.iter_diff(lines_a, lines_b)
+            # The rows past the first change are yielded once the first block is diffed
+            first_rows = [next(rows) for _ in range(20)]
+            self.assertEqual(1, len(lcs_calls))
+            self.assertLess(lcs_calls[0], len(lines_a))
+            rows = first_rows + list(rows)
+        finally:
+            longest_common_subseq.padded_lcs = padded_lcs
+        self.assertGreater(len(lcs_calls), 1)
+
+        # Splitting the files gives the same rows as one LCS over the whole of them
+        self.assertEqual(list(range(3000)), [row[0] for row in rows])
+        for n, row in enumerate(rows):
+            changed = (n - 10) % 100 == 0
+            self.assertEqual(pymerge_enums.CHANGEDENUM.CHANGED if changed else pymerge_enums.CHANGEDENUM.SAME, row[1])
+            self.assertEqual((lines_a[n], lines_b[n]), (row[2], row[4]))
+            self.assertEqual((-1, -1) if changed else (n, n), row[5:])
+
+    def test_batch(self):
+        same = self.write_file("same.txt", ["a", "b"])
+        other = self.write_file("other.txt", ["a", "c"])
+        manifest = [f"{same}\t{same}\n", "# comment\n", "\n", f"{same} {other}\n"] * 5
+        pairs = batch_diff.read_manifest(manifest)
+        self.assertEqual([(same, same), (same, other)] * 5, pairs)
+
+        out = io.StringIO()
+        self.assertEqual(batch_diff.EXIT_DIFFERENT, batch_diff.run_batch(pairs, out, workers=2, chunk_size=1))
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(pairs, [(result["left"], result["right"]) for result in results])
+        self.assertEqual([True, False] * 5, [result["identical"] for result in results])
+        self.assertEqual([0, 1] * 5, [result["hunks"] for result in results])
+
+        out = io.StringIO()
+        missing = os.path.join(self.tmp_dir.name, "missing.txt")
+        self.assertEqual(batch_diff.EXIT_ERROR, batch_diff.run_batch([(same, missing)], out, workers=1))
+        self.assertEqual("BADFILE", json.loads(out.getvalue())["status"])
+
+    def test_cli_counts(self):
+        # A count that isn't a number is reported instead of raising
+        same = self.write_file("same.txt", ["a", "b"])
+        for func, options in (
+            (PyMerge.PyMergeCLI.batch_func, ["--workers", "two", same]),
+            (PyMerge.PyMergeCLI.batch_func, ["--workers", "0", same]),
+            (PyMerge.PyMergeCLI.diff_output_func, ["--unified", same, "--context", "3.5", same]),
+            (PyMerge.PyMergeCLI.diff_output_func, ["--unified", same, "--context", "-1", same]),
+            (PyMerge.PyMergeCLI.patch_func, [same, "--window", "ten", same]),
+        ):
+            err = io.StringIO()
+            with contextlib.redirect_stderr(err):
+                self.assertEqual(2, func(options))
+            self.assertTrue(err.getvalue().startswith(f"Error: {options[-3]}"))
+
+    def test_cli_large_files(self):
+        # Files from the command line are accepted whatever their size
+        left = self.write_file("left.txt", ["line %d" % n for n in range(50000)])
+        right = self.write_file("right.txt", ["line %d" % n for n in range(50001)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli = PyMerge.PyMergeCLI(["PyMerge.py", "--about"])
+        self.assertTrue(cli.validate_files(left, right, path_check=True))
+
+    def test_writers(self):
+        diff_result = pymerge_core.diff_lines(
+            ["a", "b", "c", "d", "e", "f", "g", "h", "i"], ["x", "a", "B", "c", "d", "e", "f", "g", "h"], "auto",
+            "left.txt", "right.txt"
+        )
+        # Differences before the first matching line have no table row, but are still in the output
+        self.assertEqual([[0, 0, 0, 1], [1, 2, 2, 3], [8, 9, 9, 9]], diff_result.file_hunks)
+
+        # Matches diff -U1
+        out = io.StringIO()
+        diff_writer.write_chunks(diff_writer.unified_diff(diff_result, context=1), out)
+        self.assertEqual(
+            "--- left.txt\n+++ right.txt\n"
+            "@@ -1,3 +1,4 @@\n+x\n a\n-b\n+B\n c\n"
+            "@@ -8,2 +9 @@\n h\n-i\n",
+            out.getvalue()
+        )
+
+        out = io.StringIO()
+        diff_writer.write_chunks(diff_writer.json_hunks(diff_result), out)
+        hunks = json.loads(out.getvalue())["hunks"]
+        self.assertEqual(3, len(hunks))
+        self.assertEqual({"start": 1, "end": 2, "lines": ["b"]}, hunks[1]["left"])
+        self.assertEqual({"start": 2, "end": 3, "lines": ["B"]}, hunks[1]["right"])
+
+        self.assertEqual([], list(diff_writer.unified_diff(pymerge_core.diff_lines(["a"], ["a"]))))
+
+    def test_no_newline(self):
+        left = os.path.join(self.tmp_dir.name, "left.txt")
+        right = os.path.join(self.tmp_dir.name, "right.txt")
+        # Matches diff -u, and the last line is only context when neither file ends with a line ending
+        cases = [
+            ("a\nb\nc", "a\nb\nc\n", "@@ -1,3 +1,3 @@\n a\n b\n-c\n\\ No newline at end of file\n+c\n"),
+            ("a\nb\nc", "a\nB\nc", "@@ -1,3 +1,3 @@\n a\n-b\n+B\n c\n\\ No newline at end of file\n"),
+            ("x", "x\ny", "@@ -1 +1,2 @@\n-x\n\\ No newline at end of file\n+x\n+y\n\\ No newline at end of file\n"),
+        ]
+        for left_text, right_text, hunks in cases:
+            with open(left, "w") as file:
+                file.write(left_text)
+            with open(right, "w") as file:
+                file.write(right_text)
+            diff_result = pymerge_core.diff(left, right)
+            self.assertFalse(diff_result.identical)
+            patch = "".join(diff_writer.unified_diff(diff_result, left_label="a", right_label="b"))
+            self.assertEqual("--- a\n+++ b\n" + hunks, patch)
+
+            # The marker lets the patch recreate the file exactly
+            result = patch_apply.apply_patch(left, patch.encode().splitlines(True))
+            self.assertEqual(patch_apply.Status.APPLIED, result.status)
+            with open(left) as file:
+                self.assertEqual(right_text, file.read())
+
+    def test_patch(self):
+        lines_a = [f"line {n}" for n in range(20)]
+        lines_b = lines_a[:2] + ["new"] + lines_a[3:15] + lines_a[16:]
+        patch = "".join(diff_writer.unified_diff(pymerge_core.diff_lines(lines_a, lines_b, "auto", "a", "b"), 1))
+        patch_lines = io.BytesIO(patch.encode()).readlines()
+
+        # The file has gained lines since the patch was made, so the hunks are found a few lines later
+        path = self.write_file("patched.txt", ["extra"] * 3 + lines_a)
+        result = patch_apply.apply_patch(path, patch_lines)
+        self.assertEqual(patch_apply.Status.APPLIED, result.status)
+        self.assertEqual([3, 3], result.offsets)
+        self.assertEqual(["extra"] * 3 + lines_b, pymerge_core.read_lines(path))
+
+        # Applying it again fails, and the file is left alone
+        result = patch_apply.apply_patch(path, patch_lines)
+        self.assertEqual(patch_apply.Status.HUNK_FAILED, result.status)
+        self.assertEqual([1, 2], result.failed)
+        self.assertEqual(["extra"] * 3 + lines_b, pymerge_core.read_lines(path))
+
+        path = self.write_file("no_newline.txt", ["a", "b"])
+        patch_lines = [b"--- a\n", b"+++ b\n", b"@@ -2 +2,2 @@\n", b"-b\n", b"+c\n", b"+d\n",
+                       b"\\ No newline at end of file\n"]
+        self.assertEqual(patch_apply.Status.APPLIED, patch_apply.apply_patch(path, patch_lines).status)
+        with open(path, "rb") as file:
+            self.assertEqual(b"a\nc\nd", file.read())
+        self.assertEqual(patch_apply.Status.BADPATCH, patch_apply.apply_patch(path, patch_lines[:4]).status)
+
+    def test_quick_compare(self):
+        paths = {}
+        for name, data in (("lf", b"a\nb\n" * 10), ("lf2", b"a\nb\n" * 10), ("crlf", b"a\r\nb\r\n" * 10),
+                           ("cr", b"a\rb\r" * 10), ("other", b"a\nb\n" * 9 + b"a\nc\n")):
+            paths[name] = os.path.join(self.tmp_dir.name, name)
+            with open(paths[name], "wb") as file:
+                file.write(data)
+
+        # Small blocks split CRLF pairs and compare blocks of different lengths
+        for block_size in (1, 3, quick_compare.BLOCK_SIZE):
+            def compare(left, right, ignore_line_endings=False):
+                return quick_compare.compare(paths[left], paths[right], ignore_line_endings, block_size)
+            self.assertEqual(quick_compare.Status.IDENTICAL, compare("lf", "lf2"))
+            self.assertEqual(quick_compare.Status.DIFFERENT, compare("lf", "other"))
+            self.assertEqual(quick_compare.Status.DIFFERENT, compare("lf", "crlf"))
+            self.assertEqual(quick_compare.Status.IDENTICAL, compare("lf", "crlf", True))
+            self.assertEqual(quick_compare.Status.DIFFERENT, compare("lf", "cr", True))
+            self.assertEqual(quick_compare.Status.DIFFERENT, compare("crlf", "other", True))
+        self.assertEqual(quick_compare.Status.ERROR, quick_compare.compare(paths["lf"], paths["lf"] + ".missing"))
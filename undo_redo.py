@@ -24,99 +24,190 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 """
-Undo function can be implemented by keeping a buffer of each state change. That is, each time a change is made, 
-the row state is  copied to a list containing the last n number of row copies. If undo is selected, the 
-undo index is recorded and that copy of the row state is used to replace the current working version. The current working version
-is then copied to a redo buffer. 
+Undo function can be implemented by keeping a buffer of each state change. Merges only change the merge state
+of lines in a row_store.RowStore, so each change is recorded as the first line it touched and the states the
+lines had before it. Undoing a change swaps the recorded states with the current ones, so the same record
+can be pushed onto the redo buffer.
+
+Changes made between begin() and commit() are grouped into one transaction, which is undone and redone in a
+single step. A change recorded outside of a transaction is a transaction of its own. Undo and redo return the
+transaction they applied, so callers can refresh only the lines it touched.
+
+The buffers are capped by the memory used by the records rather than by the number of records, as a record
+for a whole file merge is far bigger than one for a single line. Once the cap is reached the oldest records
+are moved to a temporary file, which is used as a stack in the same order, or dropped if spilling is off.
+
+Each record keeps the generation its store had when the change was made. Clearing a store for new files
+bumps its generation, so a record that outlived the files it was made for, whether in memory, spilled or in an
+open transaction, is dropped when it is reached instead of being applied to the new lines.
 """
 
+import collections
+import tempfile
 
-class Stack(object):
-    def __init__(self, stack_size: int):
-        self._max_size: int = 0
-        self.stack = []
 
-        self.max_size = stack_size
+class History(object):
+    RECORD_OVERHEAD = 100  # Rough size of a record object, on top of its state bytes
 
-    @property
-    def max_size(self) -> int:
-        return self._max_size
-
-    @max_size.setter
-    def max_size(self, value: int):
-        self._max_size = value
-
-    def stack_push(self, item):
-        # Check if stack is full, then append the object onto the end
-        if len(self.stack) < self.max_size or self.max_size == -1:
-            self.stack.append(item)
-            
-        else:
-            self._rotate()
-            self.stack[-1] = item
-
-    def _rotate(self):
-        # Move the stack up, "forgetting" the oldest undo or redo move
-        for n in range(1, len(self.stack)):
-            self.stack[n - 1] = self.stack[n]
-
-    def stack_pop(self):
-        # Check if stack is empty, then pop the top object
-        # return self.stack.pop()
-        if len(self.stack) > 0:
-            return self.stack.pop()
+    def __init__(self, max_bytes: int, spill: bool = True):
+        """
+        Initialize the History class
+        :param max_bytes: memory the transactions in the buffer may use
+        :param spill: move the oldest transactions to a temporary file rather than dropping them
+        """
+        self.records: collections.deque = collections.deque()
+        self.nbytes: int = 0
+        self.max_bytes: int = max_bytes
+        self.spill: bool = spill
+        self.spill_file = None      # Created when the first transaction is spilled
+        # (file offset, [(store, generation, start, length)]) of each spilled transaction, oldest first
+        self.spilled: list = []
+
+    def __len__(self):
+        return len(self.records) + len(self.spilled)
+
+    def record_size(self, transaction) -> int:
+        return sum(len(action.states) + self.RECORD_OVERHEAD for action in transaction.actions)
+
+    def push(self, transaction):
+        """
+        Push a transaction, moving the oldest transactions out of memory if the buffer is over its cap.
+        The newest transaction is always kept in memory.
+        :param transaction: Transaction to push
+        :return: No return value
+        """
+        self.records.append(transaction)
+        self.nbytes += self.record_size(transaction)
+
+        while self.nbytes > self.max_bytes and len(self.records) > 1:
+            oldest = self.records.popleft()
+            self.nbytes -= self.record_size(oldest)
+            if self.spill:
+                self.spill_record(oldest)
+
+    def pop(self):
+        """
+        Pop the newest transaction, reading it back from the temporary file if memory is empty.
+        :return: Transaction or None if the buffer is empty
+        """
+        if len(self.records) > 0:
+            transaction = self.records.pop()
+            self.nbytes -= self.record_size(transaction)
+            return transaction
+        if len(self.spilled) > 0:
+            return self.load_record()
         return None
 
-    def _size(self):
-        return len(self.stack)
+    def clear(self):
+        self.records.clear()
+        self.nbytes = 0
+        self.spilled.clear()
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+    def spill_record(self, transaction):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile()
+        self.spill_file.seek(0, 2)
+        layout = [
+            (action.store, action.generation, action.start, len(action.states)) for action in transaction.actions
+        ]
+        self.spilled.append((self.spill_file.tell(), layout))
+        self.spill_file.writelines(action.states for action in transaction.actions)
+
+    def load_record(self):
+        # The newest spilled transaction is at the end of the file, so the file can be cut back after reading it
+        offset, layout = self.spilled.pop()
+        self.spill_file.seek(offset)
+        transaction = Transaction()
+        for store, generation, start, length in layout:
+            transaction.actions.append(UndoRedoAction(store, start, self.spill_file.read(length), generation))
+        self.spill_file.truncate(offset)
+        return transaction
 
 
 class UndoRedoAction(object):
-    __slots__ = ["obj_copy", "obj_ref",]
+    __slots__ = ["store", "start", "states", "generation"]
 
-    def __init__(self, record_obj):
-        self.obj_copy = record_obj.__dict__.copy()
-        self.obj_ref = record_obj
+    def __init__(self, store, start: int, states: bytes, generation: int = None):
+        """
+        Initialize the UndoRedoAction class
+        :param store: row_store.RowStore the states belong to
+        :param start: first line that was changed
+        :param states: merge states of the changed lines before the change
+        :param generation: generation of the store the change was made to, defaults to its current one
+        """
+        self.store = store
+        self.start: int = start
+        self.states: bytes = states
+        self.generation: int = store.generation if generation is None else generation
+
+    @property
+    def stale(self) -> bool:
+        # The store has been cleared since the change was made
+        return self.generation != self.store.generation
 
     def set_state(self):
         """
-        Set the current state of the row object to what was recorded in the instance variables
+        Swap the recorded states with the current states of the lines, so calling this again reverts it.
         :return: No return value
         """
-        # Copy the copied attribute dictionary over to the object reference        
-        for key in self.obj_ref.__dict__:
-            if self.obj_ref.right_button.isEnabled():
-                self.obj_ref.right_button.setEnabled(False)
-                self.obj_ref.left_button.setEnabled(False)
-            else:
-                self.obj_ref.right_button.setEnabled(True)
-                self.obj_ref.left_button.setEnabled(True)
+        current = self.store.get_states(self.start, self.start + len(self.states))
+        self.store.set_states(self.start, self.states)
+        self.states = current
+
 
-            try:
-                self.obj_ref.__dict__[key] = self.obj_copy[key]
-            except KeyError:
-                print(f"Attribute '{key}' not found!")
-                pass
+class Transaction(object):
+    __slots__ = ["actions"]
+
+    def __init__(self):
+        self.actions: list = []
+
+    @property
+    def stale(self) -> bool:
+        return any(action.stale for action in self.actions)
+
+    def undo(self):
+        # Later changes may overlap earlier ones, so they are reverted first
+        for action in reversed(self.actions):
+            action.set_state()
+
+    def redo(self):
+        for action in self.actions:
+            action.set_state()
+
+    def spans(self, store) -> list:
+        """
+        Gets the lines of a store touched by the transaction.
+        :param store: row_store.RowStore to get the lines of
+        :return: list of (first line, line after the last line) tuples
+        """
+        return [
+            (action.start, action.start + len(action.states)) for action in self.actions if action.store is store
+        ]
 
 
 class UndoRedo(object):
-    _instance = None    # Holds the single instance of this class
-    MAX_BUF_SIZE = 400  # Hard upper limit for maximum undo/redo buffer size
+    _instance = None                   # Holds the single instance of this class
+    MAX_BUF_SIZE = 256 * 1024 * 1024   # Hard upper limit for the memory used by each undo/redo buffer, in bytes
 
-    def __init__(self, buf_size: int):
+    def __init__(self, buf_size: int, spill: bool = True):
         if UndoRedo._instance is not None:
             raise Exception("Only a single instance of UndoRedo is allowed!")
         else:
-            self._redo_buf = Stack(buf_size)
-            self._undo_buf = Stack(buf_size)
-            self.undo_buf_size = 0
-            self._buf_size = buf_size            
+            self._redo_buf = History(buf_size, spill)
+            self._undo_buf = History(buf_size, spill)
+            self._transaction = None
+            self._transaction_depth = 0
+            self._buf_size = 0
+            self.buf_size = buf_size
             UndoRedo._instance = self
 
     @staticmethod
-    def get_instance(buf_size=200):
+    def get_instance(buf_size=16 * 1024 * 1024, spill=True):
         if UndoRedo._instance is None:
-            UndoRedo(buf_size)
+            UndoRedo(buf_size, spill)
         return UndoRedo._instance
 
     @property
@@ -131,36 +222,102 @@ class UndoRedo(object):
             self._buf_size = self.MAX_BUF_SIZE
         else:
             self._buf_size = value
+        self._undo_buf.max_bytes = self._buf_size
+        self._redo_buf.max_bytes = self._buf_size
+
+    def begin(self):
+        """
+        Start grouping changes into a single transaction. Calls can be nested, the transaction
+        ends with the outermost commit().
+        :return: No return value
+        """
+        if self._transaction_depth == 0:
+            self._transaction = Transaction()
+        self._transaction_depth += 1
+
+    def commit(self):
+        """
+        End a transaction started with begin() and push it onto the undo stack if anything changed.
+        :return: No return value
+        """
+        if self._transaction_depth == 0:
+            return
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            transaction = self._transaction
+            self._transaction = None
+            transaction.actions = [action for action in transaction.actions if not action.stale]
+            if len(transaction.actions) > 0:
+                self.push_transaction(transaction)
+
+    def push_transaction(self, transaction: Transaction):
+        # A new change makes whatever was undone before it unreachable
+        self._redo_buf.clear()
+        self._undo_buf.push(transaction)
 
-    def record_action(self, record_obj):
+    def record_action(self, store, start: int, states: bytes):
         """
-        Record the state of a class/object and push onto stack.
+        Record the states lines had before a change, as part of the current transaction or as a
+        transaction of its own.
+        :param store: row_store.RowStore the lines belong to
+        :param start: first line that was changed
+        :param states: merge states of the changed lines before the change
         """
-        self._undo_buf.stack_push(UndoRedoAction(record_obj))
+        action = UndoRedoAction(store, start, states)
+        if self._transaction is not None:
+            self._transaction.actions.append(action)
+        else:
+            transaction = Transaction()
+            transaction.actions.append(action)
+            self.push_transaction(transaction)
 
-    def undo(self) -> bool:
+    def clear(self):
         """
-        Pops an UndoRedoAction from the stack and sets the state of its referenced
-        object.
+        Drop the undo and redo history, and any of it that was spilled to the temporary files. Used when new
+        files are loaded, as the records point at lines of the files that were shown before.
+        :return: No return value
         """
-        undo_obj: UndoRedoAction = self._undo_buf.stack_pop()  # Get the state we want to set
-        
-        # Check if object is None, then push the recorded current state.
-        if undo_obj is not None:
-            self._redo_buf.stack_push(UndoRedoAction(undo_obj.obj_ref))        
-            # Restore the state to what was popped
-            undo_obj.set_state()
-            return True
-        return False
+        self._undo_buf.clear()
+        self._redo_buf.clear()
+        if self._transaction is not None:
+            # Calls to begin() and commit() still pair up, but nothing recorded before the clear is kept
+            self._transaction = Transaction()
 
-    def redo(self) -> bool:
-        redo_obj: UndoRedoAction = self._redo_buf.stack_pop()
+    @staticmethod
+    def pop_current(history: History):
+        """
+        Pops the newest transaction whose stores haven't been cleared since it was recorded. Older ones
+        are dropped.
+        :param history: History to pop from
+        :return: Transaction or None
+        """
+        transaction = history.pop()
+        while transaction is not None and transaction.stale:
+            transaction = history.pop()
+        return transaction
 
-        # Check if object is None, then push the recorded current state.
-        if redo_obj is not None:
-            self._undo_buf.stack_push(UndoRedoAction(redo_obj.obj_ref))
+    def undo(self):
+        """
+        Pops a Transaction from the stack and restores the states of the lines it changed.
+        :return: the Transaction that was undone or None if there is nothing to undo
+        """
+        transaction: Transaction = self.pop_current(self._undo_buf)
+
+        # Check if object is None, then restore the recorded states and keep the current ones for redo.
+        if transaction is not None:
+            transaction.undo()
+            self._redo_buf.push(transaction)
+        return transaction
+
+    def redo(self):
+        """
+        Pops a Transaction from the redo stack and applies its changes again.
+        :return: the Transaction that was redone or None if there is nothing to redo
+        """
+        transaction: Transaction = self.pop_current(self._redo_buf)
 
-            # Restore the state to what was popped
-            redo_obj.set_state()
-            return True
-        return False
+        # Check if object is None, then apply the changes again and keep the current states for undo.
+        if transaction is not None:
+            transaction.redo()
+            self._undo_buf.push(transaction)
+        return transaction